@@ -0,0 +1,171 @@
+import asyncio
+import csv
+import io
+import logging
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import datetime
+
+from aiogram.types import FSInputFile
+
+from database import session, User, UploadedFile
+
+# Количество одновременных скачиваний с Яндекс.Диска при выгрузке
+EXPORT_CONCURRENCY = int(os.getenv("EXPORT_CONCURRENCY", "4"))
+
+# Файлы до этого размера скачиваются в память, более крупные — во временный файл
+EXPORT_SPOOL_SIZE = 8 * 1024 * 1024
+
+# Ограничение Bot API на размер отправляемого документа (у локального сервера Bot API — 2000 МБ)
+TELEGRAM_UPLOAD_LIMIT = 50 * 1024 * 1024
+LOCAL_API_UPLOAD_LIMIT = 2000 * 1024 * 1024
+
+# Директория для временных файлов (архивы на Яндекс.Диске сохраняются в папку _exports основного аккаунта)
+EXPORT_TMP_DIR = os.getenv("TMP_DIR", "tmp")
+
+# Форматы, которые уже сжаты, — повторно их не сжимаем
+COMPRESSED_EXTENSIONS = {".docx", ".pptx", ".xlsx", ".pdf", ".zip", ".rar", ".7z", ".jpg", ".jpeg", ".png", ".odt", ".odp"}
+
+FILE_TYPE_NAMES = {"essay": "Эссе", "presentation": "Презентация"}
+
+MANIFEST_COLUMNS = ["id", "full_name", "telegram_id", "file_type", "file_name", "file_path", "created_at", "archive_path", "status"]
+
+
+# Функция для получения списка файлов для выгрузки одним запросом
+def get_export_rows(file_type=None, date_from=None, date_to=None):
+    query = session.query(
+        UploadedFile.id,
+        UploadedFile.file_name,
+        UploadedFile.file_type,
+        UploadedFile.file_path,
+        UploadedFile.storage_shard,
+        UploadedFile.created_at,
+        User.full_name,
+        User.telegram_id,
+    ).join(User, User.id == UploadedFile.user_id)
+
+    if file_type:
+        query = query.filter(UploadedFile.file_type == file_type)
+    if date_from:
+        query = query.filter(UploadedFile.created_at >= date_from)
+    if date_to:
+        query = query.filter(UploadedFile.created_at < date_to)
+
+    return query.order_by(UploadedFile.file_type, User.full_name, UploadedFile.id).all()
+
+
+# Путь файла внутри архива: папка по типу работы, затем по студенту
+def get_archive_path(row):
+    type_name = FILE_TYPE_NAMES.get(row.file_type, row.file_type)
+    return f"{type_name}/{row.full_name}/{row.file_name}"
+
+
+# Функция для формирования CSV-манифеста
+def build_manifest(rows, statuses):
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(MANIFEST_COLUMNS)
+    for row in rows:
+        writer.writerow([
+            row.id,
+            row.full_name,
+            row.telegram_id,
+            row.file_type,
+            row.file_name,
+            row.file_path,
+            row.created_at.strftime("%Y-%m-%d %H:%M:%S") if row.created_at else "",
+            get_archive_path(row),
+            statuses.get(row.id, "skipped"),
+        ])
+    # BOM нужен, чтобы Excel корректно открыл кириллицу
+    return ("\ufeff" + output.getvalue()).encode("utf-8")
+
+
+# Запись одного файла в архив потоком, без чтения целиком в память
+def _write_archive_entry(archive, arcname, source):
+    _, ext = os.path.splitext(arcname)
+    entry = zipfile.ZipInfo(arcname, date_time=datetime.now().timetuple()[:6])
+    entry.compress_type = zipfile.ZIP_STORED if ext.lower() in COMPRESSED_EXTENSIONS else zipfile.ZIP_DEFLATED
+    with archive.open(entry, "w", force_zip64=True) as target:
+        shutil.copyfileobj(source, target, 1024 * 1024)
+
+
+# Функция для сборки архива: файлы скачиваются параллельно с ограничением пула
+async def build_export_archive(storage, rows, archive_path):
+    semaphore = asyncio.Semaphore(EXPORT_CONCURRENCY)
+    write_lock = asyncio.Lock()
+    statuses = {}
+    used_names = set()
+
+    with zipfile.ZipFile(archive_path, "w", allowZip64=True) as archive:
+        async def export_file(row):
+            async with semaphore:
+                buffer = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE, dir=EXPORT_TMP_DIR)
+                try:
+                    await storage.get(row.storage_shard).call("download", row.file_path, buffer)
+                    buffer.seek(0)
+                    async with write_lock:
+                        arcname = get_archive_path(row)
+                        if arcname in used_names:
+                            base, ext = os.path.splitext(arcname)
+                            arcname = f"{base}_{row.id}{ext}"
+                        used_names.add(arcname)
+                        await asyncio.to_thread(_write_archive_entry, archive, arcname, buffer)
+                    statuses[row.id] = "ok"
+                except Exception as e:
+                    logging.warning("Не удалось добавить файл %s в архив: %s", row.file_path, e)
+                    statuses[row.id] = f"error: {e}"
+                finally:
+                    buffer.close()
+
+        await asyncio.gather(*(export_file(row) for row in rows))
+        archive.writestr("manifest.csv", build_manifest(rows, statuses))
+
+    return statuses
+
+
+# Функция для выгрузки работ: собирает архив и отправляет его либо загружает на Яндекс.Диск
+async def export_submissions(bot, storage, chat_id, file_type=None, date_from=None, date_to=None):
+    start_time = datetime.now()
+    rows = get_export_rows(file_type, date_from, date_to)
+    if not rows:
+        await bot.send_message(chat_id, "Нет файлов, подходящих под условия выгрузки.")
+        return
+
+    await bot.send_message(chat_id, f"Начата выгрузка {len(rows)} файлов. Это может занять некоторое время.")
+
+    os.makedirs(EXPORT_TMP_DIR, exist_ok=True)
+    archive_name = f"export_{file_type or 'all'}_{start_time.strftime('%Y-%m-%d_%H-%M-%S')}.zip"
+    archive_path = os.path.join(EXPORT_TMP_DIR, archive_name)
+
+    try:
+        statuses = await build_export_archive(storage, rows, archive_path)
+        failed = sum(1 for status in statuses.values() if status != "ok")
+        summary = f"Выгружено файлов: {len(rows) - failed} из {len(rows)}"
+        if failed:
+            summary += f"\nНе удалось скачать: {failed} (подробности в manifest.csv)"
+
+        archive_size = os.path.getsize(archive_path)
+        upload_limit = LOCAL_API_UPLOAD_LIMIT if bot.session.api.is_local else TELEGRAM_UPLOAD_LIMIT
+        if archive_size <= upload_limit:
+            await bot.send_document(chat_id, FSInputFile(archive_path, filename=archive_name), caption=summary)
+        else:
+            shard = storage.primary
+            yadisk_path = f"{shard.exports_dir}/{archive_name}"
+            if not await shard.call("exists", shard.exports_dir):
+                await shard.call("mkdir", shard.exports_dir)
+            await shard.call("upload", archive_path, yadisk_path, overwrite=True)
+            link = await shard.call("get_download_link", yadisk_path)
+            await bot.send_message(
+                chat_id,
+                f"{summary}\n\nАрхив слишком большой для Telegram ({archive_size // (1024 * 1024)} МБ) "
+                f"и сохранен на Яндекс.Диске: {yadisk_path}\nСсылка для скачивания: {link}"
+            )
+
+        execution_time = (datetime.now() - start_time).total_seconds()
+        logging.info("Выгрузка %s завершена за %s секунд, размер: %s байт", archive_name, execution_time, archive_size)
+    finally:
+        if os.path.exists(archive_path):
+            os.remove(archive_path)
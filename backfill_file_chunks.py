@@ -0,0 +1,65 @@
+import os
+import sys
+import tempfile
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database import SessionLocal, UploadedFile, FileChunk
+from storage import StorageRouter
+from telegram_files import scan_file
+
+# Построение отпечатков по фрагментам для файлов, загруженных до появления поиска копий по фрагментам:
+# файлы по одному скачиваются с Яндекс.Диска, отпечаток сохраняется вместе с числом фрагментов.
+# После этого новые загрузки сравниваются и с этими файлами. Повторный запуск продолжает с файлов без отпечатка.
+# Запуск: python backfill_file_chunks.py [тип файлов: essay или presentation]
+
+FILE_TYPE = sys.argv[1] if len(sys.argv) > 1 else None
+BATCH_SIZE = 100
+
+
+def main():
+    storage = StorageRouter.from_env(index_max_age=0)
+    db = SessionLocal()
+    done = 0
+    failed = 0
+    last_id = 0
+    try:
+        while True:
+            query = db.query(UploadedFile.id, UploadedFile.file_path, UploadedFile.storage_shard).filter(
+                UploadedFile.chunk_count.is_(None),
+                UploadedFile.id > last_id
+            )
+            if FILE_TYPE:
+                query = query.filter(UploadedFile.file_type == FILE_TYPE)
+            files = query.order_by(UploadedFile.id).limit(BATCH_SIZE).all()
+            if not files:
+                break
+
+            for file in files:
+                last_id = file.id
+                # Файл скачивается во временный файл и читается блоками, чтобы не держать его в памяти
+                with tempfile.TemporaryFile() as buffer:
+                    try:
+                        storage.get(file.storage_shard).client.download(file.file_path, buffer)
+                    except Exception as e:
+                        print(f"Не удалось скачать {file.file_path}: {e}")
+                        failed += 1
+                        continue
+                    buffer.seek(0)
+                    _, _, chunk_hashes = scan_file(buffer)
+                db.query(FileChunk).filter(FileChunk.file_id == file.id).delete(synchronize_session=False)
+                db.bulk_insert_mappings(FileChunk, [{"file_id": file.id, "chunk_hash": chunk_hash} for chunk_hash in chunk_hashes])
+                db.query(UploadedFile).filter(UploadedFile.id == file.id).update(
+                    {UploadedFile.chunk_count: len(chunk_hashes)}, synchronize_session=False
+                )
+                db.commit()
+                done += 1
+            print(f"Обработано файлов: {done + failed}")
+        print(f"Построено отпечатков: {done}, не удалось скачать: {failed}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import os
+import sys
+import time
+import zlib
+
+from sqlalchemy import text
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import content_codec
+from database import SessionLocal, load_compression_dictionaries
+
+# Замер сжатия содержимого файлов на данных из БД:
+# размер таблицы и столбца, степень сжатия и скорость распаковки для каждого способа,
+# время чтения всех эссе так, как их читает проверка схожести.
+# Запуск: python bench_content_codec.py
+
+MB = 1024 * 1024
+
+
+def measure(name, texts, compress, decompress):
+    raw_size = sum(len(t) for t in texts)
+    start_time = time.perf_counter()
+    packed = [compress(t) for t in texts]
+    compress_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    for value in packed:
+        decompress(value)
+    decompress_time = time.perf_counter() - start_time
+
+    packed_size = sum(len(p) for p in packed)
+    print(
+        f"{name:<14} {packed_size / MB:9.2f} МБ  сжатие x{raw_size / max(packed_size, 1):5.2f}  "
+        f"упаковка {raw_size / MB / max(compress_time, 1e-9):8.1f} МБ/с  "
+        f"распаковка {raw_size / MB / max(decompress_time, 1e-9):8.1f} МБ/с"
+    )
+
+
+def main():
+    db = SessionLocal()
+    try:
+        load_compression_dictionaries(db)
+
+        sizes = db.execute(text("""
+            SELECT pg_total_relation_size('uploaded_files') AS total,
+                   coalesce(sum(octet_length(file_content)), 0) AS stored,
+                   count(*) AS files
+            FROM uploaded_files
+        """)).one()
+
+        start_time = time.perf_counter()
+        rows = db.execute(text("SELECT file_content FROM uploaded_files WHERE file_type = 'essay' AND file_content IS NOT NULL")).all()
+        fetch_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        texts = [content_codec.decode(row.file_content) for row in rows]
+        decode_time = time.perf_counter() - start_time
+    finally:
+        db.close()
+
+    data = [t.encode("utf-8") for t in texts]
+    raw_size = sum(len(d) for d in data)
+    print(f"Записей: {sizes.files}, эссе: {len(data)}")
+    print(f"Размер таблицы uploaded_files с TOAST и индексами: {sizes.total / MB:.2f} МБ")
+    print(f"Столбец file_content: хранится {sizes.stored / MB:.2f} МБ, текст эссе {raw_size / MB:.2f} МБ")
+    print(
+        f"Чтение эссе: запрос {fetch_time:.3f} с, распаковка {decode_time:.3f} с "
+        f"({raw_size / MB / max(decode_time, 1e-9):.1f} МБ/с)"
+    )
+    if not data:
+        return
+
+    print()
+    measure("без сжатия", data, lambda d: d, lambda p: p)
+    measure("zlib", data, lambda d: zlib.compress(d, content_codec.ZLIB_LEVEL), zlib.decompress)
+    if content_codec.zstandard is None:
+        print("Пакет zstandard не установлен, zstd не измеряется")
+        return
+
+    zstandard = content_codec.zstandard
+    measure(
+        "zstd",
+        data,
+        zstandard.ZstdCompressor(level=content_codec.ZSTD_LEVEL).compress,
+        zstandard.ZstdDecompressor().decompress,
+    )
+
+    # Словарь, используемый ботом; если его нет — обучаем временный на половине эссе
+    dict_id = content_codec.current_dictionary_id()
+    if dict_id is not None:
+        dictionary = content_codec._get_dictionary(dict_id)
+        name = "zstd+словарь"
+    elif len(data) >= 20:
+        dictionary = zstandard.train_dictionary(112 * 1024, data[::2], level=content_codec.ZSTD_LEVEL)
+        data = data[1::2]
+        name = "zstd+обучение"
+    else:
+        print("Недостаточно эссе для обучения словаря")
+        return
+    measure(
+        name,
+        data,
+        zstandard.ZstdCompressor(level=content_codec.ZSTD_LEVEL, dict_data=dictionary).compress,
+        zstandard.ZstdDecompressor(dict_data=dictionary).decompress,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from datetime import datetime
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from log_setup import ContextQueueHandler, JsonFormatter
+
+# Замер накладных расходов журнала на одну загрузку файла: около 30 записей, как в process_upload.
+# "до" — f-строки с datetime.now() и синхронный вывод через basicConfig,
+# "после" — ленивое форматирование и очередь с выводом JSON в отдельном потоке.
+# Время считается в вызывающем потоке (то есть в цикле событий бота). Вывод идет в /dev/null
+# и в "медленный" поток, который имитирует stderr контейнера, когда сборщик логов не успевает читать.
+# Запуск: python bench_logging.py [число загрузок]
+
+UPLOADS = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+USER = "Иванов Иван Иванович"
+PATH = "/PKS12_SocialStudy/Иванов Иван Иванович/Иванов_ПКС12_Эссе.docx"
+
+
+# Поток вывода, каждая запись в который занимает SLOW_WRITE секунд (ожидание ввода-вывода)
+SLOW_WRITE = 0.0002
+
+
+class SlowSink:
+    def write(self, data):
+        time.sleep(SLOW_WRITE)
+
+    def flush(self):
+        pass
+
+
+def upload_before(log):
+    for step in range(10):
+        log.info(f"[{datetime.now()}] Пользователь: {USER} (ID: 123456789), выбранный тип файла: essay")
+        log.info(f"[{datetime.now()}] Начало загрузки файла на Яндекс.Диск: {PATH}, замена: {False}")
+        log.info(f"[{datetime.now()}] Файл успешно скачан во временное хранилище: 123456789:{step}")
+
+
+def upload_after(log):
+    for step in range(10):
+        log.info("Пользователь: %s (ID: %s), выбранный тип файла: %s", USER, 123456789, "essay")
+        log.info("Начало загрузки файла на Яндекс.Диск: %s, замена: %s", PATH, False)
+        log.info("Файл успешно скачан во временное хранилище: %s:%s", 123456789, step)
+
+
+def measure(name, upload, handler, level, listener=None):
+    log = logging.getLogger(f"bench.{name}")
+    log.propagate = False
+    log.handlers = [handler]
+    log.setLevel(level)
+
+    start_time = time.perf_counter()
+    for _ in range(UPLOADS):
+        upload(log)
+    elapsed = time.perf_counter() - start_time
+
+    drain = 0.0
+    if listener:
+        drain_start = time.perf_counter()
+        listener.stop()
+        drain = time.perf_counter() - drain_start
+    line = f"{name:<28} {logging.getLevelName(level):<8} {elapsed / UPLOADS * 1e6:9.1f} мкс на загрузку"
+    if listener:
+        line += f" (вывод в фоновом потоке: {drain / UPLOADS * 1e6:.1f} мкс на загрузку)"
+    print(line)
+
+
+def run(sink, levels):
+    for level in levels:
+        handler = logging.StreamHandler(sink)
+        handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+        measure("до: f-строки, синхронно", upload_before, handler, level)
+
+        log_queue = queue.SimpleQueue()
+        stream_handler = logging.StreamHandler(sink)
+        stream_handler.setFormatter(JsonFormatter())
+        listener = logging.handlers.QueueListener(log_queue, stream_handler)
+        listener.start()
+        measure("после: лениво, очередь, JSON", upload_after, ContextQueueHandler(log_queue), level, listener)
+
+
+def main():
+    global UPLOADS
+    print(f"Загрузок: {UPLOADS}, записей на загрузку: 30")
+    print("\nВывод в /dev/null:")
+    with open(os.devnull, "w") as sink:
+        run(sink, (logging.INFO, logging.WARNING))
+
+    UPLOADS = max(UPLOADS // 20, 1)
+    print(f"\nМедленный вывод ({SLOW_WRITE * 1e6:.0f} мкс на запись), загрузок: {UPLOADS}:")
+    run(SlowSink(), (logging.INFO,))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,16 @@
 import asyncio
 import logging
 import os
-from datetime import datetime
-import difflib
+import signal
+import time
+from datetime import datetime, timedelta
 import requests
 import json
 import unicodedata
+from pathlib import Path
 
 from aiogram import Bot, Dispatcher, Router, F
-from aiogram.types import Message, FSInputFile, CallbackQuery
+from aiogram.types import Message, FSInputFile, BufferedInputFile, CallbackQuery
 from aiogram import exceptions as aiogram_exceptions
 from urllib.parse import quote
 from aiogram.filters import CommandStart, Command
@@ -16,33 +18,131 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer, SimpleFilesPathWrapper
 from dotenv import load_dotenv
 import yadisk
 
-from database import session, User, FileTemplate, LogSettings, UploadedFile, init_db
+from sqlalchemy import case, func, or_
+from sqlalchemy.orm import aliased
+
+from database import session, SessionLocal, User, FileTemplate, LogSettings, UploadedFile, SimilarityEdge, FileChunk, PendingJob, init_db, load_compression_dictionaries
+from archive import export_submissions, FILE_TYPE_NAMES
+from throttling import UploadThrottlingMiddleware, FairScheduler
+from locks import create_lock_backend, CallbackGuardMiddleware
+from spool import SpoolManager, SpoolQuotaExceeded
+from reconcile import reconcile_all, run_reconciliation
+from health import HealthState, start_health_server
+from collector import DocumentCollector
+from lifecycle import LifecycleManager, LifecycleMiddleware
+from log_setup import setup_logging, CorrelationIdMiddleware
+from storage import StorageRouter
+from workers import WorkerPool, PollingIntake, UpdateOffsetMiddleware, partition_for_user, start_webhook_server, feed_updates, confirm_updates
+from similarity_report import build_similarity_report, DEFAULT_THRESHOLD
+from similarity_search import find_similar, THRESHOLD as SIMILARITY_THRESHOLD
+from telegram_files import fetch_file, scan_file, read_text_file
+from stats import build_stats_report, run_stats_refresh
 
 # Загрузка переменных окружения
 load_dotenv()
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
+# Настройка логирования: JSON в stderr через очередь и отдельный поток
+setup_logging()
+
+# Сервер Bot API: по умолчанию api.telegram.org, TELEGRAM_API_URL — собственный сервер telegram-bot-api.
+# В режиме --local (TELEGRAM_API_LOCAL=1) нет ограничения 20 МБ на скачивание файлов, а сами файлы
+# читаются с общего тома: TELEGRAM_API_SERVER_DIR — рабочая директория сервера, TELEGRAM_API_FILES_DIR —
+# где этот том смонтирован у бота
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+if TELEGRAM_API_URL:
+    telegram_api_dir = os.getenv("TELEGRAM_API_SERVER_DIR", "/var/lib/telegram-bot-api")
+    telegram_api = TelegramAPIServer.from_base(
+        TELEGRAM_API_URL,
+        is_local=os.getenv("TELEGRAM_API_LOCAL", "1") == "1",
+        wrap_local_file=SimpleFilesPathWrapper(
+            Path(telegram_api_dir), Path(os.getenv("TELEGRAM_API_FILES_DIR", telegram_api_dir))
+        )
+    )
+    bot_session = AiohttpSession(api=telegram_api)
+else:
+    bot_session = None
 
 # Инициализация бота и диспетчера
-bot = Bot(token=os.getenv("BOT_TOKEN"))
-dp = Dispatcher(storage=MemoryStorage())
+bot = Bot(token=os.getenv("BOT_TOKEN"), session=bot_session)
+
+# При заданном REDIS_URL состояния и блокировки общие для всех реплик бота
+REDIS_URL = os.getenv("REDIS_URL")
+if REDIS_URL:
+    from aiogram.fsm.storage.redis import RedisStorage
+    storage = RedisStorage.from_url(REDIS_URL)
+else:
+    storage = MemoryStorage()
+
+dp = Dispatcher(storage=storage)
 router = Router()
 dp.include_router(router)
 
-# Инициализация Яндекс.Диска
-try:
-    yadisk_client = yadisk.YaDisk(token=os.getenv("YADISK_TOKEN"))
-    # Проверяем токен
-    if not yadisk_client.check_token():
-        raise Exception("Invalid Yandex.Disk token")
-    logging.info("Successfully connected to Yandex.Disk")
-except Exception as e:
-    logging.error(f"Failed to initialize Yandex.Disk client: {e}")
-    raise
+# Корректная остановка: при SIGTERM новые обновления не принимаются, выполняющиеся загрузки
+# и очередь лог-сообщений дожидаются завершения не дольше SHUTDOWN_TIMEOUT секунд,
+# а незавершенная работа сохраняется в БД и продолжается после перезапуска
+lifecycle = LifecycleManager(drain_timeout=float(os.getenv("SHUTDOWN_TIMEOUT", "25")))
+dp.update.outer_middleware(CorrelationIdMiddleware())
+dp.update.outer_middleware(LifecycleMiddleware(lifecycle))
+
+# Защита от повторных нажатий и параллельной обработки файлов одного пользователя
+lock_backend = create_lock_backend(REDIS_URL)
+router.callback_query.middleware(CallbackGuardMiddleware(lock_backend, prefixes=("file_type:", "replace:")))
+
+# Ограничение частоты загрузок для каждого пользователя
+router.message.middleware(UploadThrottlingMiddleware(
+    rate_per_minute=float(os.getenv("UPLOAD_RATE_PER_MINUTE", "5")),
+    burst=int(os.getenv("UPLOAD_BURST", "3"))
+))
+
+# Общий планировщик скачиваний из Telegram и загрузок на Яндекс.Диск
+transfer_scheduler = FairScheduler(
+    max_concurrent=int(os.getenv("TRANSFER_CONCURRENCY", "4")),
+    rate=float(os.getenv("TRANSFER_RATE_PER_SECOND", "5")),
+    burst=int(os.getenv("TRANSFER_BURST", "5"))
+)
+
+# Временные файлы: небольшие хранятся в памяти, крупные — в TMP_DIR (tmpfs в контейнере)
+spool = SpoolManager(
+    directory=os.getenv("TMP_DIR", "tmp"),
+    memory_limit=int(os.getenv("SPOOL_MEMORY_LIMIT", str(5 * 1024 * 1024))),
+    quota=int(os.getenv("SPOOL_QUOTA", str(500 * 1024 * 1024))),
+    default_ttl=int(os.getenv("SPOOL_TTL", "3600"))
+)
+
+# Периодическая сверка Яндекс.Диска с БД; у каждого аккаунта свой локальный индекс файлов
+RECONCILE_INTERVAL = int(os.getenv("RECONCILE_INTERVAL", "600"))
+
+# Аккаунты Яндекс.Диска, между которыми распределяются пользователи
+# (токены проверяются при запуске в фоне, см. check_yadisk_token)
+storage_router = StorageRouter.from_env(index_max_age=RECONCILE_INTERVAL * 2)
+YADISK_QUOTA_INTERVAL = int(os.getenv("YADISK_QUOTA_INTERVAL", "600"))
+
+# Состояние бота для проверок живости и готовности
+health = HealthState()
+
+# Ограничения времени на проверку зависимостей при запуске (секунды)
+DB_STARTUP_TIMEOUT = float(os.getenv("DB_STARTUP_TIMEOUT", "60"))
+YADISK_CHECK_TIMEOUT = float(os.getenv("YADISK_CHECK_TIMEOUT", "15"))
+
+# Время на проверку схожести эссе при загрузке (секунды)
+SIMILARITY_TIME_BUDGET = float(os.getenv("SIMILARITY_TIME_BUDGET", "5"))
+
+# Текст для сравнения сохраняется только у эссе не больше ESSAY_TEXT_LIMIT байт; у более крупных
+# и двоичных файлов (презентаций, docx, pdf) содержимое не сохраняется — их сравнивает отпечаток по фрагментам
+ESSAY_TEXT_LIMIT = int(os.getenv("ESSAY_TEXT_LIMIT", str(1024 * 1024)))
+
+# Несколько процессов-обработчиков: обновления получает один процесс-супервизор (long polling или webhook)
+# и распределяет их по процессам по id пользователя. BOT_WORKERS=1 без WEBHOOK_URL — один процесс, как раньше
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8081"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
 
 # API для проверки на антиплагиат
 TEXT_RU_API_URL = "http://api.text.ru/post"
@@ -63,9 +163,9 @@ async def check_plagiarism(text):
         result = response.json()
         
         if 'text_uid' not in result:
-            logging.error(f"Ошибка при отправке текста на проверку: {result.get('error_desc', 'Неизвестная ошибка')}")
-            logging.error(f"Полный ответ API: {result}")  # Log the full API response
-            logging.error(f"Sanitized text: {sanitized_text}")  # Log the sanitized text
+            logging.error("Ошибка при отправке текста на проверку: %s", result.get('error_desc', 'Неизвестная ошибка'))
+            logging.error("Полный ответ API: %s", result)  # Log the full API response
+            logging.error("Sanitized text: %s", sanitized_text)  # Log the sanitized text
             return None, []
             
         # Получаем результаты проверки
@@ -77,8 +177,8 @@ async def check_plagiarism(text):
         check_result = check_response.json()
         
         if 'error_code' in check_result:
-            logging.error(f"Ошибка при получении результатов проверки: {check_result.get('error_desc', 'Неизвестная ошибка')}")
-            logging.error(f"Полный ответ API: {check_result}")  # Log the full API response
+            logging.error("Ошибка при получении результатов проверки: %s", check_result.get('error_desc', 'Неизвестная ошибка'))
+            logging.error("Полный ответ API: %s", check_result)  # Log the full API response
             return None, []
             
         # Парсим результаты
@@ -93,46 +193,167 @@ async def check_plagiarism(text):
             
         return 100 - unique_percent, sources
     except Exception as e:
-        logging.error(f"Ошибка при проверке на антиплагиат: {e}")
+        logging.error("Ошибка при проверке на антиплагиат: %s", e)
         return None, []
 
-# Функция для сравнения текстов и получения процента схожести
-def get_similarity_percentage(text1, text2):
-    matcher = difflib.SequenceMatcher(None, text1, text2)
-    return round(matcher.ratio() * 100, 2)
-
 # Функция для проверки схожести с другими файлами
-async def check_similarity(user_id, file_content, file_type):
+# Поиск выполняется в отдельном потоке и ограничен по времени: к сроку возвращаются лучшие найденные
+# совпадения и статистика — какая часть файлов успела пройти проверку
+async def check_similarity(user_id, file_content, file_type, time_budget=SIMILARITY_TIME_BUDGET):
+    deadline = time.monotonic() + time_budget
     try:
-        similar_files = []
-        existing_files = session.query(UploadedFile).filter(UploadedFile.user_id != user_id, UploadedFile.file_type == file_type).all()
-        
-        # Устанавливаем тайм-аут в 5 секунд
-        try:
-            similar_files = await asyncio.wait_for(
-                _check_similarity_internal(existing_files, file_content),
-                timeout=5.0
+        existing_files = session.query(
+            UploadedFile.id,
+            UploadedFile.file_name,
+            UploadedFile.user_id,
+            UploadedFile.file_content
+        ).filter(
+            UploadedFile.user_id != user_id,
+            UploadedFile.file_type == file_type,
+            UploadedFile.file_content.isnot(None)
+        ).all()
+
+        similar_files, stats = await asyncio.to_thread(find_similar, file_content, existing_files, deadline)
+        if stats["complete"]:
+            logging.info(
+                "Проверка схожести: проверено %s файлов (отсеяно по длине: %s) за %s секунд",
+                stats["total"], stats["pruned_length"], stats["seconds"]
             )
-        except asyncio.TimeoutError:
-            logging.warning('Проверка схожести файлов превысила лимит времени')
-            return []
-        
-        return similar_files
+        else:
+            logging.warning(
+                "Проверка схожести прервана по времени: проверено %s%% файлов, не проверено %s из %s",
+                stats["coverage"], stats["unchecked"], stats["total"]
+            )
+        return similar_files, stats
     except Exception as e:
-        logging.error(f'Ошибка при проверке схожести: {e}')
-        return []
-
-async def _check_similarity_internal(existing_files, file_content):
-    similar_files = []
-    for file in existing_files:
-        similarity = get_similarity_percentage(file_content, file.file_content)
-        if similarity > 30:  # Порог схожести в 30%
-            similar_files.append({
-                'file_name': file.file_name,
+        logging.error("Ошибка при проверке схожести: %s", e)
+        return None, None
+
+# Функция для поиска файлов с общими фрагментами: один запрос по индексу chunk_hash вместо попарного сравнения
+# Схожесть — доля общих фрагментов в объединении отпечатков (коэффициент Жаккара) в процентах
+def find_chunk_matches(user_id, file_type, chunk_hashes):
+    try:
+        shared = session.query(
+            FileChunk.file_id,
+            func.count().label("shared")
+        ).filter(FileChunk.chunk_hash.in_(chunk_hashes)).group_by(FileChunk.file_id).subquery()
+        rows = session.query(
+            UploadedFile.id,
+            UploadedFile.file_name,
+            UploadedFile.user_id,
+            UploadedFile.chunk_count,
+            shared.c.shared
+        ).join(shared, shared.c.file_id == UploadedFile.id).filter(
+            UploadedFile.user_id != user_id,
+            UploadedFile.file_type == file_type
+        ).all()
+    except Exception as e:
+        session.rollback()
+        logging.error("Ошибка при поиске файлов с общими фрагментами: %s", e)
+        return None
+    
+    matches = []
+    for row in rows:
+        union = len(chunk_hashes) + (row.chunk_count or row.shared) - row.shared
+        similarity = round(row.shared / union * 100, 2)
+        if similarity > SIMILARITY_THRESHOLD:
+            matches.append({
+                'file_id': row.id,
+                'file_name': row.file_name,
                 'similarity': similarity,
-                'user_id': file.user_id
+                'user_id': row.user_id
             })
-    return similar_files
+    return matches
+
+# Объединение результатов проверок схожести: для каждого файла сохраняется наибольшая схожесть
+def merge_similar_files(*results):
+    merged = {}
+    for result in results:
+        for file in result:
+            if file['file_id'] not in merged or file['similarity'] > merged[file['file_id']]['similarity']:
+                merged[file['file_id']] = file
+    return sorted(merged.values(), key=lambda file: file['similarity'], reverse=True)
+
+# Функция для сохранения отпечатка файла (прежний отпечаток при замене удаляется)
+def save_file_chunks(file_id, chunk_hashes):
+    try:
+        session.query(FileChunk).filter(FileChunk.file_id == file_id).delete(synchronize_session=False)
+        session.bulk_insert_mappings(FileChunk, [{"file_id": file_id, "chunk_hash": chunk_hash} for chunk_hash in chunk_hashes])
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logging.error("Ошибка при сохранении отпечатка файла: %s", e)
+
+# Функция для сохранения результатов проверки схожести
+# Старые пары файла удаляются и заменяются новыми, остальные пары не пересчитываются
+# similar_files=None (проверка не удалась) — старые пары только удаляются: они относятся к прежнему содержимому
+def update_similarity_edges(file_id, similar_files):
+    try:
+        session.query(SimilarityEdge).filter(
+            or_(SimilarityEdge.file_id == file_id, SimilarityEdge.similar_file_id == file_id)
+        ).delete(synchronize_session=False)
+        for file in similar_files or []:
+            session.add(SimilarityEdge(
+                file_id=min(file_id, file['file_id']),
+                similar_file_id=max(file_id, file['file_id']),
+                similarity=file['similarity']
+            ))
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logging.error("Ошибка при сохранении результатов проверки схожести: %s", e)
+
+# Функция для получения похожих файлов с авторами одним запросом
+def get_similar_files(file_id):
+    other_file_id = case(
+        (SimilarityEdge.file_id == file_id, SimilarityEdge.similar_file_id),
+        else_=SimilarityEdge.file_id
+    )
+    rows = session.query(
+        UploadedFile.file_name,
+        SimilarityEdge.similarity,
+        User.full_name
+    ).join(
+        UploadedFile, UploadedFile.id == other_file_id
+    ).join(
+        User, User.id == UploadedFile.user_id
+    ).filter(
+        or_(SimilarityEdge.file_id == file_id, SimilarityEdge.similar_file_id == file_id)
+    ).order_by(SimilarityEdge.similarity.desc()).all()
+    return [{'file_name': row.file_name, 'similarity': row.similarity, 'full_name': row.full_name} for row in rows]
+
+# Функция для формирования отчета по всем сохраненным парам похожих файлов
+def get_similarity_edges_report(limit=25):
+    first_file = aliased(UploadedFile)
+    second_file = aliased(UploadedFile)
+    first_user = aliased(User)
+    second_user = aliased(User)
+    rows = session.query(
+        SimilarityEdge.similarity,
+        first_file.file_name.label("first_file_name"),
+        first_user.full_name.label("first_full_name"),
+        second_file.file_name.label("second_file_name"),
+        second_user.full_name.label("second_full_name")
+    ).join(
+        first_file, first_file.id == SimilarityEdge.file_id
+    ).join(
+        first_user, first_user.id == first_file.user_id
+    ).join(
+        second_file, second_file.id == SimilarityEdge.similar_file_id
+    ).join(
+        second_user, second_user.id == second_file.user_id
+    ).order_by(SimilarityEdge.similarity.desc()).limit(limit).all()
+    
+    if not rows:
+        return "Похожих файлов не найдено."
+    
+    report = f"Найденные пары похожих файлов (топ {limit}):\n"
+    for row in rows:
+        report += (
+            f"- {row.first_full_name} ({row.first_file_name}) ↔ "
+            f"{row.second_full_name} ({row.second_file_name}): {row.similarity}%\n"
+        )
+    return report
 
 # Определение состояний для FSM
 class RegistrationStates(StatesGroup):
@@ -151,20 +372,76 @@ class AdminStates(StatesGroup):
     waiting_for_user_management = State()
     waiting_for_user_id = State()
 
+# Очередь сообщений в лог-чат: отправка не задерживает загрузку файлов,
+# а при остановке бота неотправленные сообщения сохраняются
+log_queue = asyncio.Queue()
+
 # Функция для отправки логов в чат
 async def send_log_message(message_text):
+    log_queue.put_nowait(message_text)
+
+# Функция для фоновой отправки сообщений из очереди
+async def run_log_sender():
+    while True:
+        message_text = await log_queue.get()
+        try:
+            await deliver_log_message(message_text)
+        finally:
+            log_queue.task_done()
+
+async def deliver_log_message(message_text):
     log_settings = session.query(LogSettings).first()
     if log_settings and log_settings.log_chat_id:
         try:
             await bot.send_message(chat_id=log_settings.log_chat_id, text=message_text)
         except aiogram_exceptions.TelegramBadRequest as e:
-            logging.error(f"Ошибка при отправке лога в чат (неверный запрос): {str(e)}")
+            logging.error("Ошибка при отправке лога в чат (неверный запрос): %s", e)
         except aiogram_exceptions.TelegramForbiddenError as e:
-            logging.error(f"Ошибка при отправке лога в чат (доступ запрещен): {str(e)}")
+            logging.error("Ошибка при отправке лога в чат (доступ запрещен): %s", e)
         except Exception as e:
-            logging.error(f"Неожиданная ошибка при отправке лога в чат: {str(e)}")
+            logging.error("Неожиданная ошибка при отправке лога в чат: %s", e)
             logging.exception("Подробности ошибки:")
 
+# Документы, пришедшие с интервалом меньше этого (секунды), обрабатываются одной группой
+document_collector = DocumentCollector(
+    delay=float(os.getenv("DOCUMENT_GROUP_DELAY", "1.0")),
+    on_flush=lambda key, items: process_collected_documents(key, items)
+)
+
+# Функция для выбора аккаунта Яндекс.Диска: работы пользователя остаются на аккаунте,
+# где уже хранятся его файлы, пока там есть место; новые пользователи распределяются хешем
+def shard_for_user(user, size=0):
+    last_file = session.query(UploadedFile.storage_shard).filter(
+        UploadedFile.user_id == user.id
+    ).order_by(UploadedFile.id.desc()).first()
+    if last_file:
+        # Все аккаунты из БД проверены при запуске (см. wait_for_database)
+        shard = storage_router.get(last_file.storage_shard)
+        if storage_router.has_room(shard, size):
+            return shard
+    return storage_router.shard_for(user.id, size)
+
+# Функция для выбора аккаунта для файла: если файл с таким именем уже загружен пользователем, он остается
+# на аккаунте этой записи — там проверяется и выполняется замена. Иначе файл загружается на аккаунт shard.
+# Без этого после переезда пользователя на новый аккаунт запись старого файла перезаписывалась бы новым аккаунтом,
+# а сам файл оставался бы на старом без записи в БД
+def shard_for_file(user, file_name, shard):
+    paths = {f"{candidate.user_folder(user)}/{file_name}" for candidate in storage_router.shards.values()}
+    existing = session.query(UploadedFile.storage_shard).filter(
+        UploadedFile.user_id == user.id,
+        UploadedFile.file_path.in_(paths)
+    ).order_by(UploadedFile.id.desc()).first()
+    if existing and existing.storage_shard != shard.name:
+        logging.info("Файл %s уже хранится на аккаунте %s, загрузка туда же", file_name, existing.storage_shard)
+        return storage_router.get(existing.storage_shard)
+    return shard
+
+# Функция для уведомления пользователя о позиции его файла в очереди
+def queue_notifier(chat_id):
+    async def notify(position):
+        await bot.send_message(chat_id, f"Сейчас обрабатывается много файлов. Ваш файл в очереди, позиция: {position}")
+    return notify
+
 # Функция для создания главного меню
 def get_main_menu(is_admin=False):
     builder = InlineKeyboardBuilder()
@@ -180,6 +457,10 @@ def get_admin_menu():
     builder.button(text="Управление пользователями", callback_data="admin:users")
     builder.button(text="Настройка шаблона файлов", callback_data="admin:template")
     builder.button(text="Настройка логирования", callback_data="admin:logging")
+    builder.button(text="Выгрузка работ", callback_data="admin:export")
+    builder.button(text="Отчет о схожести эссе", callback_data="admin:similarity")
+    builder.button(text="Найденные совпадения", callback_data="admin:similar_pairs")
+    builder.button(text="Статистика сдачи работ", callback_data="admin:stats")
     builder.button(text="Назад", callback_data="menu:back")
     builder.adjust(1)
     return builder.as_markup()
@@ -218,40 +499,43 @@ async def process_fullname(message: Message, state: FSMContext):
     session.commit()
     
     # Создание папки на Яндекс.Диске
-    folder_path = f"/PKS12_SocialStudy/{full_name}"
+    shard = shard_for_user(new_user)
+    folder_path = shard.user_folder(new_user)
     try:
         # Создаем базовую директорию
-        base_path = "/PKS12_SocialStudy"
+        base_path = shard.root
         max_retries = 3
         retry_delay = 2  # секунды между попытками
         
-        logging.info(f"Начало создания директорий для пользователя {full_name} (ID: {user_id})")
-        logging.info(f"Проверка существования базовой директории: {base_path}")
+        logging.info("Начало создания директорий для пользователя %s (ID: %s) на аккаунте %s", full_name, user_id, shard.name)
+        logging.info("Проверка существования базовой директории: %s", base_path)
 
         for attempt in range(max_retries):
             try:
-                if not yadisk_client.exists(base_path):
-                    logging.info(f"Создание базовой директории: {base_path}")
-                    yadisk_client.mkdir(base_path)
-                    logging.info(f"Базовая директория успешно создана: {base_path}")
+                if not await shard.exists(base_path):
+                    logging.info("Создание базовой директории: %s", base_path)
+                    await shard.call("mkdir", base_path)
+                    shard.index.add_dir(base_path)
+                    logging.info("Базовая директория успешно создана: %s", base_path)
                 else:
-                    logging.info(f"Базовая директория уже существует: {base_path}")
+                    logging.info("Базовая директория уже существует: %s", base_path)
 
-                logging.info(f"Проверка существования пользовательской директории: {folder_path}")
-                if not yadisk_client.exists(folder_path):
-                    logging.info(f"Создание пользовательской директории: {folder_path}")
-                    yadisk_client.mkdir(folder_path)
-                    logging.info(f"Пользовательская директория успешно создана: {folder_path}")
+                logging.info("Проверка существования пользовательской директории: %s", folder_path)
+                if not await shard.exists(folder_path):
+                    logging.info("Создание пользовательской директории: %s", folder_path)
+                    await shard.call("mkdir", folder_path)
+                    shard.index.add_dir(folder_path)
+                    logging.info("Пользовательская директория успешно создана: %s", folder_path)
                 else:
-                    logging.info(f"Пользовательская директория уже существует: {folder_path}")
+                    logging.info("Пользовательская директория уже существует: %s", folder_path)
                 break
             except Exception as e:
                 if attempt == max_retries - 1:
-                    logging.error(f"Ошибка создания директории после {max_retries} попыток. Ошибка: {str(e)}")
-                    logging.error(f"Стек вызовов: ", exc_info=True)
+                    logging.error("Ошибка создания директории после %s попыток. Ошибка: %s", max_retries, e)
+                    logging.error("Стек вызовов: ", exc_info=True)
                     raise
-                logging.warning(f"Ошибка при попытке {attempt + 1}: {str(e)}")
-                logging.warning(f"Повторная попытка {attempt + 1} из {max_retries} через {retry_delay} секунд...")
+                logging.warning("Ошибка при попытке %s: %s", attempt + 1, e)
+                logging.warning("Повторная попытка %s из %s через %s секунд...", attempt + 1, max_retries, retry_delay)
                 await asyncio.sleep(retry_delay)
         await message.answer(
             f"Регистрация успешна! Ваше ФИО: {full_name}", 
@@ -263,7 +547,7 @@ async def process_fullname(message: Message, state: FSMContext):
         if log_settings and log_settings.log_registrations:
             await send_log_message(f"🆕 Новая регистрация: {full_name} (ID: {user_id})")
     except Exception as e:
-        logging.error(f"Ошибка при создании папки на Яндекс.Диске: {e}")
+        logging.error("Ошибка при создании папки на Яндекс.Диске: %s", e)
         await message.answer("Произошла ошибка при создании папки. Пожалуйста, попробуйте позже.")
     
     await state.clear()
@@ -302,11 +586,41 @@ async def cmd_upload(message: Message, state: FSMContext):
     await message.answer("Пожалуйста, отправьте файл (эссе или презентацию).")
     await state.set_state(UploadStates.waiting_for_file)
 
+# Расширения, по которым файл из группы считается презентацией (остальные — эссе)
+PRESENTATION_EXTENSIONS = {".ppt", ".pptx", ".pps", ".ppsx", ".odp", ".key"}
+
+# Функция для определения типа файла по расширению (для группы файлов, где тип не спрашиваем)
+def classify_file_type(file_name):
+    _, file_ext = os.path.splitext(file_name or "")
+    return "presentation" if file_ext.lower() in PRESENTATION_EXTENSIONS else "essay"
+
 # Обработчик загрузки файла
+# Документы, отправленные вместе (альбомом или подряд), собираются и обрабатываются одной группой
 @router.message(UploadStates.waiting_for_file, F.document)
 async def process_file(message: Message, state: FSMContext):
+    key = (message.chat.id, message.from_user.id)
+    document_collector.add(key, (message, state))
+    # Ожидающая группа документов тоже считается выполняющейся работой при остановке
+    lifecycle.add_task(document_collector.tasks[key])
+
+# Функция для обработки собранных документов: один файл — обычный сценарий с выбором типа,
+# несколько файлов — параллельная загрузка с определением типа по расширению
+async def process_collected_documents(key, items):
+    message, state = items[0]
+    # Документы, пришедшие, пока обрабатывалась предыдущая группа, не заменяют уже принятый файл
+    if await state.get_state() != UploadStates.waiting_for_file.state:
+        await message.answer("Предыдущий файл еще обрабатывается. Отправьте этот файл снова после завершения загрузки.")
+        return
+    if len(items) > 1:
+        await process_document_group([item_message for item_message, _ in items], state)
+        return
+    
     # Сохраняем информацию о файле в состоянии
-    await state.update_data(file_id=message.document.file_id, file_name=message.document.file_name)
+    await state.update_data(
+        file_id=message.document.file_id,
+        file_name=message.document.file_name,
+        file_size=message.document.file_size
+    )
     
     # Создаем клавиатуру для выбора типа файла
     builder = InlineKeyboardBuilder()
@@ -316,158 +630,180 @@ async def process_file(message: Message, state: FSMContext):
     await message.answer("Выберите тип файла:", reply_markup=builder.as_markup())
     await state.set_state(UploadStates.waiting_for_file_type)
 
-# Обработчик выбора типа файла
-@router.callback_query(UploadStates.waiting_for_file_type, F.data.startswith("file_type:"))
-async def process_file_type(callback: CallbackQuery, state: FSMContext):
-    await callback.answer()
-    
+# Функция для параллельной загрузки группы файлов с одним итоговым сообщением
+async def process_document_group(messages, state):
     start_time = datetime.now()
-    logging.info(f"[{start_time}] Начало обработки файла после выбора типа")
-    
-    file_type = callback.data.split(":")[1]  # essay или presentation
-    user_id = callback.from_user.id
+    message = messages[0]
+    user_id = message.from_user.id
     user = session.query(User).filter(User.telegram_id == user_id).first()
-    logging.info(f"[{datetime.now()}] Пользователь: {user.full_name} (ID: {user_id}), выбранный тип файла: {file_type}")
-    
-    # Получаем данные о файле из состояния
-    data = await state.get_data()
-    if "file_id" not in data:
-        logging.warning(f"[{datetime.now()}] file_id not found in state data. Ensure that the file upload was successful.")
-        await callback.message.answer("Ошибка: файл не был загружен. Пожалуйста, попробуйте снова.")
-        await state.clear()
+    await state.clear()
+    if not user:
+        await message.answer("Вы не зарегистрированы. Используйте команду /start для регистрации.")
         return
     
-    file_id = data["file_id"]
-    original_file_name = data["file_name"]
-    
-    # Определяем расширение файла
-    _, file_ext = os.path.splitext(original_file_name)
-    logging.info(f"[{datetime.now()}] Оригинальное имя файла: {original_file_name}, расширение: {file_ext}")
-    
-    # Получаем шаблон имени файла из базы данных
-    template = session.query(FileTemplate).first()
-    if not template:
-        template = FileTemplate()
-        session.add(template)
-        session.commit()
+    logging.info("Пользователь %s (ID: %s) отправил группу из %s файлов", user.full_name, user_id, len(messages))
+    await message.answer(f"Получено файлов: {len(messages)}. Идет загрузка...")
     
-    # Формируем новое имя файла по шаблону
-    current_date = datetime.now().strftime("%Y-%m-%d")
-    file_type_name = "Эссе" if file_type == "essay" else "Презентация"
-    logging.info(f"[{datetime.now()}] Формирование имени файла, тип: {file_type_name}")
+    # Для каждого типа загружается один файл — остальные файлы того же типа пропускаются
+    results = []
+    documents = {}
+    for item in messages:
+        file_type = classify_file_type(item.document.file_name)
+        if file_type in documents:
+            results.append(f"⏭ {item.document.file_name}: в группе уже есть файл типа «{FILE_TYPE_NAMES[file_type]}»")
+        else:
+            documents[file_type] = item.document
     
-    # Разбиваем ФИО на части
-    name_parts = user.full_name.split()
-    surname = name_parts[0] if name_parts else ""
+    shard = shard_for_user(user, sum(document.file_size or 0 for document in documents.values()))
     
-    # Заменяем плейсхолдеры в шаблоне
-    new_file_name = template.template
-    new_file_name = new_file_name.replace("[фамилия]", surname)
-    new_file_name = new_file_name.replace("[тип]", file_type_name)
-    new_file_name = f"{new_file_name}{file_ext}"
-    logging.info(f"[{datetime.now()}] Сформировано новое имя файла: {new_file_name}")
+    async def upload_document(file_type, document):
+        new_file_name = build_file_name(user, file_type, document.file_name)
+        file_shard = shard_for_file(user, new_file_name, shard)
+        yadisk_path = f"{file_shard.user_folder(user)}/{new_file_name}"
+        try:
+            if file_shard is not shard:
+                await ensure_user_folder(user, file_shard)
+            file_exists = await file_shard.exists(yadisk_path)
+        except Exception as e:
+            logging.error("Ошибка при проверке файла на Яндекс.Диске: %s", e)
+            return f"❌ {document.file_name}: ошибка при загрузке"
+        if file_exists:
+            return f"⏭ {document.file_name}: файл {new_file_name} уже существует, для замены отправьте его отдельно"
+        status = await process_upload(
+            message.chat.id, user, user_id, document.file_id, document.file_size, file_type, file_shard, yadisk_path
+        )
+        if status == "uploaded":
+            return f"✅ {document.file_name} → {new_file_name} ({FILE_TYPE_NAMES[file_type]})"
+        if status == "exists":
+            return f"⏭ {document.file_name}: файл {new_file_name} уже существует, для замены отправьте его отдельно"
+        if status == "busy":
+            return f"❌ {document.file_name}: сервер перегружен, попробуйте позже"
+        return f"❌ {document.file_name}: ошибка при загрузке"
     
-    # Путь для сохранения на Яндекс.Диске
-    yadisk_path = f"/PKS12_SocialStudy/{user.full_name}/{new_file_name}"
-    logging.info(f"[{datetime.now()}] Путь для сохранения на Яндекс.Диске: {yadisk_path}")
+    async with lock_backend.user_lock(user_id):
+        try:
+            await ensure_user_folder(user, shard)
+        except Exception as e:
+            logging.error("Ошибка при создании папки на Яндекс.Диске: %s", e)
+            await message.answer("Произошла ошибка при создании папки. Пожалуйста, попробуйте позже.")
+            return
+        results.extend(await asyncio.gather(*(
+            upload_document(file_type, document) for file_type, document in documents.items()
+        )))
     
-    # Создаем директорию, если она не существует
+    await message.answer("Результаты загрузки:\n" + "\n".join(results), reply_markup=get_main_menu(user.is_admin))
+    execution_time = (datetime.now() - start_time).total_seconds()
+    logging.info("Загрузка группы файлов завершена. Общее время выполнения: %s секунд", execution_time)
+
+# Функция для декодирования содержимого файла для проверок
+def decode_file_content(binary_content):
+    # Удаляем нулевые байты
+    binary_content = binary_content.replace(b'\x00', b'')
+    logging.info("Файл прочитан, размер: %s байт", len(binary_content))
+    # Пробуем декодировать в UTF-8
     try:
-        folder_path = f"/PKS12_SocialStudy/{user.full_name}"
-        logging.info(f"[{datetime.now()}] Проверка существования директорий")
-        if not yadisk_client.exists("/PKS12_SocialStudy"):
-            logging.info(f"[{datetime.now()}] Создание корневой директории /PKS12_SocialStudy")
-            yadisk_client.mkdir("/PKS12_SocialStudy")
-        
-        if not yadisk_client.exists(folder_path):
-            logging.info(f"[{datetime.now()}] Создание директории пользователя {folder_path}")
+        file_content = binary_content.decode('utf-8')
+        logging.info("Файл успешно декодирован в UTF-8")
+    except UnicodeDecodeError:
+        # Если не удалось декодировать в UTF-8, пробуем другие кодировки
+        logging.info("Ошибка декодирования UTF-8, пробуем альтернативные кодировки")
+        for encoding in ['cp1251', 'latin1', 'iso-8859-1']:
             try:
-                yadisk_client.mkdir(folder_path)
-                logging.info(f"[{datetime.now()}] Директория пользователя успешно создана: {folder_path}")
-            except yadisk.exceptions.PathExistsError:
-                logging.warning(f"[{datetime.now()}] Директория {folder_path} уже существует")
-            except Exception as e:
-                raise Exception(f"Failed to create user directory: {e}")
-    except Exception as e:
-        error_msg = f"Ошибка при создании папки на Яндекс.Диске: {str(e)}"
-        logging.error(f"[{datetime.now()}] {error_msg}")
-        await callback.message.answer("Произошла ошибка при создании папки. Пожалуйста, попробуйте позже.")
-        if os.path.exists(download_path):
-            os.remove(download_path)
-        await state.clear()
-        return
-    
-    # Скачиваем файл
-    logging.info(f"[{datetime.now()}] Начало скачивания файла с Telegram серверов")
-    file = await bot.get_file(file_id)
-    file_path = file.file_path
-    download_path = f"temp_{file_id}{file_ext}"
-    await bot.download_file(file_path, download_path)
-    logging.info(f"[{datetime.now()}] Файл успешно скачан во временный файл: {download_path}")
-    
-    # Проверяем, существует ли файл на Яндекс.Диске
-    logging.info(f"[{datetime.now()}] Проверка существования файла на Яндекс.Диске: {yadisk_path}")
-    if yadisk_client.exists(yadisk_path):
-        builder = InlineKeyboardBuilder()
-        builder.button(text="Да", callback_data="replace:yes")
-        builder.button(text="Нет", callback_data="replace:no")
-        logging.info(f"[{datetime.now()}] Файл {new_file_name} уже существует на Яндекс.Диске, запрос подтверждения замены")
-        await callback.message.answer(
-            f"Файл с именем {new_file_name} уже существует. Заменить его?",
-            reply_markup=builder.as_markup()
-        )
-        await state.update_data(download_path=download_path, yadisk_path=yadisk_path, file_type_name=file_type_name)
-        await state.set_state(UploadStates.waiting_for_replace_confirmation)
-        return
+                file_content = binary_content.decode(encoding)
+                logging.info("Файл успешно декодирован в кодировке %s", encoding)
+                break
+            except UnicodeDecodeError:
+                continue
+        else:
+            logging.warning("Не удалось декодировать файл ни в одной кодировке")
+            file_content = 'Содержимое файла не может быть прочитано'
+    return file_content
+
+# Функция для загрузки файла: скачивание из Telegram, проверки, загрузка на Яндекс.Диск и запись в БД
+# Файл скачивается только здесь, то есть после того, как пользователь подтвердил загрузку или замену
+# Возвращает статус: "uploaded", "exists", "busy" или "error"
+async def process_upload(chat_id, user, user_id, file_id, file_size, file_type, shard, yadisk_path, replace=False, on_queued=None):
+    # Параметры загрузки сохраняются в БД, если бот остановится раньше, чем она завершится
+    payload = {
+        "chat_id": chat_id,
+        "user_id": user_id,
+        "file_id": file_id,
+        "file_size": file_size,
+        "file_type": file_type,
+        "shard": shard.name,
+        "yadisk_path": yadisk_path,
+        "replace": replace,
+    }
+    with lifecycle.job("upload", payload):
+        return await _process_upload(user, user_id, file_id, file_size, file_type, shard, yadisk_path, replace, on_queued)
+
+async def _process_upload(user, user_id, file_id, file_size, file_type, shard, yadisk_path, replace, on_queued):
+    start_time = datetime.now()
+    file_name = os.path.basename(yadisk_path)
+    file_type_name = FILE_TYPE_NAMES[file_type]
     
+    spool_key = f"{user_id}:{file_id}"
     try:
-        # Читаем содержимое файла для проверок
-        logging.info(f"[{datetime.now()}] Начало чтения содержимого файла для проверок")
+        # Скачиваем файл; локальный сервер Bot API уже сохранил его на общем томе — тогда файл
+        # не копируется, а читается и загружается на Яндекс.Диск прямо оттуда
+        logging.info("Начало скачивания файла с Telegram серверов")
+        async with transfer_scheduler.slot(user_id, on_queued=on_queued):
+            local_path = await fetch_file(bot, file_id, spool, spool_key, size=file_size)
+        if local_path:
+            logging.info("Файл доступен на томе локального сервера Bot API: %s", local_path)
+        else:
+            logging.info("Файл успешно скачан во временное хранилище: %s", spool_key)
+        
+        # Файл читается блоками за один проход: md5 и размер нужны сверке, чтобы узнать файл после
+        # переименования на диске, а отпечаток по фрагментам находит копии презентаций и других двоичных
+        # файлов, в том числе с измененным титульным слайдом
+        logging.info("Начало чтения содержимого файла для проверок")
+        file_md5 = None
+        chunk_hashes = []
         try:
-            with open(download_path, 'rb') as file:
-                # Читаем бинарные данные и удаляем нулевые байты
-                binary_content = file.read()
-                binary_content = binary_content.replace(b'\x00', b'')
-                logging.info(f"[{datetime.now()}] Файл прочитан, размер: {len(binary_content)} байт")
-                # Пробуем декодировать в UTF-8
+            file_md5, file_size, chunk_hashes = await asyncio.to_thread(scan_file, local_path or spool.get(spool_key))
+            logging.info("Отпечаток файла построен: %s фрагментов", len(chunk_hashes))
+        except Exception as e:
+            logging.error("Ошибка при чтении файла: %s", e)
+        
+        # Текст читается в память только у небольших эссе
+        file_content = None
+        if file_type == 'essay' and file_md5 is not None:
+            if file_size > ESSAY_TEXT_LIMIT:
+                logging.info("Текст эссе не сохраняется: размер файла %s байт больше %s", file_size, ESSAY_TEXT_LIMIT)
+            else:
                 try:
-                    file_content = binary_content.decode('utf-8')
-                    logging.info(f"[{datetime.now()}] Файл успешно декодирован в UTF-8")
-                except UnicodeDecodeError:
-                    # Если не удалось декодировать в UTF-8, пробуем другие кодировки
-                    logging.info(f"[{datetime.now()}] Ошибка декодирования UTF-8, пробуем альтернативные кодировки")
-                    for encoding in ['cp1251', 'latin1', 'iso-8859-1']:
-                        try:
-                            file_content = binary_content.decode(encoding)
-                            logging.info(f"[{datetime.now()}] Файл успешно декодирован в кодировке {encoding}")
-                            break
-                        except UnicodeDecodeError:
-                            continue
+                    raw_content = await asyncio.to_thread(read_text_file, local_path or spool.get(spool_key))
+                    if raw_content is None:
+                        logging.info("Текст эссе не сохраняется: файл двоичный")
                     else:
-                        logging.warning(f"[{datetime.now()}] Не удалось декодировать файл ни в одной кодировке")
-                        file_content = 'Содержимое файла не может быть прочитано'
-        except Exception as e:
-            logging.error(f"[{datetime.now()}] Ошибка при чтении файла: {str(e)}")
-            file_content = 'Содержимое файла не может быть прочитано'
+                        file_content = decode_file_content(raw_content)
+                except Exception as e:
+                    logging.error("Ошибка при чтении файла: %s", e)
         
-        # Проверяем схожесть с другими файлами только для эссе
+        # Проверяем схожесть текста с другими файлами только для эссе, из которых прочитан текст
         similar_files = []
-        if file_type == 'essay':
-            logging.info(f"[{datetime.now()}] Начало проверки схожести с другими файлами")
-            try:
-                similar_files = await asyncio.wait_for(check_similarity(user.id, file_content, file_type), timeout=5.0)
-            except asyncio.TimeoutError:
-                logging.warning(f"[{datetime.now()}] Превышено время ожидания проверки схожести с другими файлами")
-                similar_files = []
-            except Exception as e:
-                logging.error(f"[{datetime.now()}] Ошибка при проверке схожести с другими файлами: {str(e)}")
-                similar_files = []
+        similarity_stats = None
+        if file_content is not None:
+            logging.info("Начало проверки схожести с другими файлами")
+            # При нехватке времени сохраняются лучшие найденные совпадения, а не пустой результат
+            similar_files, similarity_stats = await check_similarity(user.id, file_content, file_type)
             if similar_files:
-                logging.info(f"[{datetime.now()}] Найдено {len(similar_files)} похожих файлов")
+                logging.info("Найдено %s похожих файлов", len(similar_files))
             else:
-                logging.info(f"[{datetime.now()}] Похожих файлов не найдено")
+                logging.info("Похожих файлов не найдено")
         else:
-            logging.info(f"[{datetime.now()}] Проверка схожести пропущена для презентации")
+            logging.info("Проверка схожести текста пропущена: текст файла не сохраняется")
+        
+        # Поиск файлов с общими фрагментами дополняет проверку текста
+        if chunk_hashes and similar_files is not None:
+            chunk_matches = find_chunk_matches(user.id, file_type, chunk_hashes)
+            if chunk_matches is None:
+                similar_files = None
+            else:
+                if chunk_matches:
+                    logging.info("Найдено %s файлов с общими фрагментами", len(chunk_matches))
+                similar_files = merge_similar_files(similar_files, chunk_matches)
         
         # Проверяем на антиплагиат, если это эссе
         plagiarism_result = None
@@ -480,94 +816,255 @@ async def process_file_type(callback: CallbackQuery, state: FSMContext):
         #         }
         
         # Загружаем файл на Яндекс.Диск
-        logging.info(f"[{datetime.now()}] Начало загрузки файла на Яндекс.Диск: {yadisk_path}")
-        try:
-            yadisk_client.upload(download_path, yadisk_path)
-            logging.info(f"[{datetime.now()}] Файл успешно загружен на Яндекс.Диск")
-        except UnicodeError as e:
-            # Если возникла ошибка с кодировкой при загрузке
-            logging.error(f"[{datetime.now()}] Ошибка кодировки при загрузке файла: {str(e)}")
-            # Пробуем нормализовать имя файла
-            normalized_path = unicodedata.normalize('NFKC', yadisk_path)
-            logging.info(f"[{datetime.now()}] Попытка загрузки с нормализованным путем: {normalized_path}")
-            yadisk_client.upload(download_path, normalized_path)
-            yadisk_path = normalized_path
-            logging.info(f"[{datetime.now()}] Файл успешно загружен с нормализованным путем")
+        logging.info("Начало загрузки файла на Яндекс.Диск (%s): %s, замена: %s", shard.name, yadisk_path, replace)
+        async with transfer_scheduler.slot(user_id, on_queued=on_queued):
+            try:
+                await shard.call("upload", local_path or spool.get(spool_key), yadisk_path, overwrite=replace)
+                logging.info("Файл успешно загружен на Яндекс.Диск")
+            except UnicodeError as e:
+                # Если возникла ошибка с кодировкой при загрузке
+                logging.error("Ошибка кодировки при загрузке файла: %s", e)
+                # Пробуем нормализовать имя файла
+                normalized_path = unicodedata.normalize('NFKC', yadisk_path)
+                logging.info("Попытка загрузки с нормализованным путем: %s", normalized_path)
+                await shard.call("upload", local_path or spool.get(spool_key), normalized_path, overwrite=replace)
+                yadisk_path = normalized_path
+                logging.info("Файл успешно загружен с нормализованным путем")
+        shard.index.add_file(yadisk_path)
+        shard.add_used(file_size)
         
         # Сохраняем информацию о файле в базе данных
-        logging.info(f"[{datetime.now()}] Сохранение информации о файле в базе данных")
-        uploaded_file = UploadedFile(
-            user_id=user.id,
-            file_name=new_file_name,
-            file_type=file_type,
-            file_content=file_content,
-            file_path=yadisk_path
-        )
+        logging.info("Сохранение информации о файле в базе данных")
+        # Запись может остаться и без флага замены (например, файл удалили с диска вручную)
+        uploaded_file = session.query(UploadedFile).filter(
+            UploadedFile.user_id == user.id,
+            UploadedFile.file_path == yadisk_path
+        ).first()
         try:
-            session.add(uploaded_file)
+            if uploaded_file:
+                logging.info("Найдена существующая запись в БД, обновление содержимого")
+                uploaded_file.file_content = file_content
+                uploaded_file.storage_shard = shard.name
+                uploaded_file.chunk_count = len(chunk_hashes) if chunk_hashes else None
+                uploaded_file.file_size = file_size
+                uploaded_file.file_md5 = file_md5
+            else:
+                uploaded_file = UploadedFile(
+                    user_id=user.id,
+                    file_name=file_name,
+                    file_type=file_type,
+                    file_content=file_content,
+                    file_path=yadisk_path,
+                    storage_shard=shard.name,
+                    chunk_count=len(chunk_hashes) if chunk_hashes else None,
+                    file_size=file_size,
+                    file_md5=file_md5
+                )
+                session.add(uploaded_file)
             session.commit()
-            logging.info(f"[{datetime.now()}] Информация о файле успешно сохранена в базе данных")
+            logging.info("Информация о файле успешно сохранена в базе данных")
         except Exception as e:
             session.rollback()
-            logging.error(f"[{datetime.now()}] Ошибка при сохранении в базу данных: {str(e)}")
+            logging.error("Ошибка при сохранении в базу данных: %s", e)
             raise
         
-        # Формируем сообщение о результатах проверок
-        result_message = f"Файл успешно загружен на Яндекс.Диск как {new_file_name}\n\n"
-        
-        # if similar_files:
-        #     result_message += "⚠️ Обнаружены похожие файлы:\n"
-        #     for file in similar_files:
-        #         sim_user = session.query(User).filter(User.id == file['user_id']).first()
-        #         result_message += f"- {file['file_name']} (схожесть: {file['similarity']}%, автор: {sim_user.full_name})\n"
-        
-        # if plagiarism_result:
-        #     result_message += f"\n🔍 Результат проверки на антиплагиат:\n"
-        #     result_message += f"Оригинальность: {100 - plagiarism_result['percentage']}%\n"
-        #     if plagiarism_result['sources']:
-        #         result_message += "Источники:\n"
-        #         for source in plagiarism_result['sources'][:3]:  # Показываем только первые 3 источника
-        #             result_message += f"- {source}\n"
+        # Сохраняем отпечаток файла
+        save_file_chunks(uploaded_file.id, chunk_hashes)
         
-        await callback.message.answer(result_message, reply_markup=get_main_menu(user.is_admin))
+        # Сохраняем найденные пары похожих файлов (при замене пересчитываются только пары этого файла);
+        # пары прежнего содержимого удаляются, даже если проверка не удалась
+        update_similarity_edges(uploaded_file.id, similar_files)
         
         # Отправка лога о загрузке файла и результатах проверок
-        logging.info(f"[{datetime.now()}] Подготовка сообщения для отправки в лог-чат")
+        logging.info("Подготовка сообщения для отправки в лог-чат")
         log_settings = session.query(LogSettings).first()
         if log_settings and log_settings.log_file_uploads:
             current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            log_message = f"📤 Загрузка файла: {user.full_name} (ID: {user_id})\n"
+            log_message = f"📤 {'Замена' if replace else 'Загрузка'} файла: {user.full_name} (ID: {user_id})\n"
             log_message += f"Время: {current_time}\n"
             log_message += f"Тип: {file_type_name}\n"
-            log_message += f"Имя файла: {new_file_name}\n"
+            log_message += f"Имя файла: {file_name}\n"
             
-            if similar_files:
+            # Похожие файлы с авторами читаются одним запросом из сохраненных пар
+            stored_similar_files = get_similar_files(uploaded_file.id)
+            if stored_similar_files:
                 log_message += "\n⚠️ Обнаружены похожие файлы!\n"
-                for file in similar_files:
-                    sim_user = session.query(User).filter(User.id == file['user_id']).first()
-                    log_message += f"- {file['file_name']} (схожесть: {file['similarity']}%, автор: {sim_user.full_name})\n"
+                for file in stored_similar_files:
+                    log_message += f"- {file['file_name']} (схожесть: {file['similarity']}%, автор: {file['full_name']})\n"
+            if similarity_stats and not similarity_stats["complete"]:
+                log_message += (
+                    f"\n⏱ Проверка схожести прервана по времени: проверено {similarity_stats['coverage']}% файлов "
+                    f"({similarity_stats['total'] - similarity_stats['unchecked']} из {similarity_stats['total']})\n"
+                )
             
-            if plagiarism_result:
-                log_message += f"\n🔍 Оригинальность: Функция в разработке."
+            if plagiarism_result or replace:
+                log_message += f"\n🔍 Оригинальность: функция в разработке."
             
-            logging.info(f"[{datetime.now()}] Отправка сообщения в лог-чат")
             await send_log_message(log_message)
-            logging.info(f"[{datetime.now()}] Сообщение успешно отправлено в лог-чат")
+            logging.info("Сообщение поставлено в очередь отправки в лог-чат")
+        return "uploaded"
+    except SpoolQuotaExceeded as e:
+        logging.warning("%s", e)
+        return "busy"
+    except yadisk.exceptions.PathExistsError:
+        # Файл появился на диске после последней сверки — индекс об этом еще не знал
+        logging.warning("Файл %s уже существует на Яндекс.Диске", yadisk_path)
+        shard.index.add_file(yadisk_path)
+        return "exists"
     except Exception as e:
-        logging.error(f"[{datetime.now()}] Ошибка при загрузке файла на Яндекс.Диске: {e}")
-        await callback.message.answer("Произошла ошибка при загрузке файла. Пожалуйста, попробуйте позже.")
+        logging.error("Ошибка при загрузке файла на Яндекс.Диск: %s", e)
+        return "error"
     finally:
         # Удаляем временный файл
-        if os.path.exists(download_path):
-            logging.info(f"[{datetime.now()}] Удаление временного файла: {download_path}")
-            os.remove(download_path)
-            logging.info(f"[{datetime.now()}] Временный файл успешно удален")
+        logging.info("Удаление временного файла: %s", spool_key)
+        spool.release(spool_key)
         
         # Вычисляем общее время выполнения
-        end_time = datetime.now()
-        execution_time = (end_time - start_time).total_seconds()
-        logging.info(f"[{end_time}] Завершение обработки файла. Общее время выполнения: {execution_time} секунд")
+        execution_time = (datetime.now() - start_time).total_seconds()
+        logging.info("Завершение загрузки файла. Общее время выполнения: %s секунд", execution_time)
+
+# Функция для загрузки одного файла с сообщением пользователю о результате
+async def upload_file(chat_id, user, user_id, file_id, file_size, file_type, shard, yadisk_path, replace=False):
+    status = await process_upload(
+        chat_id, user, user_id, file_id, file_size, file_type, shard, yadisk_path,
+        replace=replace, on_queued=queue_notifier(chat_id)
+    )
+    file_name = os.path.basename(yadisk_path)
+    
+    if status == "uploaded":
+        # Формируем сообщение о результатах проверок
+        if replace:
+            result_message = f"Файл успешно заменен на Яндекс.Диске как {file_name}\n\n"
+        else:
+            result_message = f"Файл успешно загружен на Яндекс.Диск как {file_name}\n\n"
+        
+        # if similar_files:
+        #     result_message += "⚠️ Обнаружены похожие файлы:\n"
+        #     for file in get_similar_files(uploaded_file.id):
+        #         result_message += f"- {file['file_name']} (схожесть: {file['similarity']}%, автор: {file['full_name']})\n"
+        
+        await bot.send_message(chat_id, result_message, reply_markup=get_main_menu(user.is_admin))
+    elif status == "exists":
+        await bot.send_message(
+            chat_id,
+            f"Файл с именем {file_name} уже существует на Яндекс.Диске. Отправьте файл снова, чтобы заменить его.",
+            reply_markup=get_main_menu(user.is_admin)
+        )
+    elif status == "busy":
+        await bot.send_message(chat_id, "Сейчас обрабатывается слишком много файлов. Пожалуйста, попробуйте позже.")
+    elif replace:
+        await bot.send_message(chat_id, "Произошла ошибка при замене файла. Пожалуйста, попробуйте позже.")
+    else:
+        await bot.send_message(chat_id, "Произошла ошибка при загрузке файла. Пожалуйста, попробуйте позже.")
+
+# Функция для формирования имени файла по шаблону
+def build_file_name(user, file_type, original_file_name):
+    # Определяем расширение файла
+    _, file_ext = os.path.splitext(original_file_name)
+    logging.info("Оригинальное имя файла: %s, расширение: %s", original_file_name, file_ext)
+    
+    # Получаем шаблон имени файла из базы данных
+    template = session.query(FileTemplate).first()
+    if not template:
+        template = FileTemplate()
+        session.add(template)
+        session.commit()
+    
+    # Формируем новое имя файла по шаблону
+    file_type_name = FILE_TYPE_NAMES[file_type]
+    logging.info("Формирование имени файла, тип: %s", file_type_name)
+    
+    # Разбиваем ФИО на части
+    name_parts = user.full_name.split()
+    surname = name_parts[0] if name_parts else ""
+    
+    # Заменяем плейсхолдеры в шаблоне
+    new_file_name = template.template
+    new_file_name = new_file_name.replace("[фамилия]", surname)
+    new_file_name = new_file_name.replace("[тип]", file_type_name)
+    new_file_name = f"{new_file_name}{file_ext}"
+    logging.info("Сформировано новое имя файла: %s", new_file_name)
+    return new_file_name
+
+# Функция для создания папки пользователя на Яндекс.Диске, если ее нет
+async def ensure_user_folder(user, shard):
+    folder_path = shard.user_folder(user)
+    logging.info("Проверка существования директорий на аккаунте %s", shard.name)
+    if not await shard.exists(shard.root):
+        logging.info("Создание корневой директории %s", shard.root)
+        await shard.call("mkdir", shard.root)
+        shard.index.add_dir(shard.root)
+    
+    if not await shard.exists(folder_path):
+        logging.info("Создание директории пользователя %s", folder_path)
+        try:
+            await shard.call("mkdir", folder_path)
+            logging.info("Директория пользователя успешно создана: %s", folder_path)
+        except yadisk.exceptions.PathExistsError:
+            logging.warning("Директория %s уже существует", folder_path)
+        except Exception as e:
+            raise Exception(f"Failed to create user directory: {e}")
+        shard.index.add_dir(folder_path)
+    return folder_path
+
+# Обработчик выбора типа файла
+# Сначала формируется имя и проверяется наличие файла на Яндекс.Диске, скачивание — только после этого
+@router.callback_query(UploadStates.waiting_for_file_type, F.data.startswith("file_type:"))
+async def process_file_type(callback: CallbackQuery, state: FSMContext):
+    await callback.answer()
     
+    logging.info("Начало обработки файла после выбора типа")
+    
+    file_type = callback.data.split(":")[1]  # essay или presentation
+    user_id = callback.from_user.id
+    user = session.query(User).filter(User.telegram_id == user_id).first()
+    logging.info("Пользователь: %s (ID: %s), выбранный тип файла: %s", user.full_name, user_id, file_type)
+    
+    # Получаем данные о файле из состояния
+    data = await state.get_data()
+    if "file_id" not in data:
+        logging.warning("file_id not found in state data. Ensure that the file upload was successful.")
+        await callback.message.answer("Ошибка: файл не был загружен. Пожалуйста, попробуйте снова.")
+        await state.clear()
+        return
+    
+    file_id = data["file_id"]
+    new_file_name = build_file_name(user, file_type, data["file_name"])
+    
+    # Путь для сохранения на Яндекс.Диске (на аккаунте, выбранном для пользователя, или там, где уже лежит файл)
+    shard = shard_for_file(user, new_file_name, shard_for_user(user, data.get("file_size")))
+    yadisk_path = f"{shard.user_folder(user)}/{new_file_name}"
+    logging.info("Путь для сохранения на Яндекс.Диске: %s", yadisk_path)
+    
+    # Создаем директорию, если она не существует
+    try:
+        await ensure_user_folder(user, shard)
+        
+        # Проверяем, существует ли файл на Яндекс.Диске (по локальному индексу, если он актуален)
+        logging.info("Проверка существования файла на Яндекс.Диске: %s", yadisk_path)
+        file_exists = await shard.exists(yadisk_path)
+    except Exception as e:
+        error_msg = f"Ошибка при создании папки на Яндекс.Диске: {str(e)}"
+        logging.error("%s", error_msg)
+        await callback.message.answer("Произошла ошибка при создании папки. Пожалуйста, попробуйте позже.")
+        await state.clear()
+        return
+    
+    if file_exists:
+        builder = InlineKeyboardBuilder()
+        builder.button(text="Да", callback_data="replace:yes")
+        builder.button(text="Нет", callback_data="replace:no")
+        logging.info("Файл %s уже существует на Яндекс.Диске, запрос подтверждения замены", new_file_name)
+        await callback.message.answer(
+            f"Файл с именем {new_file_name} уже существует. Заменить его?",
+            reply_markup=builder.as_markup()
+        )
+        # Сохраняем только file_id — файл будет скачан, если пользователь подтвердит замену
+        await state.update_data(yadisk_path=yadisk_path, file_type=file_type, shard=shard.name)
+        await state.set_state(UploadStates.waiting_for_replace_confirmation)
+        return
+    
+    await upload_file(callback.message.chat.id, user, user_id, file_id, data.get("file_size"), file_type, shard, yadisk_path)
     await state.clear()
 
 # Обработчик для файлов неправильного формата
@@ -579,169 +1076,28 @@ async def wrong_file(message: Message):
 async def process_replace_confirmation(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
     
-    start_time = datetime.now()
-    logging.info(f"[{start_time}] Начало обработки подтверждения замены файла")
-    
     choice = callback.data.split(":")[1]
-    logging.info(f"[{datetime.now()}] Выбор пользователя: {choice}")
+    logging.info("Выбор пользователя при подтверждении замены файла: %s", choice)
     
     data = await state.get_data()
-    download_path = data.get("download_path")
     yadisk_path = data.get("yadisk_path")
-    file_type_name = data.get("file_type_name")
-    file_type = "essay" if file_type_name == "Эссе" else "presentation"
+    file_type = data.get("file_type")
     user_id = callback.from_user.id
     user = session.query(User).filter(User.telegram_id == user_id).first()
-    logging.info(f"[{datetime.now()}] Пользователь: {user.full_name} (ID: {user_id}), тип файла: {file_type_name}, путь: {yadisk_path}")
+    logging.info("Пользователь: %s (ID: %s), тип файла: %s, путь: %s", user.full_name, user_id, file_type, yadisk_path)
     
-    if choice == "yes":
-        try:
-            logging.info(f"[{datetime.now()}] Начало процесса замены файла")
-            # Читаем содержимое файла для проверок
-            logging.info(f"[{datetime.now()}] Начало чтения содержимого файла для проверок: {download_path}")
-            try:
-                with open(download_path, 'rb') as file:
-                    binary_content = file.read()
-                    binary_content = binary_content.replace(b'\x00', b'')
-                    logging.info(f"[{datetime.now()}] Файл прочитан, размер: {len(binary_content)} байт")
-                    try:
-                        file_content = binary_content.decode('utf-8')
-                        logging.info(f"[{datetime.now()}] Файл успешно декодирован в UTF-8")
-                    except UnicodeDecodeError:
-                        logging.info(f"[{datetime.now()}] Ошибка декодирования UTF-8, пробуем альтернативные кодировки")
-                        for encoding in ['cp1251', 'latin1', 'iso-8859-1']:
-                            try:
-                                file_content = binary_content.decode(encoding)
-                                logging.info(f"[{datetime.now()}] Файл успешно декодирован в кодировке {encoding}")
-                                break
-                            except UnicodeDecodeError:
-                                continue
-                        else:
-                            logging.warning(f"[{datetime.now()}] Не удалось декодировать файл ни в одной кодировке")
-                            file_content = 'Содержимое файла не может быть прочитано'
-            except Exception as e:
-                logging.error(f"[{datetime.now()}] Ошибка при чтении файла: {str(e)}")
-                file_content = 'Содержимое файла не может быть прочитано'
-
-            # Проверяем схожесть с другими файлами только для эссе
-            similar_files = []
-            if file_type == 'essay':
-                logging.info(f"[{datetime.now()}] Начало проверки схожести с другими файлами")
-                try:
-                    similar_files = await asyncio.wait_for(check_similarity(user.id, file_content, file_type), timeout=5.0)
-                except asyncio.TimeoutError:
-                    logging.warning(f"[{datetime.now()}] Превышено время ожидания проверки схожести с другими файлами")
-                    similar_files = []
-                except Exception as e:
-                    logging.error(f"[{datetime.now()}] Ошибка при проверке схожести с другими файлами: {str(e)}")
-                    similar_files = []
-                if similar_files:
-                    logging.info(f"[{datetime.now()}] Найдено {len(similar_files)} похожих файлов")
-                else:
-                    logging.info(f"[{datetime.now()}] Похожих файлов не найдено")
-            else:
-                logging.info(f"[{datetime.now()}] Проверка схожести пропущена для презентации")
-
-            # Проверяем на антиплагиат, если это эссе
-            plagiarism_result = None
-            # if file_type == 'essay':
-            #     plagiarism_percentage, sources = await check_plagiarism(file_content)
-            #     if plagiarism_percentage is not None:
-            #         plagiarism_result = {
-            #             'percentage': plagiarism_percentage,
-            #             'sources': sources
-            #         }
-
-            # Загружаем файл на Яндекс.Диск
-            logging.info(f"[{datetime.now()}] Начало загрузки файла на Яндекс.Диск с перезаписью: {yadisk_path}")
-            yadisk_client.upload(download_path, yadisk_path, overwrite=True)
-            logging.info(f"[{datetime.now()}] Файл успешно загружен на Яндекс.Диск")
-
-            # Обновляем информацию о файле в базе данных
-            logging.info(f"[{datetime.now()}] Обновление информации о файле в базе данных")
-            existing_file = session.query(UploadedFile).filter(
-                UploadedFile.user_id == user.id,
-                UploadedFile.file_path == yadisk_path
-            ).first()
-
-            if existing_file:
-                logging.info(f"[{datetime.now()}] Найдена существующая запись в БД, обновление содержимого")
-                existing_file.file_content = file_content
-                session.commit()
-                logging.info(f"[{datetime.now()}] Запись в БД успешно обновлена")
-            else:
-                logging.info(f"[{datetime.now()}] Создание новой записи в БД")
-                uploaded_file = UploadedFile(
-                    user_id=user.id,
-                    file_name=os.path.basename(yadisk_path),
-                    file_type=file_type,
-                    file_content=file_content,
-                    file_path=yadisk_path
-                )
-                session.add(uploaded_file)
-                session.commit()
-                logging.info(f"[{datetime.now()}] Новая запись в БД успешно создана")
-
-            # Формируем сообщение о результатах проверок
-            result_message = f"Файл успешно заменен на Яндекс.Диске как {os.path.basename(yadisk_path)}\n\n"
-
-            # if similar_files:
-            #     result_message += "⚠️ Обнаружены похожие файлы:\n"
-            #     for file in similar_files:
-            #         similar_user = session.query(User).filter(User.id == file['user_id']).first()
-            #         result_message += f"- {file['file_name']} (схожесть: {file['similarity']}%, автор: {similar_user.full_name})\n"
-
-            # if plagiarism_result:
-            #     result_message += f"\n🔍 Результат проверки на антиплагиат:\n"
-            #     result_message += f"Оригинальность: {100 - plagiarism_result['percentage']}%\n"
-            #     if plagiarism_result['sources']:
-            #         result_message += "Источники:\n"
-            #         for source in plagiarism_result['sources'][:3]:
-            #             result_message += f"- {source['url']} (совпадение: {source['plagiat']}%)\n"
-
-            await callback.message.answer(result_message, reply_markup=get_main_menu(user.is_admin))
-            
-            # Отправка лога о загрузке файла
-            logging.info(f"[{datetime.now()}] Подготовка сообщения для отправки в лог-чат")
-            log_settings = session.query(LogSettings).first()
-            if log_settings and log_settings.log_file_uploads:
-                current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                log_message = f"📤 Замена файла: {user.full_name} (ID: {user_id})\n"
-                log_message += f"Время: {current_time}\n"
-                log_message += f"Тип: {file_type_name}\n"
-                log_message += f"Имя файла: {os.path.basename(yadisk_path)}\n"
-
-                if similar_files:
-                    log_message += "\n⚠️ Обнаружены похожие файлы!\n"
-                    for file in similar_files:
-                        similar_user = session.query(User).filter(User.id == file['user_id']).first()
-                        log_message += f"- {file['file_name']} (схожесть: {file['similarity']}%, автор: {similar_user.full_name})\n"
-
-                
-                log_message += f"\n🔍 Оригинальность: функция в разработке."
-
-                logging.info(f"[{datetime.now()}] Отправка сообщения в лог-чат")
-            await send_log_message(log_message)
-            logging.info(f"[{datetime.now()}] Сообщение успешно отправлено в лог-чат")
-
-        except Exception as e:
-            logging.error(f"[{datetime.now()}] Ошибка при замене файла на Яндекс.Диске: {e}")
-            await callback.message.answer("Произошла ошибка при замене файла. Пожалуйста, попробуйте позже.")
+    if choice == "yes" and "file_id" not in data:
+        logging.warning("file_id not found in state data при подтверждении замены")
+        await callback.message.answer("Ошибка: файл не был загружен. Пожалуйста, попробуйте снова.")
+    elif choice == "yes":
+        await upload_file(
+            callback.message.chat.id, user, user_id, data["file_id"], data.get("file_size"), file_type,
+            storage_router.get(data.get("shard")), yadisk_path, replace=True
+        )
     else:
-        logging.info(f"[{datetime.now()}] Пользователь отменил замену файла")
+        logging.info("Пользователь отменил замену файла")
         await callback.message.answer("Загрузка файла отменена.", reply_markup=get_main_menu(user.is_admin))
     
-    # Удаляем временный файл
-    if download_path and os.path.exists(download_path):
-        logging.info(f"[{datetime.now()}] Удаление временного файла: {download_path}")
-        os.remove(download_path)
-        logging.info(f"[{datetime.now()}] Временный файл успешно удален")
-    
-    # Вычисляем общее время выполнения
-    end_time = datetime.now()
-    execution_time = (end_time - start_time).total_seconds()
-    logging.info(f"[{end_time}] Завершение обработки замены файла. Общее время выполнения: {execution_time} секунд")
-    
     await state.clear()
 
 # Обработчик админ-меню
@@ -813,10 +1169,163 @@ async def process_admin_action(callback: CallbackQuery, state: FSMContext):
             reply_markup=builder.as_markup()
         )
     
+    elif action == "export":
+        builder = InlineKeyboardBuilder()
+        builder.button(text="Все работы", callback_data="export:all")
+        builder.button(text="Эссе", callback_data="export:essay")
+        builder.button(text="Презентации", callback_data="export:presentation")
+        builder.button(text="Назад", callback_data="admin:back")
+        builder.adjust(1)
+        
+        await callback.message.answer(
+            "Выберите, какие работы выгрузить.\n\n"
+            "Для выгрузки за период используйте команду:\n"
+            "/export [all|essay|presentation] [с ГГГГ-ММ-ДД] [по ГГГГ-ММ-ДД]",
+            reply_markup=builder.as_markup()
+        )
+    
+    elif action == "similarity":
+        await callback.message.answer("Построение отчета о схожести эссе...")
+        await send_similarity_report(callback.message.chat.id)
+    
+    elif action == "similar_pairs":
+        await callback.message.answer(get_similarity_edges_report())
+    
+    elif action == "stats":
+        await send_stats_report(callback.message.chat.id)
+    
     elif action == "back":
         await callback.message.answer("Главное меню:", reply_markup=get_main_menu(True))
         await state.clear()
 
+# Функция для построения и отправки отчета о схожести эссе
+async def send_similarity_report(chat_id, threshold=DEFAULT_THRESHOLD):
+    try:
+        report = await build_similarity_report(threshold)
+    except Exception as e:
+        logging.error("Ошибка при построении отчета о схожести: %s", e)
+        await bot.send_message(chat_id, "Произошла ошибка при построении отчета. Пожалуйста, попробуйте позже.")
+        return
+    
+    await send_text_report(chat_id, report, "similarity_report")
+
+# Функция для отправки отчета: длинный отчет не помещается в сообщение — отправляем файлом
+async def send_text_report(chat_id, report, file_prefix):
+    if len(report) > 4000:
+        report_name = f"{file_prefix}_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.txt"
+        await bot.send_document(chat_id, BufferedInputFile(report.encode("utf-8"), filename=report_name))
+    else:
+        await bot.send_message(chat_id, report)
+
+# Функция для отправки статистики сдачи работ (из материализованных представлений, без пересчета)
+async def send_stats_report(chat_id):
+    try:
+        report = build_stats_report()
+    except Exception as e:
+        session.rollback()
+        logging.error("Ошибка при построении статистики: %s", e)
+        await bot.send_message(chat_id, "Произошла ошибка при построении статистики. Пожалуйста, попробуйте позже.")
+        return
+    await send_text_report(chat_id, report, "stats")
+
+# Команда для просмотра статистики сдачи работ
+@router.message(Command("stats"))
+async def cmd_stats(message: Message):
+    user = session.query(User).filter(User.telegram_id == message.from_user.id).first()
+    if not user or not user.is_admin:
+        await message.answer("У вас нет прав администратора.")
+        return
+    
+    await send_stats_report(message.chat.id)
+
+# Команда для построения отчета о схожести с заданным порогом (в процентах)
+@router.message(Command("similarity_report"))
+async def cmd_similarity_report(message: Message):
+    user = session.query(User).filter(User.telegram_id == message.from_user.id).first()
+    if not user or not user.is_admin:
+        await message.answer("У вас нет прав администратора.")
+        return
+    
+    args = message.text.split()[1:]
+    try:
+        threshold = float(args[0]) / 100 if args else DEFAULT_THRESHOLD
+    except ValueError:
+        await message.answer("Порог должен быть числом в процентах, например: /similarity_report 40")
+        return
+    
+    await message.answer("Построение отчета о схожести эссе...")
+    await send_similarity_report(message.chat.id, threshold)
+
+# Обработчик выбора типа работ для выгрузки
+@router.callback_query(F.data.startswith("export:"))
+async def process_export(callback: CallbackQuery):
+    await callback.answer()
+    user = session.query(User).filter(User.telegram_id == callback.from_user.id).first()
+    if not user or not user.is_admin:
+        await callback.message.answer("У вас нет прав администратора.")
+        return
+    
+    file_type = callback.data.split(":")[1]
+    try:
+        await export_submissions(bot, storage_router, callback.message.chat.id, None if file_type == "all" else file_type)
+    except Exception as e:
+        logging.error("Ошибка при выгрузке работ: %s", e)
+        await callback.message.answer("Произошла ошибка при выгрузке работ. Пожалуйста, попробуйте позже.")
+
+# Команда для внеочередной сверки Яндекс.Диска с БД
+@router.message(Command("reconcile"))
+async def cmd_reconcile(message: Message):
+    user = session.query(User).filter(User.telegram_id == message.from_user.id).first()
+    if not user or not user.is_admin:
+        await message.answer("У вас нет прав администратора.")
+        return
+    
+    await message.answer("Сверка Яндекс.Диска с базой данных запущена...")
+    results = await reconcile_all(storage_router)
+    
+    # Сессия бота могла хранить удаленные сверкой записи
+    session.expire_all()
+    report = []
+    for name, stats in results.items():
+        if isinstance(stats, Exception):
+            report.append(f"Аккаунт {name}: ошибка при сверке, попробуйте позже.")
+            continue
+        report.append(
+            f"Аккаунт {name}: сверка завершена за {stats['seconds']} с.\n"
+            f"Файлов на диске: {stats['files']}\n"
+            f"Удалено записей о несуществующих файлах: {stats['deleted']}\n"
+            f"Обновлено переименованных файлов: {stats['renamed']}\n"
+            f"Файлов без записи в базе: {stats['untracked']}"
+        )
+    await message.answer("\n\n".join(report))
+
+# Команда для выгрузки работ с фильтром по типу и дате
+@router.message(Command("export"))
+async def cmd_export(message: Message):
+    user = session.query(User).filter(User.telegram_id == message.from_user.id).first()
+    if not user or not user.is_admin:
+        await message.answer("У вас нет прав администратора.")
+        return
+    
+    args = message.text.split()[1:]
+    file_type = args[0] if args else "all"
+    if file_type not in ("all", "essay", "presentation"):
+        await message.answer("Тип должен быть одним из: all, essay, presentation.")
+        return
+    
+    try:
+        date_from = datetime.strptime(args[1], "%Y-%m-%d") if len(args) > 1 else None
+        date_to = datetime.strptime(args[2], "%Y-%m-%d") + timedelta(days=1) if len(args) > 2 else None
+    except ValueError:
+        await message.answer("Некорректная дата. Используйте формат ГГГГ-ММ-ДД.")
+        return
+    
+    try:
+        await export_submissions(bot, storage_router, message.chat.id, None if file_type == "all" else file_type, date_from, date_to)
+    except Exception as e:
+        logging.error("Ошибка при выгрузке работ: %s", e)
+        await message.answer("Произошла ошибка при выгрузке работ. Пожалуйста, попробуйте позже.")
+
 # Обработчик настройки шаблона
 @router.message(AdminStates.waiting_for_template)
 async def process_template(message: Message, state: FSMContext):
@@ -960,7 +1469,8 @@ async def cmd_make_admin(message: Message):
         await message.answer("Администратор уже существует. Только текущий администратор может назначать новых.")
 
 # Запуск бота
-async def main():
+# Функция для подготовки базы данных: создание таблиц и настроек по умолчанию
+def prepare_database():
     # Инициализация базы данных
     init_db()
     
@@ -977,9 +1487,282 @@ async def main():
         session.add(template)
     
     session.commit()
+
+# Подготовка БД в процессе-обработчике: схема уже обновлена супервизором, загружаются только словари сжатия
+def connect_database():
+    load_compression_dictionaries(session)
+    session.commit()
+
+# Функция ожидания базы данных: повторные попытки до истечения DB_STARTUP_TIMEOUT
+# migrate=False — только подключение (процессы-обработчики): миграции и проверку аккаунтов выполняет супервизор
+async def wait_for_database(migrate=True):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + DB_STARTUP_TIMEOUT
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            # Время одной попытки ограничено connect_timeout движка БД
+            await asyncio.to_thread(prepare_database if migrate else connect_database)
+            health.set_check("database", True)
+            break
+        except Exception as e:
+            session.rollback()
+            health.set_check("database", False, str(e))
+            if loop.time() >= deadline:
+                raise RuntimeError(f"База данных недоступна после {attempt} попыток: {e}")
+            logging.warning("База данных недоступна (попытка %s), повтор через 2 секунды: %s", attempt, e)
+            await asyncio.sleep(2)
     
-    # Запуск бота
-    await dp.start_polling(bot)
+    if not migrate:
+        return
+    # Неверная настройка аккаунтов — ошибка запуска, а не KeyError при обращении к файлам
+    shard_names = [row.storage_shard for row in session.query(UploadedFile.storage_shard).distinct()]
+    storage_router.check_configured(shard_names)
+
+# Функция проверки токена Яндекс.Диска; не блокирует запуск, результат виден в /readyz
+# Проверяется отдельно для каждого аккаунта
+async def check_yadisk_token(shard):
+    check_name = f"yadisk:{shard.name}"
+    while True:
+        try:
+            valid = await asyncio.wait_for(shard.call("check_token"), timeout=YADISK_CHECK_TIMEOUT)
+            if valid:
+                health.set_check(check_name, True)
+                logging.info("Successfully connected to Yandex.Disk account %s", shard.name)
+                return
+            # Неверный токен не исправится повторными попытками
+            health.set_check(check_name, False, "Invalid Yandex.Disk token")
+            logging.error("Failed to initialize Yandex.Disk client %s: Invalid Yandex.Disk token", shard.name)
+            return
+        except Exception as e:
+            health.set_check(check_name, False, str(e) or "timeout")
+            logging.warning("Аккаунт Яндекс.Диска %s недоступен, повторная проверка через 30 секунд: %s", shard.name, e)
+            await asyncio.sleep(30)
+
+# Функция для сохранения незавершенной работы (выполняется в отдельном потоке со своей сессией)
+def save_pending_jobs(jobs):
+    db = SessionLocal()
+    try:
+        for kind, payload in jobs:
+            db.add(PendingJob(kind=kind, payload=json.dumps(payload, ensure_ascii=False)))
+        db.commit()
+    finally:
+        db.close()
+
+# Функция для получения и удаления незавершенной работы, сохраненной при прошлой остановке
+# partition — (номер процесса, число процессов): процесс-обработчик берет только загрузки своих пользователей,
+# сообщения в лог-чат достаются первому процессу
+def take_pending_jobs(partition=None):
+    db = SessionLocal()
+    try:
+        jobs = []
+        job_ids = []
+        for job in db.query(PendingJob).order_by(PendingJob.id).all():
+            payload = json.loads(job.payload)
+            if partition:
+                index, workers = partition
+                owner = partition_for_user(payload["user_id"], workers) if "user_id" in payload else 0
+                if owner != index:
+                    continue
+            jobs.append((job.kind, payload))
+            job_ids.append(job.id)
+        db.query(PendingJob).filter(PendingJob.id.in_(job_ids)).delete(synchronize_session=False)
+        db.commit()
+        return jobs
+    finally:
+        db.close()
+
+# Функция для продолжения загрузки, прерванной остановкой бота
+async def resume_upload(payload):
+    lifecycle.add_task(asyncio.current_task())
+    chat_id = payload["chat_id"]
+    user_id = payload["user_id"]
+    yadisk_path = payload["yadisk_path"]
+    user = session.query(User).filter(User.telegram_id == user_id).first()
+    if not user:
+        return
+    
+    logging.info("Продолжение прерванной загрузки: %s", yadisk_path)
+    try:
+        await bot.send_message(chat_id, "Бот был перезапущен во время загрузки вашего файла. Загрузка продолжается...")
+        # Файл мог успеть загрузиться на диск до остановки — тогда он перезаписывается
+        shard = storage_router.get(payload.get("shard"))
+        replace = payload["replace"] or await shard.exists(yadisk_path)
+        await upload_file(
+            chat_id, user, user_id, payload["file_id"], payload["file_size"], payload["file_type"], shard, yadisk_path,
+            replace=replace
+        )
+        # Состояние диалога прерванной загрузки больше не актуально
+        await dp.fsm.get_context(bot, chat_id=chat_id, user_id=user_id).clear()
+    except Exception as e:
+        logging.error("Ошибка при продолжении загрузки %s: %s", yadisk_path, e)
+
+# Функция для продолжения работы, сохраненной при прошлой остановке
+async def resume_pending_jobs(partition=None):
+    try:
+        jobs = await asyncio.to_thread(take_pending_jobs, partition)
+    except Exception as e:
+        logging.error("Ошибка при чтении незавершенной работы: %s", e)
+        return
+    if jobs:
+        logging.info("Продолжение незавершенной работы после перезапуска: %s", len(jobs))
+    for kind, payload in jobs:
+        if kind == "upload":
+            asyncio.create_task(resume_upload(payload))
+        elif kind == "log_message":
+            await send_log_message(payload["text"])
+
+# Остановка бота: вызывается после прекращения получения обновлений (SIGTERM/SIGINT),
+# пока сессия бота еще открыта и пользователям можно отправить результат загрузки
+async def on_shutdown():
+    health.set_ready(False)
+    unfinished = await lifecycle.drain()
+    
+    # Сообщения, поставленные в очередь завершившимися загрузками, отправляются в оставшееся время
+    try:
+        await asyncio.wait_for(log_queue.join(), timeout=max(lifecycle.remaining(), 1))
+    except asyncio.TimeoutError:
+        logging.warning("Не все сообщения в лог-чат отправлены до остановки: %s", log_queue.qsize())
+    while not log_queue.empty():
+        unfinished.append(("log_message", {"text": log_queue.get_nowait()}))
+    
+    if unfinished:
+        try:
+            await asyncio.to_thread(save_pending_jobs, unfinished)
+            logging.info("Незавершенная работа сохранена для продолжения после перезапуска: %s", len(unfinished))
+        except Exception as e:
+            logging.error("Ошибка при сохранении незавершенной работы: %s", e)
+
+# Общие ограничения делятся между процессами-обработчиками, чтобы вместе они не превышали заданных значений
+def share_limits(workers):
+    spool.quota //= workers
+    transfer_scheduler.max_concurrent = max(1, transfer_scheduler.max_concurrent // workers)
+    transfer_scheduler.bucket.rate /= workers
+    for shard in storage_router.shards.values():
+        shard.bucket.rate /= workers
+
+# Точка входа процесса-обработчика; остановкой управляет супервизор, поэтому SIGINT игнорируется
+def worker_process(index, workers, updates):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(run_worker(index, workers, updates))
+
+# Процесс-обработчик: получает обновления своих пользователей от супервизора.
+# Сверка с Яндекс.Диском и пересчет статистики выполняются только супервизором,
+# поэтому локальный индекс файлов здесь не заполняется и наличие файлов проверяется через API
+async def run_worker(index, workers, updates):
+    share_limits(workers)
+    await wait_for_database(migrate=False)
+    
+    asyncio.create_task(storage_router.run_quota_refresh(YADISK_QUOTA_INTERVAL))
+    asyncio.create_task(spool.run_sweeper(int(os.getenv("SPOOL_SWEEP_INTERVAL", "60"))))
+    asyncio.create_task(run_log_sender())
+    await resume_pending_jobs(partition=(index, workers))
+    
+    dp.shutdown.register(on_shutdown)
+    logging.info("Процесс-обработчик %s из %s готов к обработке обновлений", index, workers)
+    try:
+        await feed_updates(dp, bot, updates)
+        await dp.emit_shutdown(bot=bot)
+    finally:
+        await bot.session.close()
+
+# Супервизор: получает обновления и распределяет их по процессам-обработчикам
+async def run_supervisor(workers):
+    health_port = os.getenv("HEALTH_PORT", "8080")
+    if health_port:
+        await start_health_server(health, "0.0.0.0", int(health_port))
+    
+    for shard in storage_router.shards.values():
+        asyncio.create_task(check_yadisk_token(shard))
+    # Миграции применяются до запуска обработчиков, чтобы они не выполнялись одновременно в нескольких процессах
+    await wait_for_database()
+    
+    asyncio.create_task(run_reconciliation(storage_router, RECONCILE_INTERVAL))
+    asyncio.create_task(run_stats_refresh(int(os.getenv("STATS_REFRESH_INTERVAL", "300"))))
+    
+    pool = WorkerPool(workers, worker_process)
+    pool.start()
+    monitor = asyncio.create_task(pool.run_monitor())
+    
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    
+    allowed_updates = dp.resolve_used_update_types()
+    intake = None
+    webhook_runner = None
+    if WEBHOOK_URL:
+        webhook_runner = await start_webhook_server(bot, pool, "0.0.0.0", WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET)
+        await bot.set_webhook(
+            WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET, allowed_updates=allowed_updates
+        )
+    else:
+        await bot.delete_webhook()
+        intake = PollingIntake(bot, pool, allowed_updates)
+        intake_task = asyncio.create_task(intake.run())
+    logging.info("Супервизор запущен: процессов-обработчиков %s, получение обновлений: %s", workers, "webhook" if WEBHOOK_URL else "long polling")
+    health.set_ready(True)
+    
+    try:
+        await stop.wait()
+    finally:
+        health.set_ready(False)
+        # Новые обновления больше не принимаются, уже переданные обработчикам завершаются ими
+        if intake:
+            intake_task.cancel()
+            await intake.confirm()
+        if webhook_runner:
+            await webhook_runner.cleanup()
+        monitor.cancel()
+        await pool.stop(lifecycle.drain_timeout + 10)
+        await bot.session.close()
+
+async def main():
+    # Несколько процессов или webhook — запуск супервизора
+    if BOT_WORKERS > 1 or WEBHOOK_URL:
+        await run_supervisor(BOT_WORKERS)
+        return
+    
+    # Сервер проверок состояния поднимается первым: живость видна сразу, готовность — после БД
+    health_port = os.getenv("HEALTH_PORT", "8080")
+    if health_port:
+        await start_health_server(health, "0.0.0.0", int(health_port))
+    
+    # Токен Яндекс.Диска проверяется параллельно с подготовкой БД
+    for shard in storage_router.shards.values():
+        asyncio.create_task(check_yadisk_token(shard))
+    await wait_for_database()
+    
+    # Периодическая сверка Яндекс.Диска с БД, заодно заполняет локальные индексы файлов
+    asyncio.create_task(run_reconciliation(storage_router, RECONCILE_INTERVAL))
+    
+    # Периодический пересчет статистики сдачи работ
+    asyncio.create_task(run_stats_refresh(int(os.getenv("STATS_REFRESH_INTERVAL", "300"))))
+    
+    # Периодическое обновление данных о свободном месте на аккаунтах
+    asyncio.create_task(storage_router.run_quota_refresh(YADISK_QUOTA_INTERVAL))
+    
+    # Периодическая очистка временных файлов
+    asyncio.create_task(spool.run_sweeper(int(os.getenv("SPOOL_SWEEP_INTERVAL", "60"))))
+    
+    # Отправка сообщений в лог-чат и продолжение работы, прерванной прошлой остановкой
+    asyncio.create_task(run_log_sender())
+    await resume_pending_jobs()
+    
+    # Запуск бота; сигналы SIGTERM/SIGINT останавливают получение обновлений, затем вызывается on_shutdown.
+    # После этого полученные обновления подтверждаются, чтобы они не были обработаны повторно после перезапуска
+    offsets = UpdateOffsetMiddleware()
+    dp.update.outer_middleware(offsets)
+    dp.shutdown.register(on_shutdown)
+    health.set_ready(True)
+    try:
+        await dp.start_polling(bot, close_bot_session=False)
+    finally:
+        health.set_ready(False)
+        await confirm_updates(bot, offsets.offset)
+        await bot.session.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,178 @@
+import json
+import os
+import sys
+
+from sqlalchemy import func, or_, text
+from sqlalchemy.dialects import postgresql
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database import SessionLocal, User, UploadedFile, SimilarityEdge, FileChunk
+
+# Проверка планов горячих запросов: таблицы заполняются большим объемом тестовых данных
+# внутри транзакции, для каждого запроса выполняется EXPLAIN, затем транзакция откатывается.
+# Скрипт завершается с кодом 1, если какой-либо запрос читает таблицу последовательным сканированием.
+# Запуск: python check_query_plans.py [число пользователей]
+
+SEED_USERS = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+SEED_TELEGRAM_ID = 9_000_000_000
+
+# Таблицы, для которых последовательное сканирование считается ошибкой
+CHECKED_TABLES = {"users", "uploaded_files", "similarity_edges", "file_chunks"}
+
+
+# Функция для заполнения таблиц тестовыми данными
+def seed(db):
+    db.execute(text("""
+        INSERT INTO users (telegram_id, full_name, is_admin, created_at)
+        SELECT :base + g, 'Seed User ' || g, false, now()
+        FROM generate_series(1, :count) AS g
+    """), {"base": SEED_TELEGRAM_ID, "count": SEED_USERS})
+    db.execute(text("""
+        INSERT INTO uploaded_files (user_id, file_name, file_type, file_content, file_path, created_at)
+        SELECT u.id, t.name || '.docx', t.type, '\\x00'::bytea || convert_to('seed', 'UTF8'), '/PKS12_SocialStudy/' || u.full_name || '/' || t.name || '.docx', now()
+        FROM users u
+        CROSS JOIN (VALUES ('essay', 'Эссе'), ('presentation', 'Презентация')) AS t(type, name)
+        WHERE u.telegram_id > :base
+    """), {"base": SEED_TELEGRAM_ID})
+    db.execute(text("""
+        INSERT INTO similarity_edges (file_id, similar_file_id, similarity, updated_at)
+        SELECT f.id, f.id + 2, 42.0, now()
+        FROM uploaded_files f
+        JOIN users u ON u.id = f.user_id
+        WHERE u.telegram_id > :base AND f.file_type = 'essay' AND f.id % 10 = 0
+          AND EXISTS (SELECT 1 FROM uploaded_files other WHERE other.id = f.id + 2)
+    """), {"base": SEED_TELEGRAM_ID})
+    # Отпечатки: у каждого файла 20 фрагментов, у соседних файлов половина фрагментов общая
+    db.execute(text("""
+        INSERT INTO file_chunks (file_id, chunk_hash)
+        SELECT f.id, (f.id / 2) * 1000 + g + CASE WHEN g > 10 THEN f.id % 2 * 100 ELSE 0 END
+        FROM uploaded_files f
+        JOIN users u ON u.id = f.user_id
+        CROSS JOIN generate_series(1, 20) AS g
+        WHERE u.telegram_id > :base
+    """), {"base": SEED_TELEGRAM_ID})
+    db.execute(text("UPDATE uploaded_files SET chunk_count = 20 WHERE id IN (SELECT file_id FROM file_chunks)"))
+    db.execute(text("ANALYZE users"))
+    db.execute(text("ANALYZE uploaded_files"))
+    db.execute(text("ANALYZE similarity_edges"))
+    db.execute(text("ANALYZE file_chunks"))
+
+
+# Горячие запросы бота в том виде, в котором они выполняются в обработчиках
+def hot_queries(db, sample):
+    return {
+        "пользователь по telegram_id": db.query(User).filter(User.telegram_id == sample.telegram_id),
+        "запись файла при замене": db.query(UploadedFile).filter(
+            UploadedFile.user_id == sample.user_id,
+            UploadedFile.file_path == sample.file_path
+        ),
+        "файлы пользователя по типу": db.query(UploadedFile.id).filter(
+            UploadedFile.user_id == sample.user_id,
+            UploadedFile.file_type == "essay"
+        ),
+        "аккаунт Яндекс.Диска пользователя": db.query(UploadedFile.storage_shard).filter(
+            UploadedFile.user_id == sample.user_id
+        ).order_by(UploadedFile.id.desc()).limit(1),
+        "пары похожих файлов": db.query(SimilarityEdge).filter(
+            or_(SimilarityEdge.file_id == sample.file_id, SimilarityEdge.similar_file_id == sample.file_id)
+        ),
+        "файлы с общими фрагментами": chunk_matches_query(db, sample),
+    }
+
+
+# Запросы, которые читают большую часть таблицы и поэтому ожидаемо выполняются последовательным сканированием:
+# планы печатаются, но ошибкой не считаются. Проверка схожести эссе (check_similarity) сравнивает новый текст
+# со всеми эссе других пользователей — индекс здесь не поможет, время проверки ограничено SIMILARITY_TIME_BUDGET
+def scanning_queries(db, sample):
+    return {
+        "эссе других пользователей для проверки схожести": db.query(
+            UploadedFile.id,
+            UploadedFile.file_name,
+            UploadedFile.user_id,
+            UploadedFile.file_content
+        ).filter(
+            UploadedFile.user_id != sample.user_id,
+            UploadedFile.file_type == "essay",
+            UploadedFile.file_content.isnot(None)
+        ),
+    }
+
+
+# Функция для получения плана запроса
+def explain(db, query):
+    sql = str(query.statement.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+    raw_plan = db.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+    return (raw_plan if isinstance(raw_plan, list) else json.loads(raw_plan))[0]["Plan"]
+
+
+# Поиск файлов с общими фрагментами в том виде, в котором он выполняется при загрузке (find_chunk_matches)
+def chunk_matches_query(db, sample):
+    chunk_hashes = [row.chunk_hash for row in db.query(FileChunk.chunk_hash).filter(FileChunk.file_id == sample.file_id)]
+    shared = db.query(
+        FileChunk.file_id,
+        func.count().label("shared")
+    ).filter(FileChunk.chunk_hash.in_(chunk_hashes)).group_by(FileChunk.file_id).subquery()
+    return db.query(
+        UploadedFile.id,
+        UploadedFile.file_name,
+        UploadedFile.user_id,
+        UploadedFile.chunk_count,
+        shared.c.shared
+    ).join(shared, shared.c.file_id == UploadedFile.id).filter(
+        UploadedFile.user_id != sample.user_id,
+        UploadedFile.file_type == "presentation"
+    )
+
+
+# Функция для поиска узлов последовательного сканирования в плане
+def find_seq_scans(plan):
+    found = []
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") in CHECKED_TABLES:
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found.extend(find_seq_scans(child))
+    return found
+
+
+def main():
+    db = SessionLocal()
+    failures = []
+    try:
+        print(f"Заполнение таблиц тестовыми данными: {SEED_USERS} пользователей...")
+        seed(db)
+        sample = db.execute(text("""
+            SELECT u.telegram_id, f.user_id, f.file_path, f.id AS file_id
+            FROM uploaded_files f JOIN users u ON u.id = f.user_id
+            WHERE u.telegram_id > :base
+            ORDER BY f.id DESC LIMIT 1
+        """), {"base": SEED_TELEGRAM_ID}).first()
+
+        for name, query in hot_queries(db, sample).items():
+            plan = explain(db, query)
+            seq_scans = find_seq_scans(plan)
+            if seq_scans:
+                failures.append(name)
+                print(f"ОШИБКА: {name} — последовательное сканирование {', '.join(seq_scans)}")
+                print(json.dumps(plan, ensure_ascii=False, indent=2))
+            else:
+                print(f"OK: {name} — {plan['Node Type']}")
+
+        for name, query in scanning_queries(db, sample).items():
+            plan = explain(db, query)
+            seq_scans = find_seq_scans(plan)
+            scan_note = f"последовательное сканирование {', '.join(seq_scans)}" if seq_scans else plan["Node Type"]
+            print(f"ОЖИДАЕМО: {name} — {scan_note} (читает большую часть таблицы)")
+    finally:
+        db.rollback()
+        db.close()
+
+    if failures:
+        print(f"Запросов с последовательным сканированием: {len(failures)}")
+        sys.exit(1)
+    print("Все горячие запросы используют индексы.")
+
+
+if __name__ == "__main__":
+    main()
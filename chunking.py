@@ -0,0 +1,123 @@
+import hashlib
+import heapq
+
+import numpy as np
+
+# Разбиение файла на фрагменты по содержимому (FastCDC): границы определяются скользящим хешем Gear,
+# поэтому изменение в одном месте файла (например, титульный слайд) меняет только соседние фрагменты,
+# а хеши остальных совпадают с хешами исходного файла
+
+MIN_SIZE = 2 * 1024
+NORMAL_SIZE = 8 * 1024
+MAX_SIZE = 64 * 1024
+
+# Максимальное число хешей в отпечатке: у больших файлов сохраняются наименьшие хеши (bottom-k),
+# файлы до ~64 МБ помещаются целиком
+MAX_CHUNK_HASHES = 8192
+
+# Таблица Gear: 256 псевдослучайных 32-битных чисел; фиксирована, чтобы границы не менялись между запусками
+GEAR = np.array(
+    [int.from_bytes(hashlib.blake2b(bytes([value]), digest_size=4).digest(), "little") for value in range(256)],
+    dtype=np.uint32
+)
+
+# Маски FastCDC: до NORMAL_SIZE граница ищется по более строгой маске, после — по более мягкой,
+# что сужает разброс размеров фрагментов. Старшие биты хеша зависят от окна из 18 и более байт
+MASK_STRICT = np.uint32(((1 << 15) - 1) << 17)
+MASK_LOOSE = np.uint32(((1 << 11) - 1) << 21)
+
+# Хеш Gear h = (h << 1) + GEAR[byte] в 32 битах зависит только от последних 32 байт,
+# поэтому считается блоками: сумма GEAR[byte] << k по окну без цикла по байтам
+WINDOW = 32
+BLOCK_SIZE = 1024 * 1024
+
+
+# Позиции концов фрагментов, подходящих под строгую и мягкую маски, для блока данных block,
+# начинающегося в файле с позиции offset; tail — до WINDOW - 1 байт, предшествующих блоку
+def _cut_candidates(tail, block, offset):
+    values = GEAR[np.frombuffer(tail + block, dtype=np.uint8)]
+    hashes = values.copy()
+    for shift in range(1, WINDOW):
+        hashes[shift:] += values[:-shift] << np.uint32(shift)
+    hashes = hashes[len(tail):]
+    strict = np.flatnonzero((hashes & MASK_STRICT) == 0) + offset + 1
+    loose = np.flatnonzero((hashes & MASK_LOOSE) == 0) + offset + 1
+    return strict, loose
+
+
+# Первый кандидат в диапазоне [low, high) или None
+def _first(candidates, low, high):
+    index = np.searchsorted(candidates, low)
+    if index < len(candidates) and candidates[index] < high:
+        return int(candidates[index])
+    return None
+
+
+# Потоковое построение отпечатка: данные подаются блоками через update(), в памяти остается только
+# незавершенный фрагмент (не больше MAX_SIZE байт) и последний блок. Граница фрагмента выбирается,
+# когда после его начала прочитано MAX_SIZE байт или данные закончились, поэтому результат
+# не зависит от размера блоков. digest() возвращает отсортированные 64-битные хеши различных фрагментов
+class ChunkFingerprinter:
+    def __init__(self):
+        self.buffer = bytearray()
+        self.offset = 0
+        self.tail = b""
+        self.strict = np.empty(0, dtype=np.int64)
+        self.loose = np.empty(0, dtype=np.int64)
+        self.boundaries = []
+        self.hashes = set()
+
+    def update(self, data):
+        view = memoryview(data)
+        for start in range(0, len(view), BLOCK_SIZE):
+            block = bytes(view[start:start + BLOCK_SIZE])
+            position = self.offset + len(self.buffer)
+            strict, loose = _cut_candidates(self.tail, block, position)
+            self.strict = np.concatenate((self.strict, strict))
+            self.loose = np.concatenate((self.loose, loose))
+            self.tail = (self.tail + block)[-(WINDOW - 1):]
+            self.buffer += block
+            self._cut(final=False)
+
+    def _cut(self, final):
+        size = self.offset + len(self.buffer)
+        start = self.offset
+        while start < size and (final or size - start >= MAX_SIZE):
+            if size - start <= MIN_SIZE:
+                end = size
+            else:
+                end = _first(self.strict, start + MIN_SIZE, min(start + NORMAL_SIZE, size))
+                if end is None:
+                    end = _first(self.loose, start + NORMAL_SIZE, min(start + MAX_SIZE, size))
+                if end is None:
+                    end = min(start + MAX_SIZE, size)
+            with memoryview(self.buffer) as view:
+                digest = hashlib.blake2b(view[start - self.offset:end - self.offset], digest_size=8).digest()
+            self.hashes.add(int.from_bytes(digest, "little", signed=True))
+            self.boundaries.append(end)
+            start = end
+        del self.buffer[:start - self.offset]
+        self.offset = start
+        self.strict = self.strict[np.searchsorted(self.strict, start):]
+        self.loose = self.loose[np.searchsorted(self.loose, start):]
+
+    def digest(self):
+        self._cut(final=True)
+        if len(self.hashes) > MAX_CHUNK_HASHES:
+            return heapq.nsmallest(MAX_CHUNK_HASHES, self.hashes)
+        return sorted(self.hashes)
+
+
+# Функция для разбиения данных на фрагменты; возвращает позиции концов фрагментов
+def chunk_boundaries(data):
+    fingerprinter = ChunkFingerprinter()
+    fingerprinter.update(data)
+    fingerprinter.digest()
+    return fingerprinter.boundaries
+
+
+# Функция для построения отпечатка данных, целиком находящихся в памяти
+def chunk_fingerprints(data):
+    fingerprinter = ChunkFingerprinter()
+    fingerprinter.update(data)
+    return fingerprinter.digest()
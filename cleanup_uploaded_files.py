@@ -0,0 +1,60 @@
+import os
+import sys
+
+from sqlalchemy import text
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database import SessionLocal
+
+# Удаление записей uploaded_files, из-за которых останавливается миграция 0002: записи пользователей,
+# удаленных вручную, и дубликаты одного пути (остается последняя запись). Файлы на Яндекс.Диске не трогаются.
+# Запросы написаны на SQL, так как схема БД еще не обновлена до текущих моделей.
+# Запуск: python cleanup_uploaded_files.py — показать записи; python cleanup_uploaded_files.py --apply — удалить
+
+APPLY = "--apply" in sys.argv[1:]
+
+ORPHANS_QUERY = """
+    SELECT id, user_id, file_type, file_path, created_at FROM uploaded_files
+    WHERE user_id NOT IN (SELECT id FROM users)
+    ORDER BY id
+"""
+
+DUPLICATES_QUERY = """
+    SELECT older.id, older.user_id, older.file_type, older.file_path, older.created_at FROM uploaded_files older
+    WHERE EXISTS (
+        SELECT 1 FROM uploaded_files newer
+        WHERE newer.user_id = older.user_id AND newer.file_path = older.file_path AND newer.id > older.id
+    )
+    ORDER BY older.id
+"""
+
+
+def main():
+    db = SessionLocal()
+    try:
+        rows = {}
+        for title, query in (("Записи удаленных пользователей", ORPHANS_QUERY), ("Дубликаты пути", DUPLICATES_QUERY)):
+            found = db.execute(text(query)).all()
+            print(f"{title}: {len(found)}")
+            for row in found:
+                print(f"  id={row.id} user_id={row.user_id} {row.file_type} {row.file_path} ({row.created_at})")
+                rows[row.id] = row
+
+        if not rows:
+            print("Записей для удаления нет.")
+            return
+        if not APPLY:
+            print(f"Будет удалено записей: {len(rows)}. Для удаления запустите с --apply")
+            return
+
+        db.execute(text("DELETE FROM uploaded_files WHERE id = ANY(:ids)"), {"ids": list(rows)})
+        db.commit()
+        print(f"Удалено записей: {len(rows)}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
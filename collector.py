@@ -0,0 +1,46 @@
+import asyncio
+import logging
+
+
+# Сборщик документов, пришедших почти одновременно (альбом или несколько файлов подряд)
+# Документы с одним ключом накапливаются, пока между ними проходит меньше delay секунд,
+# после чего вся группа передается в on_flush одним списком. Группы одного ключа обрабатываются по очереди
+class DocumentCollector:
+    def __init__(self, delay, on_flush):
+        self.delay = delay
+        self.on_flush = on_flush
+        self.buffers = {}
+        self.tasks = {}
+        self.flushing = {}
+
+    def add(self, key, item):
+        self.buffers.setdefault(key, []).append(item)
+        # Ожидание перезапускается с каждым новым документом; уже начатая обработка не прерывается
+        task = self.tasks.pop(key, None)
+        if task:
+            task.cancel()
+        self.tasks[key] = asyncio.create_task(self._flush_later(key))
+
+    async def _flush_later(self, key):
+        await asyncio.sleep(self.delay)
+        # Группа забирается из буфера целиком, без переключения задач: документы, пришедшие во время
+        # обработки, попадают в новую группу и не меняют уже переданную в on_flush
+        current = asyncio.current_task()
+        if self.tasks.get(key) is current:
+            del self.tasks[key]
+        items = self.buffers.pop(key, [])
+        if not items:
+            return
+        # Новая группа ждет окончания обработки предыдущей группы того же ключа
+        previous = self.flushing.get(key)
+        self.flushing[key] = current
+        try:
+            if previous:
+                await asyncio.wait([previous])
+            await self.on_flush(key, items)
+        except Exception as e:
+            logging.error("Ошибка при обработке группы документов %s: %s", key, e)
+            logging.exception("Подробности ошибки:")
+        finally:
+            if self.flushing.get(key) is current:
+                del self.flushing[key]
@@ -0,0 +1,140 @@
+import logging
+import os
+import threading
+import zlib
+
+from sqlalchemy import LargeBinary
+from sqlalchemy.types import TypeDecorator
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Первый байт сохраненного значения — способ сжатия
+CODEC_RAW = 0x00
+CODEC_ZLIB = 0x01
+CODEC_ZSTD = 0x02
+CODEC_ZSTD_DICT = 0x03
+
+# Короткие тексты хранятся без сжатия: выигрыша нет, а одинаковый текст всегда дает одинаковые байты,
+# поэтому сравнение в SQL (например, с заглушкой нечитаемого файла) продолжает работать
+MIN_COMPRESS_SIZE = 256
+
+ZSTD_LEVEL = int(os.getenv("CONTENT_ZSTD_LEVEL", "9"))
+ZLIB_LEVEL = 6
+
+# Словари zstd по их идентификатору (идентификатор записан в каждом сжатом кадре)
+# Словари хранятся в БД (см. train_content_dict.py), новые словари подгружаются через _loader
+_dictionaries = {}
+_current_dict_id = None
+_loader = None
+_lock = threading.Lock()
+# Объекты zstd нельзя использовать из нескольких потоков одновременно — у каждого потока свои
+_local = threading.local()
+
+
+# Регистрация словаря; current — использовать его для сжатия новых значений
+def register_dictionary(data, current=False):
+    global _current_dict_id
+    if zstandard is None:
+        return None
+    dictionary = zstandard.ZstdCompressionDict(data)
+    dict_id = dictionary.dict_id()
+    with _lock:
+        _dictionaries[dict_id] = dictionary
+        if current:
+            _current_dict_id = dict_id
+    return dict_id
+
+
+# Установка функции загрузки словаря, которого еще нет в памяти: по идентификатору возвращает данные или None
+def set_dictionary_loader(loader):
+    global _loader
+    _loader = loader
+
+
+def current_dictionary_id():
+    return _current_dict_id
+
+
+def _get_dictionary(dict_id):
+    dictionary = _dictionaries.get(dict_id)
+    if dictionary is None and _loader is not None:
+        data = _loader(dict_id)
+        if data is not None:
+            register_dictionary(data)
+            dictionary = _dictionaries.get(dict_id)
+            logging.info("Загружен словарь сжатия содержимого файлов %s", dict_id)
+    if dictionary is None:
+        raise ValueError(f"Словарь сжатия {dict_id} не найден")
+    return dictionary
+
+
+def _cached(name, dict_id, factory):
+    cache = _local.__dict__.setdefault(name, {})
+    codec = cache.get(dict_id)
+    if codec is None:
+        codec = cache[dict_id] = factory()
+    return codec
+
+
+def _compressor(dict_id):
+    if dict_id is None:
+        return _cached("compressors", None, lambda: zstandard.ZstdCompressor(level=ZSTD_LEVEL))
+    dictionary = _get_dictionary(dict_id)
+    return _cached("compressors", dict_id, lambda: zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=dictionary))
+
+
+def _decompressor(dict_id):
+    if dict_id is None:
+        return _cached("decompressors", None, zstandard.ZstdDecompressor)
+    dictionary = _get_dictionary(dict_id)
+    return _cached("decompressors", dict_id, lambda: zstandard.ZstdDecompressor(dict_data=dictionary))
+
+
+# Функция для сжатия текста: zstd (с текущим словарем, если он есть), без zstandard — zlib
+def encode(text):
+    data = text.encode("utf-8")
+    if len(data) < MIN_COMPRESS_SIZE:
+        return bytes([CODEC_RAW]) + data
+    if zstandard is not None:
+        dict_id = _current_dict_id
+        codec = CODEC_ZSTD_DICT if dict_id is not None else CODEC_ZSTD
+        return bytes([codec]) + _compressor(dict_id).compress(data)
+    return bytes([CODEC_ZLIB]) + zlib.compress(data, ZLIB_LEVEL)
+
+
+# Функция для распаковки текста, сохраненного функцией encode
+def decode(value):
+    # psycopg2 возвращает bytea как memoryview — распаковываем без лишнего копирования
+    value = memoryview(value)
+    codec, payload = value[0], value[1:]
+    if codec == CODEC_RAW:
+        data = bytes(payload)
+    elif codec == CODEC_ZLIB:
+        data = zlib.decompress(payload)
+    elif codec in (CODEC_ZSTD, CODEC_ZSTD_DICT):
+        if zstandard is None:
+            raise ValueError("Для чтения содержимого, сжатого zstd, нужен пакет zstandard")
+        dict_id = zstandard.get_frame_parameters(payload).dict_id if codec == CODEC_ZSTD_DICT else None
+        data = _decompressor(dict_id).decompress(payload)
+    else:
+        raise ValueError(f"Неизвестный способ сжатия содержимого: {codec}")
+    return data.decode("utf-8")
+
+
+# Тип столбца: в Python — строка, в БД — сжатые байты
+class CompressedText(TypeDecorator):
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return encode(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return decode(value)
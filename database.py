@@ -1,9 +1,11 @@
 import os
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, func, Text, BigInteger
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, func, Text, BigInteger, Float, ForeignKey, UniqueConstraint, CheckConstraint, Index, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 
+from content_codec import CompressedText, register_dictionary, set_dictionary_loader
+
 # Загрузка переменных окружения
 load_dotenv()
 
@@ -55,26 +57,127 @@ class LogSettings(Base):
 # Модель для хранения информации о загруженных файлах
 class UploadedFile(Base):
     __tablename__ = "uploaded_files"
+    __table_args__ = (
+        UniqueConstraint("user_id", "file_path", name="uq_uploaded_files_user_id_file_path"),
+        Index("ix_uploaded_files_user_id_file_type", "user_id", "file_type"),
+    )
     
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE", name="fk_uploaded_files_user_id_users"), nullable=False)
     file_name = Column(String, nullable=False)
     file_type = Column(String, nullable=False)  # 'essay' или 'presentation'
-    file_content = Column(Text, nullable=False)  # содержимое файла для быстрого сравнения
+    file_content = Column(CompressedText, nullable=True)  # текст эссе для быстрого сравнения (сжатый; None — не сохраняется)
     file_path = Column(String, nullable=False)  # путь на Яндекс.Диске
+    storage_shard = Column(String, nullable=False, default="default", server_default="default")  # аккаунт Яндекс.Диска
+    file_size = Column(BigInteger, nullable=True)  # размер файла в байтах
+    file_md5 = Column(String, nullable=True)  # md5 файла, как его возвращает Яндекс.Диск
+    chunk_count = Column(Integer, nullable=True)  # число хешей в отпечатке файла (None — отпечаток не построен)
     created_at = Column(DateTime, default=func.now())
     
     def __repr__(self):
         return f"<UploadedFile(id={self.id}, user_id={self.user_id}, file_name={self.file_name}, file_type={self.file_type})>"
 
+# Модель для хранения найденной схожести между парами файлов
+# Пара хранится один раз: file_id всегда меньше similar_file_id
+class SimilarityEdge(Base):
+    __tablename__ = "similarity_edges"
+    __table_args__ = (
+        UniqueConstraint("file_id", "similar_file_id", name="uq_similarity_edges_pair"),
+        CheckConstraint("file_id < similar_file_id", name="ck_similarity_edges_order"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    file_id = Column(Integer, ForeignKey("uploaded_files.id", ondelete="CASCADE"), nullable=False, index=True)
+    similar_file_id = Column(Integer, ForeignKey("uploaded_files.id", ondelete="CASCADE"), nullable=False, index=True)
+    similarity = Column(Float, nullable=False)  # процент схожести
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<SimilarityEdge(file_id={self.file_id}, similar_file_id={self.similar_file_id}, similarity={self.similarity})>"
+
+# Модель для хранения отпечатков файлов: хеши фрагментов, на которые файл разбит по содержимому (см. chunking.py)
+# Индекс по chunk_hash позволяет одним запросом найти все файлы с общими фрагментами
+class FileChunk(Base):
+    __tablename__ = "file_chunks"
+    __table_args__ = (
+        Index("ix_file_chunks_chunk_hash_file_id", "chunk_hash", "file_id"),
+    )
+    
+    file_id = Column(Integer, ForeignKey("uploaded_files.id", ondelete="CASCADE"), primary_key=True)
+    chunk_hash = Column(BigInteger, primary_key=True)
+    
+    def __repr__(self):
+        return f"<FileChunk(file_id={self.file_id}, chunk_hash={self.chunk_hash})>"
+
+# Модель для хранения работы, не завершенной при остановке бота (загрузки и сообщения в лог-чат)
+# При следующем запуске работа продолжается и запись удаляется
+class PendingJob(Base):
+    __tablename__ = "pending_jobs"
+    
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)  # 'upload' или 'log_message'
+    payload = Column(Text, nullable=False)  # параметры работы в формате JSON
+    created_at = Column(DateTime, default=func.now())
+    
+    def __repr__(self):
+        return f"<PendingJob(id={self.id}, kind={self.kind})>"
+
+# Модель для хранения времени последнего пересчета статистики сдачи работ (одна строка, см. stats.py)
+# Хранится в БД, потому что пересчет выполняет один процесс, а отчет может строить любой
+class StatsRefresh(Base):
+    __tablename__ = "stats_refreshes"
+    
+    id = Column(Integer, primary_key=True)
+    refreshed_at = Column(DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f"<StatsRefresh(refreshed_at={self.refreshed_at})>"
+
+# Модель для хранения словарей zstd, на которых обучено сжатие содержимого файлов
+# id — идентификатор словаря zstd, последний добавленный словарь используется для сжатия
+class CompressionDictionary(Base):
+    __tablename__ = "compression_dictionaries"
+    
+    id = Column(BigInteger, primary_key=True, autoincrement=False)
+    data = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=func.now())
+    
+    def __repr__(self):
+        return f"<CompressionDictionary(id={self.id})>"
+
 # Создание сессии для работы с базой данных
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 session = SessionLocal()
 
+# Функция для загрузки словаря сжатия, появившегося после запуска (например, обученного на другой машине)
+def _load_dictionary(dict_id):
+    db = SessionLocal()
+    try:
+        dictionary = db.get(CompressionDictionary, dict_id)
+        return dictionary.data if dictionary else None
+    finally:
+        db.close()
+
+set_dictionary_loader(_load_dictionary)
+
+# Функция для загрузки словарей сжатия; последний словарь используется для сжатия новых значений
+def load_compression_dictionaries(db):
+    dictionaries = db.query(CompressionDictionary).order_by(CompressionDictionary.created_at).all()
+    for index, dictionary in enumerate(dictionaries):
+        register_dictionary(dictionary.data, current=index == len(dictionaries) - 1)
+
 # Функция для инициализации базы данных
 def init_db():
-    # Создание всех таблиц
-    Base.metadata.create_all(bind=engine)
+    # Применение миграций Alembic (создание таблиц, индексов и ограничений)
+    from alembic import command
+    from alembic.config import Config
+    
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    config = Config(os.path.join(base_dir, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(base_dir, "migrations"))
+    config.attributes["configure_logger"] = False
+    command.upgrade(config, "head")
+    load_compression_dictionaries(session)
     print("База данных инициализирована.")
 
 # Функция для закрытия сессии
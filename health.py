@@ -0,0 +1,51 @@
+import logging
+import time
+
+from aiohttp import web
+
+
+# Состояние бота для проверок живости и готовности
+# live — процесс запущен и цикл событий отвечает, ready — бот принимает обновления
+class HealthState:
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.ready = False
+        self.checks = {}
+
+    def set_check(self, name, ok, detail=""):
+        self.checks[name] = {"ok": ok, "detail": detail}
+        logging.info("Проверка зависимости %s: %s %s", name, "OK" if ok else "ошибка", detail)
+
+    def set_ready(self, ready):
+        self.ready = ready
+        logging.info("Готовность бота: %s", 'готов' if ready else 'не готов')
+
+    def snapshot(self):
+        return {
+            "ready": self.ready,
+            "uptime": round(time.monotonic() - self.started_at, 1),
+            "checks": self.checks,
+        }
+
+
+async def _livez(request):
+    return web.json_response({"live": True, **request.app["health"].snapshot()})
+
+
+async def _readyz(request):
+    health = request.app["health"]
+    return web.json_response(health.snapshot(), status=200 if health.ready else 503)
+
+
+# Функция для запуска HTTP-сервера с /livez и /readyz
+async def start_health_server(health, host, port):
+    app = web.Application()
+    app["health"] = health
+    app.router.add_get("/livez", _livez)
+    app.router.add_get("/readyz", _readyz)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logging.info("Сервер проверок состояния запущен на %s:%s", host, port)
+    return runner
@@ -0,0 +1,78 @@
+import asyncio
+import logging
+from contextlib import contextmanager
+
+from aiogram import BaseMiddleware
+
+
+# Менеджер жизненного цикла: отслеживает выполняющиеся задачи, чтобы при остановке
+# дождаться их завершения, а незавершенную работу сохранить для продолжения после перезапуска
+class LifecycleManager:
+    def __init__(self, drain_timeout):
+        self.drain_timeout = drain_timeout
+        self.accepting = True
+        self.tasks = set()
+        self.jobs = {}
+        self.deadline = None
+
+    def add_task(self, task):
+        self.tasks.add(task)
+        task.add_done_callback(self._forget)
+
+    def _forget(self, task):
+        self.tasks.discard(task)
+        self.jobs.pop(task, None)
+
+    # Регистрация работы текущей задачи: если задача не успеет завершиться, работа будет сохранена
+    @contextmanager
+    def job(self, kind, payload):
+        task = asyncio.current_task()
+        self.add_task(task)
+        self.jobs[task] = (kind, payload)
+        try:
+            yield
+        finally:
+            self.jobs.pop(task, None)
+
+    # Ожидание завершения задач; возвращает работу задач, не завершившихся до истечения времени
+    async def drain(self):
+        self.accepting = False
+        loop = asyncio.get_running_loop()
+        self.deadline = deadline = loop.time() + self.drain_timeout
+        current = asyncio.current_task()
+        logging.info("Ожидание завершения выполняющихся задач: %s", len(self.tasks))
+
+        # Задачи могут порождать новые (например, обработка группы документов), поэтому проверяем в цикле
+        while True:
+            pending = {task for task in self.tasks if task is not current and not task.done()}
+            timeout = deadline - loop.time()
+            if not pending or timeout <= 0:
+                break
+            await asyncio.wait(pending, timeout=timeout)
+
+        unfinished = [self.jobs[task] for task in pending if task in self.jobs]
+        if pending:
+            logging.warning("Не завершились за %s с и были прерваны задач: %s", self.drain_timeout, len(pending))
+            for task in pending:
+                task.cancel()
+            # Даем прерванным задачам выполнить блоки finally (удаление временных файлов)
+            await asyncio.wait(pending, timeout=1)
+        return unfinished
+
+    # Сколько секунд остается до истечения времени на остановку
+    def remaining(self):
+        if self.deadline is None:
+            return self.drain_timeout
+        return max(0.0, self.deadline - asyncio.get_running_loop().time())
+
+
+# Middleware, регистрирующее обработку каждого обновления и отклоняющее новые во время остановки
+class LifecycleMiddleware(BaseMiddleware):
+    def __init__(self, lifecycle):
+        self.lifecycle = lifecycle
+
+    async def __call__(self, handler, event, data):
+        if not self.lifecycle.accepting:
+            return None
+        self.lifecycle.add_task(asyncio.current_task())
+        return await handler(event, data)
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery
+
+# Максимальное время удержания блокировки пользователя (на случай падения реплики)
+LOCK_TIMEOUT = 600
+
+# Сколько хранится ключ идемпотентности нажатия кнопки
+IDEMPOTENCY_TTL = 3600
+
+KEY_PREFIX = "yadisk_bot"
+
+
+# Блокировки пользователей и ключи идемпотентности в памяти процесса
+class MemoryLockBackend:
+    def __init__(self):
+        self.locks = {}
+        self.waiters = {}
+        self.keys = {}
+
+    @asynccontextmanager
+    async def user_lock(self, user_id):
+        lock = self.locks.setdefault(user_id, asyncio.Lock())
+        self.waiters[user_id] = self.waiters.get(user_id, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self.waiters[user_id] -= 1
+            if not self.waiters[user_id]:
+                del self.waiters[user_id]
+                del self.locks[user_id]
+
+    async def claim(self, key, ttl=IDEMPOTENCY_TTL):
+        now = time.monotonic()
+        if len(self.keys) > 10000:
+            self.keys = {k: expires for k, expires in self.keys.items() if expires > now}
+        if self.keys.get(key, 0) > now:
+            return False
+        self.keys[key] = now + ttl
+        return True
+
+
+# Блокировки и ключи в Redis — общие для всех реплик бота
+class RedisLockBackend:
+    def __init__(self, redis):
+        self.redis = redis
+
+    @asynccontextmanager
+    async def user_lock(self, user_id):
+        async with self.redis.lock(f"{KEY_PREFIX}:user_lock:{user_id}", timeout=LOCK_TIMEOUT):
+            yield
+
+    async def claim(self, key, ttl=IDEMPOTENCY_TTL):
+        return bool(await self.redis.set(f"{KEY_PREFIX}:callback:{key}", 1, nx=True, ex=ttl))
+
+
+# Функция для выбора хранилища блокировок: Redis, если он настроен, иначе память процесса
+def create_lock_backend(redis_url=None):
+    if redis_url:
+        from redis.asyncio import Redis
+        logging.info("Блокировки пользователей хранятся в Redis")
+        return RedisLockBackend(Redis.from_url(redis_url))
+    return MemoryLockBackend()
+
+
+# Middleware для кнопок, запускающих загрузку: повторное нажатие на то же сообщение
+# отбрасывается, а обработка одного пользователя выполняется последовательно
+class CallbackGuardMiddleware(BaseMiddleware):
+    def __init__(self, backend, prefixes):
+        self.backend = backend
+        self.prefixes = tuple(prefixes)
+
+    async def __call__(self, handler, event, data):
+        if not isinstance(event, CallbackQuery) or not event.data or not event.data.startswith(self.prefixes):
+            return await handler(event, data)
+
+        user_id = event.from_user.id
+        if event.message:
+            key = f"{user_id}:{event.message.chat.id}:{event.message.message_id}"
+        else:
+            key = f"{user_id}:{event.id}"
+
+        if not await self.backend.claim(key):
+            logging.info("Повторное нажатие кнопки %s пользователем %s отброшено", event.data, user_id)
+            await event.answer("Запрос уже обрабатывается.")
+            return None
+
+        async with self.backend.user_lock(user_id):
+            return await handler(event, data)
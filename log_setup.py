@@ -0,0 +1,90 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import uuid
+from datetime import datetime, timezone
+
+from aiogram import BaseMiddleware
+
+# Идентификатор обрабатываемого обновления: попадает во все записи журнала, сделанные при его обработке,
+# в том числе из задач и потоков, запущенных обработчиком (они получают копию контекста)
+correlation_id = contextvars.ContextVar("correlation_id", default="-")
+
+# Стандартные атрибуты записи — все остальные считаются дополнительными полями (extra=...)
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "correlation_id"}
+
+
+# Обработчик, который только кладет запись в очередь: форматирование и вывод выполняет поток QueueListener
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    # Запись подготавливается без форматирования: в очередь попадает уже подставленное сообщение,
+    # чтобы аргументы не изменились до вывода, а время, уровень и JSON формирует поток вывода
+    def prepare(self, record):
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.correlation_id = correlation_id.get()
+        return record
+
+
+# Форматирование записи в одну строку JSON
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "correlation_id": getattr(record, "correlation_id", "-"),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+# Функция для настройки журнала: записи передаются через очередь в отдельный поток,
+# поэтому вывод в stderr не выполняется в цикле событий
+# LOG_FORMAT=text — прежний текстовый формат (удобно при локальной отладке)
+def setup_logging():
+    level = os.getenv("LOG_LEVEL", "INFO").upper()
+    if os.getenv("LOG_FORMAT", "json") == "text":
+        formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(correlation_id)s] %(message)s")
+    else:
+        formatter = JsonFormatter()
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(ContextQueueHandler(log_queue))
+    root.setLevel(level)
+
+    listener.start()
+    # Оставшиеся в очереди записи выводятся при завершении процесса
+    atexit.register(listener.stop)
+    return listener
+
+
+# Middleware, присваивающее каждому обновлению идентификатор для связи записей журнала
+class CorrelationIdMiddleware(BaseMiddleware):
+    async def __call__(self, handler, event, data):
+        token = correlation_id.set(f"{event.update_id}-{uuid.uuid4().hex[:8]}")
+        try:
+            return await handler(event, data)
+        finally:
+            correlation_id.reset(token)
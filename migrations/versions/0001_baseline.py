@@ -0,0 +1,90 @@
+"""Базовая схема: таблицы, созданные ранее через create_all и ручные скрипты
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-19 12:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Существующие базы уже содержат часть таблиц — создаем только недостающие
+    existing_tables = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if "users" not in existing_tables:
+        op.create_table(
+            "users",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("telegram_id", sa.BigInteger(), nullable=False, unique=True),
+            sa.Column("full_name", sa.String(), nullable=False),
+            sa.Column("is_admin", sa.Boolean(), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=True),
+        )
+    else:
+        # Бывший скрипт migrations/001_update_telegram_id.py
+        op.execute("ALTER TABLE users ALTER COLUMN telegram_id TYPE BIGINT")
+
+    if "file_templates" not in existing_tables:
+        op.create_table(
+            "file_templates",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("template", sa.String(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(), nullable=True),
+        )
+
+    if "log_settings" not in existing_tables:
+        op.create_table(
+            "log_settings",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("log_chat_id", sa.BigInteger(), nullable=True),
+            sa.Column("log_registrations", sa.Boolean(), nullable=True),
+            sa.Column("log_file_uploads", sa.Boolean(), nullable=True),
+        )
+    else:
+        # Бывший скрипт migrations/002_update_log_chat_id.py
+        op.execute("ALTER TABLE log_settings ALTER COLUMN log_chat_id TYPE BIGINT USING log_chat_id::bigint")
+
+    if "uploaded_files" not in existing_tables:
+        op.create_table(
+            "uploaded_files",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("user_id", sa.Integer(), nullable=False),
+            sa.Column("file_name", sa.String(), nullable=False),
+            sa.Column("file_type", sa.String(), nullable=False),
+            sa.Column("file_content", sa.Text(), nullable=False),
+            sa.Column("file_path", sa.String(), nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=True),
+        )
+
+    if "similarity_edges" not in existing_tables:
+        op.create_table(
+            "similarity_edges",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("file_id", sa.Integer(), sa.ForeignKey("uploaded_files.id", ondelete="CASCADE"), nullable=False),
+            sa.Column("similar_file_id", sa.Integer(), sa.ForeignKey("uploaded_files.id", ondelete="CASCADE"), nullable=False),
+            sa.Column("similarity", sa.Float(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(), nullable=True),
+            sa.UniqueConstraint("file_id", "similar_file_id", name="uq_similarity_edges_pair"),
+            sa.CheckConstraint("file_id < similar_file_id", name="ck_similarity_edges_order"),
+        )
+        op.create_index("ix_similarity_edges_file_id", "similarity_edges", ["file_id"])
+        op.create_index("ix_similarity_edges_similar_file_id", "similarity_edges", ["similar_file_id"])
+
+
+def downgrade() -> None:
+    op.drop_table("similarity_edges")
+    op.drop_table("uploaded_files")
+    op.drop_table("log_settings")
+    op.drop_table("file_templates")
+    op.drop_table("users")
@@ -0,0 +1,75 @@
+"""Индексы и ограничения для uploaded_files
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 12:10:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Записи пользователей, удаленных вручную (например, при пересоздании таблицы users)
+ORPHANS_QUERY = "SELECT id FROM uploaded_files WHERE user_id NOT IN (SELECT id FROM users) ORDER BY id"
+
+# Дубликаты одного пути, появившиеся из-за двойных нажатий, — все записи, кроме последней
+DUPLICATES_QUERY = """
+    SELECT older.id FROM uploaded_files older
+    WHERE EXISTS (
+        SELECT 1 FROM uploaded_files newer
+        WHERE newer.user_id = older.user_id AND newer.file_path = older.file_path AND newer.id > older.id
+    )
+    ORDER BY older.id
+"""
+
+# Сколько id показывается в сообщении об ошибке
+SHOWN_IDS = 20
+
+
+def describe(title, ids):
+    shown = ", ".join(str(file_id) for file_id in ids[:SHOWN_IDS])
+    more = f" и еще {len(ids) - SHOWN_IDS}" if len(ids) > SHOWN_IDS else ""
+    return f"{title}: {len(ids)} (id: {shown}{more})"
+
+
+def upgrade() -> None:
+    # Такие записи мешают добавить ограничения. Миграция их не удаляет: обновление останавливается,
+    # записи проверяются и удаляются отдельной командой cleanup_uploaded_files.py
+    bind = op.get_bind()
+    orphans = [row.id for row in bind.execute(sa.text(ORPHANS_QUERY))]
+    duplicates = [row.id for row in bind.execute(sa.text(DUPLICATES_QUERY))]
+    if orphans or duplicates:
+        problems = []
+        if orphans:
+            problems.append(describe("записи удаленных пользователей", orphans))
+        if duplicates:
+            problems.append(describe("дубликаты пути (кроме последней записи)", duplicates))
+        raise RuntimeError(
+            "В uploaded_files есть записи, мешающие добавить ограничения: " + "; ".join(problems) + ". "
+            "Проверьте их командой python cleanup_uploaded_files.py, удалите командой "
+            "python cleanup_uploaded_files.py --apply и повторите запуск"
+        )
+
+    op.create_foreign_key(
+        "fk_uploaded_files_user_id_users", "uploaded_files", "users",
+        ["user_id"], ["id"], ondelete="CASCADE"
+    )
+    # Поиск записи при замене файла: user_id + file_path (уникальный индекс)
+    op.create_unique_constraint("uq_uploaded_files_user_id_file_path", "uploaded_files", ["user_id", "file_path"])
+    # Файлы пользователя определенного типа
+    op.create_index("ix_uploaded_files_user_id_file_type", "uploaded_files", ["user_id", "file_type"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_uploaded_files_user_id_file_type", table_name="uploaded_files")
+    op.drop_constraint("uq_uploaded_files_user_id_file_path", "uploaded_files", type_="unique")
+    op.drop_constraint("fk_uploaded_files_user_id_users", "uploaded_files", type_="foreignkey")
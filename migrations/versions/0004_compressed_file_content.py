@@ -0,0 +1,68 @@
+"""Сжатое хранение содержимого файлов
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 15:20:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from content_codec import CODEC_RAW, encode, decode
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Сколько записей перекодируется за один запрос
+BATCH_SIZE = 500
+
+
+# Функция для перекодирования file_content пакетами (строки читаются по возрастанию id)
+def reencode(convert):
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(sa.text(
+            "SELECT id, file_content FROM uploaded_files WHERE id > :last_id ORDER BY id LIMIT :limit"
+        ), {"last_id": last_id, "limit": BATCH_SIZE}).all()
+        if not rows:
+            break
+        bind.execute(
+            sa.text("UPDATE uploaded_files SET file_content = :content WHERE id = :id"),
+            [{"id": row.id, "content": convert(row.file_content)} for row in rows]
+        )
+        last_id = rows[-1].id
+
+
+def upgrade() -> None:
+    op.create_table(
+        "compression_dictionaries",
+        sa.Column("id", sa.BigInteger(), primary_key=True, autoincrement=False),
+        sa.Column("data", sa.LargeBinary(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now()),
+    )
+
+    # Текст переводится в байты с заголовком "без сжатия", затем сжимается пакетами
+    op.execute(
+        f"ALTER TABLE uploaded_files ALTER COLUMN file_content TYPE bytea "
+        f"USING '\\x{CODEC_RAW:02x}'::bytea || convert_to(file_content, 'UTF8')"
+    )
+    # Значения уже сжаты — повторное сжатие TOAST только тратит время
+    op.execute("ALTER TABLE uploaded_files ALTER COLUMN file_content SET STORAGE EXTERNAL")
+    reencode(lambda content: encode(decode(content)))
+
+
+def downgrade() -> None:
+    reencode(lambda content: bytes([CODEC_RAW]) + decode(content).encode("utf-8"))
+    op.execute("ALTER TABLE uploaded_files ALTER COLUMN file_content SET STORAGE EXTENDED")
+    op.execute(
+        "ALTER TABLE uploaded_files ALTER COLUMN file_content TYPE text "
+        "USING convert_from(substring(file_content FROM 2), 'UTF8')"
+    )
+    op.drop_table("compression_dictionaries")
@@ -0,0 +1,30 @@
+"""Аккаунт Яндекс.Диска, на котором хранится файл
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19 16:10:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Все ранее загруженные файлы хранятся на единственном аккаунте YADISK_TOKEN
+    op.add_column(
+        "uploaded_files",
+        sa.Column("storage_shard", sa.String(), nullable=False, server_default="default")
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("uploaded_files", "storage_shard")
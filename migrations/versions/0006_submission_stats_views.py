@@ -0,0 +1,68 @@
+"""Материализованные представления для статистики сдачи работ
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19 17:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Сводка по каждому пользователю: число работ каждого типа, последняя загрузка и найденные совпадения
+    op.execute("""
+        CREATE MATERIALIZED VIEW user_submission_stats AS
+        SELECT u.id AS user_id,
+               u.full_name,
+               coalesce(u.is_admin, false) AS is_admin,
+               coalesce(files.essays, 0) AS essays,
+               coalesce(files.presentations, 0) AS presentations,
+               files.last_upload_at,
+               coalesce(flags.similarity_flags, 0) AS similarity_flags
+        FROM users u
+        LEFT JOIN (
+            SELECT user_id,
+                   count(*) FILTER (WHERE file_type = 'essay') AS essays,
+                   count(*) FILTER (WHERE file_type = 'presentation') AS presentations,
+                   max(created_at) AS last_upload_at
+            FROM uploaded_files
+            GROUP BY user_id
+        ) files ON files.user_id = u.id
+        LEFT JOIN (
+            SELECT f.user_id, count(*) AS similarity_flags
+            FROM (
+                SELECT file_id AS id FROM similarity_edges
+                UNION ALL
+                SELECT similar_file_id FROM similarity_edges
+            ) edge_files
+            JOIN uploaded_files f ON f.id = edge_files.id
+            GROUP BY f.user_id
+        ) flags ON flags.user_id = u.id
+    """)
+    # Уникальный индекс нужен для обновления без блокировки чтения (REFRESH ... CONCURRENTLY)
+    op.execute("CREATE UNIQUE INDEX ix_user_submission_stats_user_id ON user_submission_stats (user_id)")
+
+    # Число загрузок по дням и типам
+    op.execute("""
+        CREATE MATERIALIZED VIEW daily_upload_stats AS
+        SELECT created_at::date AS day, file_type, count(*) AS uploads
+        FROM uploaded_files
+        WHERE created_at IS NOT NULL
+        GROUP BY created_at::date, file_type
+    """)
+    op.execute("CREATE UNIQUE INDEX ix_daily_upload_stats_day_file_type ON daily_upload_stats (day, file_type)")
+
+
+def downgrade() -> None:
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS daily_upload_stats")
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS user_submission_stats")
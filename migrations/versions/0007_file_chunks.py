@@ -0,0 +1,36 @@
+"""Отпечатки файлов по фрагментам для поиска копий презентаций
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19 19:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # У ранее загруженных файлов отпечатка нет, пока он не построен скриптом backfill_file_chunks.py
+    op.add_column("uploaded_files", sa.Column("chunk_count", sa.Integer(), nullable=True))
+    op.create_table(
+        "file_chunks",
+        sa.Column("file_id", sa.Integer(), sa.ForeignKey("uploaded_files.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("chunk_hash", sa.BigInteger(), primary_key=True),
+    )
+    # Поиск файлов с общими фрагментами читает только индекс
+    op.create_index("ix_file_chunks_chunk_hash_file_id", "file_chunks", ["chunk_hash", "file_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_file_chunks_chunk_hash_file_id", table_name="file_chunks")
+    op.drop_table("file_chunks")
+    op.drop_column("uploaded_files", "chunk_count")
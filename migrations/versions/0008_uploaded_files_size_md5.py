@@ -0,0 +1,29 @@
+"""Размер и md5 загруженного файла для сверки с Яндекс.Диском
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-20 10:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008'
+down_revision: Union[str, None] = '0007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # У ранее загруженных файлов значения заполняются при следующей сверке по данным Яндекс.Диска
+    op.add_column("uploaded_files", sa.Column("file_size", sa.BigInteger(), nullable=True))
+    op.add_column("uploaded_files", sa.Column("file_md5", sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("uploaded_files", "file_md5")
+    op.drop_column("uploaded_files", "file_size")
@@ -0,0 +1,32 @@
+"""Время последнего пересчета статистики сдачи работ
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-20 10:30:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0009'
+down_revision: Union[str, None] = '0008'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    stats_refreshes = op.create_table(
+        "stats_refreshes",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("refreshed_at", sa.DateTime(), nullable=True),
+    )
+    # Единственная строка обновляется при каждом пересчете
+    op.bulk_insert(stats_refreshes, [{"id": 1, "refreshed_at": None}])
+
+
+def downgrade() -> None:
+    op.drop_table("stats_refreshes")
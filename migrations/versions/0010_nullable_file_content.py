@@ -0,0 +1,31 @@
+"""Содержимое сохраняется только у небольших текстовых эссе
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-20 11:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from content_codec import CODEC_RAW
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0010'
+down_revision: Union[str, None] = '0009'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Уже сохраненное содержимое не удаляется: у новых крупных и двоичных файлов значение NULL
+    op.alter_column("uploaded_files", "file_content", existing_type=sa.LargeBinary(), nullable=True)
+
+
+def downgrade() -> None:
+    # Пустой текст с заголовком "без сжатия"
+    op.execute(f"UPDATE uploaded_files SET file_content = '\\x{CODEC_RAW:02x}'::bytea WHERE file_content IS NULL")
+    op.alter_column("uploaded_files", "file_content", existing_type=sa.LargeBinary(), nullable=False)
@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+
+from database import SessionLocal, UploadedFile
+
+# Размер страницы при получении содержимого папки и размер пакета изменений в БД
+LISTING_PAGE_SIZE = 1000
+BATCH_SIZE = 500
+
+LISTING_FIELDS = ["name", "path", "type", "size", "md5", "modified"]
+
+# Защита от массового удаления записей: сверка прерывается, если удалить нужно больше этой доли записей
+# аккаунта (но не меньше MIN_DELETE_GUARD записей) — вероятнее всего, неверно указаны корневая папка или токен
+MAX_DELETE_SHARE = 0.2
+MIN_DELETE_GUARD = 5
+
+
+class ReconcileAborted(Exception):
+    pass
+
+
+# Функция для приведения пути из ответа API ("disk:/...") к виду, в котором он хранится в БД
+def normalize_path(path):
+    if path.startswith("disk:"):
+        path = path[len("disk:"):]
+    return path.rstrip("/") or "/"
+
+
+# Локальный индекс файлов и папок на Яндекс.Диске
+# Пока индекс свежий, проверки существования выполняются без запросов к API
+class DiskIndex:
+    def __init__(self, max_age):
+        self.max_age = max_age
+        self.files = set()
+        self.dirs = set()
+        self.refreshed_at = None
+        # Изменения, сделанные ботом во время обхода, чтобы не потерять их при замене индекса
+        self.recent = {}
+
+    def is_fresh(self):
+        return self.refreshed_at is not None and time.monotonic() - self.refreshed_at < self.max_age
+
+    # Возвращает True/False, либо None, если индекс устарел и нужно спросить API
+    def exists(self, path):
+        if not self.is_fresh():
+            return None
+        path = normalize_path(path)
+        return path in self.files or path in self.dirs
+
+    def add_file(self, path):
+        path = normalize_path(path)
+        self.files.add(path)
+        self.recent[path] = ("file", time.monotonic())
+
+    def add_dir(self, path):
+        path = normalize_path(path)
+        self.dirs.add(path)
+        self.recent[path] = ("dir", time.monotonic())
+
+    # Замена содержимого индекса результатом обхода, начатого в started_at
+    def replace(self, files, dirs, started_at):
+        files = set(files)
+        dirs = set(dirs)
+        for path, (kind, added_at) in list(self.recent.items()):
+            if added_at >= started_at:
+                (files if kind == "file" else dirs).add(path)
+            else:
+                del self.recent[path]
+        self.files = files
+        self.dirs = dirs
+        self.refreshed_at = started_at
+
+
+# Функция для обхода дерева папок постраничными запросами
+# ignored_dirs — служебные папки бота, которые не относятся к работам студентов
+# Возвращает None, если корневой папки нет
+def list_tree(yadisk_client, root, ignored_dirs=()):
+    files = {}
+    dirs = set()
+    if not yadisk_client.exists(root):
+        return None
+
+    dirs.add(root)
+    stack = [root]
+    while stack:
+        path = stack.pop()
+        for item in yadisk_client.listdir(path, limit=LISTING_PAGE_SIZE, fields=LISTING_FIELDS):
+            item_path = normalize_path(item.path)
+            if item.type == "dir":
+                if item_path in ignored_dirs:
+                    continue
+                dirs.add(item_path)
+                stack.append(item_path)
+            else:
+                files[item_path] = item
+    return files, dirs
+
+
+# Проверка, что файл на диске — это файл записи: по md5, а если он неизвестен — по размеру
+def is_same_file(row, item):
+    if row.file_md5 and item.md5:
+        return row.file_md5 == item.md5
+    return row.file_size is not None and row.file_size == item.size
+
+
+# Функция для сравнения аккаунта Яндекс.Диска (шарда) с его записями в uploaded_files и исправления расхождений
+# Если корневой папки нет, на диске нет файлов или удалить нужно слишком много записей, сверка прерывается
+# с ReconcileAborted без изменений в БД и индексе
+# Выполняется в отдельном потоке со своей сессией БД
+# Обход идет последовательно по одной странице, поэтому ограничение частоты запросов шарда здесь не применяется
+def reconcile(shard):
+    start_time = time.monotonic()
+    db = SessionLocal()
+    try:
+        # Записи читаются до обхода диска: файл загружается раньше, чем появляется запись,
+        # поэтому загрузки, идущие во время обхода, не будут приняты за удаленные файлы
+        rows = db.query(
+            UploadedFile.id, UploadedFile.file_path, UploadedFile.file_size, UploadedFile.file_md5
+        ).filter(UploadedFile.storage_shard == shard.name).all()
+        tree = list_tree(shard.client, shard.root, {shard.exports_dir})
+        if tree is None:
+            if rows:
+                raise ReconcileAborted(f"Корневая папка {shard.root} не найдена, а в БД записей: {len(rows)}")
+            tree = ({}, set())
+        disk_files, disk_dirs = tree
+        if rows and not disk_files:
+            raise ReconcileAborted(f"На аккаунте нет ни одного файла, а в БД записей: {len(rows)}")
+        db_paths = {row.file_path for row in rows}
+        missing = [row for row in rows if row.file_path not in disk_files]
+        untracked = [path for path in disk_files if path not in db_paths]
+
+        # Файлы без записи в БД, сгруппированные по папке и расширению, — кандидаты на переименование
+        untracked_by_key = defaultdict(list)
+        for path in untracked:
+            folder, name = os.path.split(path)
+            untracked_by_key[(folder, os.path.splitext(name)[1].lower())].append(path)
+
+        # Запись переносится на файл без записи, только если это тот же файл (совпадает md5 или размер)
+        renamed = {}
+        deleted = []
+        for row in missing:
+            folder, name = os.path.split(row.file_path)
+            candidates = [
+                path for path in untracked_by_key.get((folder, os.path.splitext(name)[1].lower()), [])
+                if is_same_file(row, disk_files[path])
+            ]
+            if len(candidates) == 1:
+                renamed[row.id] = candidates[0]
+                untracked_by_key[(folder, os.path.splitext(name)[1].lower())].remove(candidates[0])
+            else:
+                deleted.append(row.id)
+
+        if len(deleted) > max(MAX_DELETE_SHARE * len(rows), MIN_DELETE_GUARD):
+            raise ReconcileAborted(
+                f"Нужно удалить {len(deleted)} из {len(rows)} записей — сверка прервана, записи не изменены"
+            )
+
+        for offset in range(0, len(deleted), BATCH_SIZE):
+            batch = deleted[offset:offset + BATCH_SIZE]
+            db.query(UploadedFile).filter(UploadedFile.id.in_(batch)).delete(synchronize_session=False)
+            db.commit()
+
+        # Размер и md5 записей без этих данных (загруженных до их сохранения) берутся с диска
+        known = [
+            {"id": row.id, "file_size": disk_files[row.file_path].size, "file_md5": disk_files[row.file_path].md5}
+            for row in rows
+            if row.file_path in disk_files and (row.file_size is None or row.file_md5 is None)
+        ]
+        for offset in range(0, len(known), BATCH_SIZE):
+            db.bulk_update_mappings(UploadedFile, known[offset:offset + BATCH_SIZE])
+            db.commit()
+
+        renamed_items = list(renamed.items())
+        for offset in range(0, len(renamed_items), BATCH_SIZE):
+            db.bulk_update_mappings(UploadedFile, [
+                {
+                    "id": file_id,
+                    "file_path": path,
+                    "file_name": os.path.basename(path),
+                    "file_size": disk_files[path].size,
+                    "file_md5": disk_files[path].md5,
+                }
+                for file_id, path in renamed_items[offset:offset + BATCH_SIZE]
+            ])
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    shard.index.replace(disk_files.keys(), disk_dirs, start_time)
+
+    stats = {
+        "files": len(disk_files),
+        "deleted": len(deleted),
+        "renamed": len(renamed),
+        "untracked": len(untracked) - len(renamed),
+        "seconds": round(time.monotonic() - start_time, 2),
+    }
+    logging.info(
+        "Сверка аккаунта Яндекс.Диска %s с БД завершена за %s с: файлов на диске %s, "
+        "удалено записей %s, переименовано %s, файлов без записи %s",
+        shard.name, stats['seconds'], stats['files'], stats['deleted'], stats['renamed'], stats['untracked']
+    )
+    return stats
+
+
+# Функция для сверки всех аккаунтов; возвращает статистику по каждому аккаунту
+async def reconcile_all(router):
+    results = {}
+    for shard in router.shards.values():
+        try:
+            results[shard.name] = await asyncio.to_thread(reconcile, shard)
+        except Exception as e:
+            logging.error("Ошибка при сверке аккаунта Яндекс.Диска %s с БД: %s", shard.name, e)
+            results[shard.name] = e
+    return results
+
+
+# Фоновая задача периодической сверки
+async def run_reconciliation(router, interval):
+    while True:
+        await reconcile_all(router)
+        await asyncio.sleep(interval)
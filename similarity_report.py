@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import re
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+from scipy import sparse
+
+from database import session, User, UploadedFile
+
+# Размер шингла в словах и размерность хеш-пространства признаков
+SHINGLE_SIZE = 3
+HASH_SPACE = 1 << 20
+
+# Порог схожести по умолчанию (как и при проверке одного файла — 30%)
+DEFAULT_THRESHOLD = 0.3
+
+# Сколько строк матрицы умножается за один шаг, чтобы не держать всю матрицу схожести в памяти
+CHUNK_SIZE = 512
+
+# Заглушка, которая сохраняется вместо нечитаемых файлов, — в отчете не участвует
+UNREADABLE_CONTENT = "Содержимое файла не может быть прочитано"
+
+WORD_RE = re.compile(r"\w+")
+
+_executor = None
+
+
+# Функция для разбиения текста на хешированные шинглы
+def _shingle_hashes(text):
+    words = WORD_RE.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        shingles = [" ".join(words)] if words else []
+    else:
+        shingles = [" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+    return np.fromiter((zlib.crc32(s.encode("utf-8")) % HASH_SPACE for s in shingles), dtype=np.int64, count=len(shingles))
+
+
+# Функция для построения разреженной TF-IDF матрицы (строки нормированы по L2)
+def build_tfidf_matrix(texts):
+    indptr = [0]
+    indices = []
+    counts = []
+    for text in texts:
+        columns, column_counts = np.unique(_shingle_hashes(text), return_counts=True)
+        indices.append(columns)
+        counts.append(column_counts)
+        indptr.append(indptr[-1] + len(columns))
+
+    indices = np.concatenate(indices) if indices else np.empty(0, dtype=np.int64)
+    data = 1.0 + np.log(np.concatenate(counts).astype(np.float64)) if counts else np.empty(0)
+    matrix = sparse.csr_matrix((data, indices, np.asarray(indptr)), shape=(len(texts), HASH_SPACE))
+
+    # IDF: шинглы, встречающиеся во многих работах (цитаты из задания, клише), весят меньше
+    document_frequency = np.bincount(indices, minlength=HASH_SPACE)
+    idf = np.log((1.0 + len(texts)) / (1.0 + document_frequency)) + 1.0
+    matrix = matrix.multiply(idf).tocsr()
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags(1.0 / norms) @ matrix
+
+
+# Функция для поиска пар выше порога: матрица схожести считается блоками строк
+def find_similar_pairs(texts, owners, threshold=DEFAULT_THRESHOLD):
+    matrix = build_tfidf_matrix(texts)
+    transposed = matrix.T.tocsc()
+    owners = np.asarray(owners)
+    pairs = []
+
+    for start in range(0, matrix.shape[0], CHUNK_SIZE):
+        block = (matrix[start:start + CHUNK_SIZE] @ transposed).tocoo()
+        rows = block.row + start
+        # Берем только верхний треугольник, пары одного автора пропускаем
+        mask = (block.col > rows) & (block.data >= threshold) & (owners[rows] != owners[block.col])
+        pairs.extend(zip(rows[mask].tolist(), block.col[mask].tolist(), block.data[mask].tolist()))
+
+    return pairs
+
+
+# Функция для объединения пар в кластеры (система непересекающихся множеств)
+def build_clusters(pairs):
+    parent = {}
+
+    def find(item):
+        parent.setdefault(item, item)
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    for first, second, _ in pairs:
+        root_first, root_second = find(first), find(second)
+        if root_first != root_second:
+            parent[root_second] = root_first
+
+    clusters = {}
+    for first, second, score in pairs:
+        cluster = clusters.setdefault(find(first), {"members": set(), "pairs": []})
+        cluster["members"].update((first, second))
+        cluster["pairs"].append((first, second, score))
+
+    return sorted(clusters.values(), key=lambda c: (len(c["members"]), max(p[2] for p in c["pairs"])), reverse=True)
+
+
+# Полный расчет в отдельном процессе: на вход только тексты и авторы, без доступа к БД
+def compute_report(texts, owners, threshold=DEFAULT_THRESHOLD):
+    pairs = find_similar_pairs(texts, owners, threshold)
+    return build_clusters(pairs)
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=1)
+    return _executor
+
+
+# Функция для формирования текста отчета
+def format_report(clusters, files, threshold):
+    if not clusters:
+        return f"Пар работ со схожестью выше {round(threshold * 100)}% не найдено."
+
+    lines = [f"Найдено групп подозрительных работ: {len(clusters)} (порог {round(threshold * 100)}%)", ""]
+    for number, cluster in enumerate(clusters, start=1):
+        lines.append(f"Группа {number} ({len(cluster['members'])} работ):")
+        for first, second, score in sorted(cluster["pairs"], key=lambda p: p[2], reverse=True):
+            lines.append(
+                f"- {files[first].full_name} ({files[first].file_name}) ↔ "
+                f"{files[second].full_name} ({files[second].file_name}): {round(score * 100, 2)}%"
+            )
+        lines.append("")
+    return "\n".join(lines)
+
+
+# Функция для построения отчета о схожести по всем эссе
+async def build_similarity_report(threshold=DEFAULT_THRESHOLD):
+    start_time = datetime.now()
+    files = session.query(
+        UploadedFile.id,
+        UploadedFile.user_id,
+        UploadedFile.file_name,
+        UploadedFile.file_content,
+        User.full_name,
+    ).join(User, User.id == UploadedFile.user_id).filter(
+        UploadedFile.file_type == "essay",
+        UploadedFile.file_content.isnot(None),
+        # Заглушка короче порога сжатия и хранится как есть, поэтому сравнение выполняется в БД
+        UploadedFile.file_content != UNREADABLE_CONTENT,
+    ).order_by(UploadedFile.id).all()
+
+    if len(files) < 2:
+        return "Недостаточно эссе для построения отчета."
+
+    texts = [file.file_content for file in files]
+    owners = [file.user_id for file in files]
+    loop = asyncio.get_running_loop()
+    clusters = await loop.run_in_executor(_get_executor(), compute_report, texts, owners, threshold)
+
+    execution_time = (datetime.now() - start_time).total_seconds()
+    logging.info("Отчет о схожести по %s эссе построен за %s секунд, групп: %s", len(files), execution_time, len(clusters))
+    return format_report(clusters, files, threshold)
@@ -0,0 +1,64 @@
+import difflib
+import time
+
+# Порог схожести в процентах: файлы со схожестью не выше порога не сохраняются
+THRESHOLD = 30
+
+
+# Верхняя оценка ratio() по длинам (то же, что real_quick_ratio, но без построения индекса второго текста):
+# совпадений не больше длины более короткого текста
+def length_bound(length1, length2):
+    total = length1 + length2
+    return 2.0 * min(length1, length2) / total if total else 1.0
+
+
+# Функция поиска похожих текстов с ограничением по времени (выполняется в отдельном потоке)
+# Кандидаты, у которых верхняя оценка по длине не выше порога, отсеиваются без сравнения, остальные
+# проверяются в порядке убывания этой оценки (сначала тексты близкого размера). quick_ratio не используется:
+# для текстов на одном языке наборы символов почти совпадают, и оценка стоит столько же, сколько ratio.
+# При достижении deadline возвращаются уже найденные совпадения. candidates — строки с id, file_name,
+# user_id, file_content. Возвращает совпадения (по убыванию схожести) и статистику проверки
+def find_similar(text, candidates, deadline, threshold=THRESHOLD):
+    start_time = time.monotonic()
+    stats = {
+        "total": len(candidates),
+        "pruned_length": 0,
+        "scored": 0,
+        "unchecked": 0,
+        "complete": True,
+    }
+
+    # Отсев по длине и упорядочивание по этой оценке
+    ranked = []
+    for candidate in candidates:
+        bound = length_bound(len(text), len(candidate.file_content))
+        if bound * 100 <= threshold:
+            stats["pruned_length"] += 1
+        else:
+            ranked.append((bound, candidate))
+    ranked.sort(key=lambda item: item[0], reverse=True)
+
+    # Порядок сравнения (новый текст, текст кандидата) тот же, что в прежней check_similarity, чтобы оценки
+    # не изменились. SequenceMatcher индексирует второй текст, поэтому индекс строится заново для каждого кандидата
+    matcher = difflib.SequenceMatcher(None, text, "")
+    matches = []
+    for index, (_, candidate) in enumerate(ranked):
+        if time.monotonic() >= deadline:
+            stats["unchecked"] = len(ranked) - index
+            stats["complete"] = False
+            break
+        matcher.set_seq2(candidate.file_content)
+        similarity = round(matcher.ratio() * 100, 2)
+        stats["scored"] += 1
+        if similarity > threshold:
+            matches.append({
+                'file_id': candidate.id,
+                'file_name': candidate.file_name,
+                'similarity': similarity,
+                'user_id': candidate.user_id
+            })
+
+    matches.sort(key=lambda match: match['similarity'], reverse=True)
+    stats["coverage"] = round(100 * (stats["total"] - stats["unchecked"]) / stats["total"], 1) if stats["total"] else 100.0
+    stats["seconds"] = round(time.monotonic() - start_time, 3)
+    return matches, stats
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+# Префикс временных файлов бота. Крупный файл сбрасывается на диск как безымянный (уже удаленный из директории)
+# файл, поэтому после падения процесса на диске ничего не остается и искать забытые файлы по имени не нужно
+SPOOL_PREFIX = "spool_"
+
+
+class SpoolQuotaExceeded(Exception):
+    pass
+
+
+# Временный файл: небольшие файлы остаются в памяти, крупные сбрасываются в директорию
+class SpoolEntry:
+    def __init__(self, key, file, reserved, ttl, on_expire=None):
+        self.key = key
+        self.file = file
+        self.reserved = reserved
+        self.expires_at = time.monotonic() + ttl
+        self.on_expire = on_expire
+
+
+# Менеджер временных файлов с квотой на общий объем и сроком жизни каждого файла
+class SpoolManager:
+    def __init__(self, directory, memory_limit, quota, default_ttl):
+        self.directory = directory
+        self.memory_limit = memory_limit
+        self.quota = quota
+        self.default_ttl = default_ttl
+        self.entries = {}
+        self.used = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def create(self, key, size=None, ttl=None):
+        # Размер файла известен заранее из Telegram — резервируем место до скачивания
+        reserved = size or self.memory_limit
+        if self.used + reserved > self.quota:
+            raise SpoolQuotaExceeded(f"Превышена квота временных файлов: занято {self.used} из {self.quota} байт")
+
+        if key in self.entries:
+            self.release(key)
+
+        file = tempfile.SpooledTemporaryFile(max_size=self.memory_limit, prefix=SPOOL_PREFIX, dir=self.directory)
+        entry = SpoolEntry(key, file, reserved, ttl or self.default_ttl)
+        self.entries[key] = entry
+        self.used += reserved
+        return file
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        entry.file.seek(0)
+        return entry.file
+
+    def read(self, key):
+        file = self.get(key)
+        return file.read() if file else None
+
+    # Продление срока жизни файла, например на время ожидания ответа пользователя
+    def touch(self, key, ttl, on_expire=None):
+        entry = self.entries.get(key)
+        if entry:
+            entry.expires_at = time.monotonic() + ttl
+            entry.on_expire = on_expire
+
+    def release(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        self.used -= entry.reserved
+        try:
+            entry.file.close()
+        except Exception as e:
+            logging.warning("Ошибка при закрытии временного файла %s: %s", key, e)
+
+    # Удаление просроченных файлов. Файлы в директории по имени и времени изменения не удаляются:
+    # там же архивы выгрузки (export_*), которые могут еще записываться, а файлы менеджера в ней не видны
+    async def sweep(self):
+        now = time.monotonic()
+        expired = [entry for entry in self.entries.values() if entry.expires_at <= now]
+        for entry in expired:
+            logging.info("Срок хранения временного файла %s истек, файл удален", entry.key)
+            self.release(entry.key)
+            if entry.on_expire:
+                try:
+                    await entry.on_expire()
+                except Exception as e:
+                    logging.warning("Ошибка при обработке истечения временного файла %s: %s", entry.key, e)
+
+    async def run_sweeper(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logging.error("Ошибка при очистке временных файлов: %s", e)
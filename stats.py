@@ -0,0 +1,124 @@
+import asyncio
+import logging
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import Boolean, Column, Date, DateTime, Integer, MetaData, String, Table, func, text
+
+from archive import FILE_TYPE_NAMES
+from database import session, SessionLocal, StatsRefresh
+
+# Статистика сдачи работ читается из материализованных представлений (см. миграцию 0006),
+# которые пересчитываются в фоне, — запросы админов не нагружают таблицы загрузок
+STATS_VIEWS = ["user_submission_stats", "daily_upload_stats"]
+
+# Сколько последних дней показывать в разбивке по дням
+DAILY_DAYS = 14
+
+# Отдельные метаданные: представления создаются миграцией и не должны попадать в Base.metadata
+_metadata = MetaData()
+
+user_submission_stats = Table(
+    "user_submission_stats", _metadata,
+    Column("user_id", Integer, primary_key=True),
+    Column("full_name", String),
+    Column("is_admin", Boolean),
+    Column("essays", Integer),
+    Column("presentations", Integer),
+    Column("last_upload_at", DateTime),
+    Column("similarity_flags", Integer),
+)
+
+daily_upload_stats = Table(
+    "daily_upload_stats", _metadata,
+    Column("day", Date, primary_key=True),
+    Column("file_type", String, primary_key=True),
+    Column("uploads", Integer),
+)
+
+
+# Функция для пересчета представлений (выполняется в отдельном потоке со своей сессией)
+# Время пересчета записывается в той же транзакции, что и новые данные представлений
+def refresh_stats():
+    start_time = datetime.now()
+    db = SessionLocal()
+    try:
+        for view in STATS_VIEWS:
+            db.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view}"))
+        db.query(StatsRefresh).update({StatsRefresh.refreshed_at: func.now()}, synchronize_session=False)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    logging.info("Статистика сдачи работ пересчитана за %s секунд", (datetime.now() - start_time).total_seconds())
+
+
+# Фоновая задача периодического пересчета статистики
+async def run_stats_refresh(interval):
+    while True:
+        try:
+            await asyncio.to_thread(refresh_stats)
+        except Exception as e:
+            logging.error("Ошибка при пересчете статистики сдачи работ: %s", e)
+        await asyncio.sleep(interval)
+
+
+# Функция для формирования отчета по статистике сдачи работ
+def build_stats_report():
+    students = user_submission_stats.c
+    totals = session.query(
+        func.count().label("students"),
+        func.coalesce(func.sum(students.essays), 0).label("essays"),
+        func.coalesce(func.sum(students.presentations), 0).label("presentations"),
+        func.count().filter(students.essays > 0).label("with_essay"),
+        func.count().filter(students.presentations > 0).label("with_presentation"),
+        func.count().filter(students.similarity_flags > 0).label("flagged_students"),
+        func.coalesce(func.sum(students.similarity_flags), 0).label("similarity_flags"),
+    ).select_from(user_submission_stats).filter(students.is_admin == False).one()
+
+    daily = session.query(
+        daily_upload_stats.c.day,
+        daily_upload_stats.c.file_type,
+        daily_upload_stats.c.uploads,
+    ).filter(
+        daily_upload_stats.c.day > date.today() - timedelta(days=DAILY_DAYS)
+    ).order_by(daily_upload_stats.c.day.desc(), daily_upload_stats.c.file_type).all()
+
+    rows = session.query(user_submission_stats).filter(
+        students.is_admin == False
+    ).order_by(students.full_name).all()
+
+    refreshed_at = session.query(StatsRefresh.refreshed_at).scalar()
+    refreshed = refreshed_at.strftime("%Y-%m-%d %H:%M:%S") if refreshed_at else "—"
+    lines = [
+        f"📊 Статистика сдачи работ (обновлено: {refreshed})",
+        "",
+        f"Студентов: {totals.students}",
+        f"Эссе: {totals.essays} (сдали {totals.with_essay} из {totals.students})",
+        f"Презентаций: {totals.presentations} (сдали {totals.with_presentation} из {totals.students})",
+        f"Совпадений при проверке схожести: {totals.similarity_flags // 2}, студентов с совпадениями: {totals.flagged_students}",
+    ]
+
+    lines += ["", f"Загрузки за последние {DAILY_DAYS} дней:"]
+    if daily:
+        for row in daily:
+            lines.append(f"{row.day.strftime('%Y-%m-%d')} — {FILE_TYPE_NAMES.get(row.file_type, row.file_type)}: {row.uploads}")
+    else:
+        lines.append("нет загрузок")
+
+    missing = [row for row in rows if not row.essays or not row.presentations]
+    lines += ["", f"Не сдали работы ({len(missing)}):"]
+    for row in missing:
+        absent = [name for name, count in (("эссе", row.essays), ("презентация", row.presentations)) if not count]
+        lines.append(f"- {row.full_name}: нет {', '.join(absent)}")
+    if not missing:
+        lines.append("все студенты сдали обе работы")
+
+    lines += ["", "По студентам (эссе / презентации / совпадения):"]
+    for row in rows:
+        last_upload = row.last_upload_at.strftime("%Y-%m-%d") if row.last_upload_at else "—"
+        lines.append(
+            f"- {row.full_name}: {row.essays} / {row.presentations} / {row.similarity_flags}, последняя загрузка: {last_upload}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,137 @@
+import asyncio
+import hashlib
+import logging
+import os
+
+import yadisk
+
+from reconcile import DiskIndex
+from throttling import TokenBucket
+
+# Имя аккаунта, на котором хранятся файлы, загруженные до появления нескольких аккаунтов
+DEFAULT_SHARD = "default"
+DEFAULT_ROOT = "/PKS12_SocialStudy"
+
+
+# Аккаунт Яндекс.Диска (шард): клиент, корневая папка, ограничение частоты запросов и занятое место
+class StorageShard:
+    def __init__(self, name, token, root, rate, burst, index_max_age):
+        self.name = name
+        self.root = root.rstrip("/") or "/"
+        self.client = yadisk.YaDisk(token=token)
+        self.bucket = TokenBucket(rate, burst)
+        self.index = DiskIndex(max_age=index_max_age)
+        self.total_space = None
+        self.used_space = None
+
+    def user_folder(self, user):
+        return f"{self.root}/{user.full_name}"
+
+    @property
+    def exports_dir(self):
+        return f"{self.root}/_exports"
+
+    # Вызов метода клиента в отдельном потоке с учетом ограничения частоты запросов аккаунта
+    async def call(self, method, *args, **kwargs):
+        await self.bucket.wait()
+        return await asyncio.to_thread(getattr(self.client, method), *args, **kwargs)
+
+    # Проверка существования пути: сначала по локальному индексу, затем через API
+    async def exists(self, path):
+        exists = self.index.exists(path)
+        if exists is None:
+            exists = await self.call("exists", path)
+        return exists
+
+    async def refresh_quota(self):
+        info = await self.call("get_disk_info")
+        self.total_space = info.total_space
+        self.used_space = info.used_space
+
+    def free_space(self):
+        if self.total_space is None:
+            return None
+        return self.total_space - self.used_space
+
+    # Учет загруженного файла до следующего обновления данных о квоте
+    def add_used(self, size):
+        if self.used_space is not None and size:
+            self.used_space += size
+
+
+class StorageConfigError(Exception):
+    pass
+
+
+# Маршрутизатор хранилища: распределяет пользователей по аккаунтам стабильным хешем
+# Используется хеширование с наибольшим весом (rendezvous): при добавлении аккаунта
+# переезжает только часть новых пользователей, а уже загруженные файлы остаются на своем шарде
+class StorageRouter:
+    def __init__(self, shards, quota_reserve):
+        self.shards = {shard.name: shard for shard in shards}
+        self.quota_reserve = quota_reserve
+
+    # YADISK_TOKENS: "имя:токен[:корневая папка]" через запятую; без него — один аккаунт YADISK_TOKEN
+    @classmethod
+    def from_env(cls, index_max_age):
+        rate = float(os.getenv("YADISK_RATE_PER_SECOND", "10"))
+        burst = int(os.getenv("YADISK_BURST", "10"))
+        shards = []
+        for entry in (os.getenv("YADISK_TOKENS") or "").split(","):
+            entry = entry.strip()
+            if not entry:
+                continue
+            name, _, rest = entry.partition(":")
+            token, _, root = rest.partition(":")
+            shards.append(StorageShard(name.strip(), token.strip(), root.strip() or DEFAULT_ROOT, rate, burst, index_max_age))
+        if not shards:
+            shards.append(StorageShard(DEFAULT_SHARD, os.getenv("YADISK_TOKEN"), DEFAULT_ROOT, rate, burst, index_max_age))
+        return cls(shards, quota_reserve=int(os.getenv("YADISK_QUOTA_RESERVE", str(100 * 1024 * 1024))))
+
+    # Проверка при запуске, что настроены все аккаунты, на которых по данным БД хранятся файлы.
+    # Файлы, загруженные до появления нескольких аккаунтов, записаны на аккаунт default —
+    # при заданном YADISK_TOKENS он должен быть среди аккаунтов ("default:<токен прежнего аккаунта>")
+    def check_configured(self, shard_names):
+        unknown = sorted(set(shard_names) - set(self.shards))
+        if unknown:
+            raise StorageConfigError(
+                f"В БД есть файлы на аккаунтах Яндекс.Диска, которые не настроены в YADISK_TOKENS: {', '.join(unknown)}"
+            )
+
+    def get(self, name):
+        shard = self.shards.get(name or DEFAULT_SHARD)
+        if shard is None:
+            raise KeyError(f"Аккаунт Яндекс.Диска {name} не настроен")
+        return shard
+
+    # Аккаунт для служебных файлов (архивы выгрузки)
+    @property
+    def primary(self):
+        return self.shards.get(DEFAULT_SHARD) or next(iter(self.shards.values()))
+
+    def _weight(self, shard_name, key):
+        return hashlib.blake2b(f"{shard_name}:{key}".encode("utf-8"), digest_size=8).digest()
+
+    # Хватит ли места на аккаунте с учетом резерва (пока квота неизвестна, считаем, что хватит)
+    def has_room(self, shard, size=0):
+        free = shard.free_space()
+        return free is None or free - (size or 0) > self.quota_reserve
+
+    # Аккаунт для пользователя: первый по весу, на котором хватает места
+    def shard_for(self, key, size=0):
+        ranked = sorted(self.shards.values(), key=lambda shard: self._weight(shard.name, key), reverse=True)
+        for shard in ranked:
+            if self.has_room(shard, size):
+                return shard
+        logging.warning("На всех аккаунтах Яндекс.Диска заканчивается место, используется %s", ranked[0].name)
+        return ranked[0]
+
+    # Фоновое обновление данных о занятом месте на всех аккаунтах
+    async def run_quota_refresh(self, interval):
+        while True:
+            for shard in self.shards.values():
+                try:
+                    await shard.refresh_quota()
+                except Exception as e:
+                    logging.warning("Не удалось получить данные о месте на аккаунте %s: %s", shard.name, e)
+            await asyncio.sleep(interval)
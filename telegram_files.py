@@ -0,0 +1,63 @@
+import contextlib
+import hashlib
+
+from chunking import ChunkFingerprinter
+
+# Размер блока при чтении файла: md5 и отпечаток считаются по блокам, файл целиком в память не читается
+READ_BLOCK_SIZE = 1024 * 1024
+
+# Файл считается двоичным, если в начале есть нулевой байт (та же проверка, что в git)
+BINARY_CHECK_SIZE = 8000
+
+
+# Путь к файлу на общем томе локального сервера Bot API или None, если файл нужно скачивать по HTTP
+def local_file_path(bot, file_path):
+    api = bot.session.api
+    if not api.is_local:
+        return None
+    return str(api.wrap_local_file.to_local(file_path))
+
+
+# Функция для получения файла из Telegram: локальный сервер Bot API уже сохранил файл на общем томе —
+# тогда файл не копируется и возвращается путь к нему; иначе файл скачивается во временное хранилище
+# spool под ключом spool_key и возвращается None
+async def fetch_file(bot, file_id, spool, spool_key, size=None):
+    file = await bot.get_file(file_id)
+    local_path = local_file_path(bot, file.file_path)
+    if local_path is None:
+        spool_file = spool.create(spool_key, size=size)
+        await bot.download_file(file.file_path, spool_file)
+    return local_path
+
+
+# file — путь к файлу или уже открытый двоичный файл (например, из временного хранилища)
+@contextlib.contextmanager
+def _open(file):
+    if isinstance(file, str):
+        with open(file, "rb") as opened:
+            yield opened
+    else:
+        yield file
+
+
+# Функция для подсчета md5, размера и отпечатка по фрагментам за один проход (выполняется в отдельном потоке)
+# Возвращает (md5, размер, хеши фрагментов)
+def scan_file(file):
+    md5 = hashlib.md5()
+    fingerprinter = ChunkFingerprinter()
+    size = 0
+    with _open(file) as opened:
+        for block in iter(lambda: opened.read(READ_BLOCK_SIZE), b""):
+            md5.update(block)
+            fingerprinter.update(block)
+            size += len(block)
+    return md5.hexdigest(), size, fingerprinter.digest()
+
+
+# Функция для чтения текстового файла целиком; для двоичных файлов возвращает None
+def read_text_file(file):
+    with _open(file) as opened:
+        data = opened.read()
+    if b"\x00" in data[:BINARY_CHECK_SIZE]:
+        return None
+    return data
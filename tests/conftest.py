@@ -0,0 +1,95 @@
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# Заглушка сервера Bot API: getMe описывает бота, getFile возвращает путь к файлу, /file/... отдает содержимое,
+# getUpdates отдает неподтвержденные обновления из updates и запоминает параметры запросов.
+# В режиме local путь абсолютный, в рабочей директории сервера, как у telegram-bot-api --local
+class StubBotAPIServer:
+    def __init__(self, server_dir):
+        self.server_dir = server_dir
+        self.files = {}
+        self.local = False
+        self.url = None
+        self.downloads = 0
+        self.updates = []
+        self.update_requests = []
+
+    def add_file(self, file_id, data):
+        self.files[file_id] = data
+
+    def file_path(self, file_id):
+        relative = f"documents/{file_id}.bin"
+        return f"{self.server_dir}/{relative}" if self.local else relative
+
+    async def get_file(self, request):
+        data = await request.post()
+        file_id = data["file_id"]
+        if file_id not in self.files:
+            return web.json_response({"ok": False, "error_code": 400, "description": "Bad Request: invalid file_id"})
+        return web.json_response({"ok": True, "result": {
+            "file_id": file_id,
+            "file_unique_id": file_id,
+            "file_size": len(self.files[file_id]),
+            "file_path": self.file_path(file_id),
+        }})
+
+    async def get_me(self, request):
+        return web.json_response({"ok": True, "result": {"id": 123, "is_bot": True, "first_name": "Stub", "username": "stub_bot"}})
+
+    async def get_updates(self, request):
+        data = await request.post()
+        offset = int(data["offset"]) if "offset" in data else None
+        self.update_requests.append(dict(data))
+        if offset is not None:
+            self.updates = [update for update in self.updates if update["update_id"] >= offset]
+        if not self.updates:
+            await asyncio.sleep(min(float(data.get("timeout", 0)), 0.2))
+        limit = int(data.get("limit", 100))
+        return web.json_response({"ok": True, "result": self.updates[:limit]})
+
+    async def download(self, request):
+        file_id = request.match_info["name"].rsplit(".", 1)[0]
+        self.downloads += 1
+        return web.Response(body=self.files[file_id])
+
+
+# Сервер работает в отдельном потоке со своим циклом событий, тесты обращаются к нему по HTTP
+@pytest.fixture
+def bot_api_server():
+    server = StubBotAPIServer("/var/lib/telegram-bot-api/123")
+    app = web.Application()
+    app.router.add_post("/bot{token}/getMe", server.get_me)
+    app.router.add_post("/bot{token}/getFile", server.get_file)
+    app.router.add_post("/bot{token}/getUpdates", server.get_updates)
+    app.router.add_get("/file/bot{token}/documents/{name}", server.download)
+
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app, access_log=None)
+    started = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        loop.run_until_complete(site.start())
+        host, port = runner.addresses[0][:2]
+        server.url = f"http://{host}:{port}"
+        started.set()
+        loop.run_forever()
+        loop.run_until_complete(runner.cleanup())
+        loop.close()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    started.wait(10)
+    yield server
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(10)
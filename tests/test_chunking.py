@@ -0,0 +1,31 @@
+import os
+
+from chunking import ChunkFingerprinter, chunk_boundaries, chunk_fingerprints, MAX_SIZE, MIN_SIZE
+
+
+# Отпечаток не зависит от того, какими блоками подаются данные
+def test_fingerprint_independent_of_block_size():
+    data = os.urandom(300 * 1024) + bytes(100 * 1024) + os.urandom(300 * 1024)
+    expected = chunk_fingerprints(data)
+    for block_size in (1000, 4096, 65536, len(data)):
+        fingerprinter = ChunkFingerprinter()
+        for start in range(0, len(data), block_size):
+            fingerprinter.update(data[start:start + block_size])
+        assert fingerprinter.digest() == expected
+
+
+def test_chunk_sizes():
+    data = os.urandom(1024 * 1024)
+    boundaries = chunk_boundaries(data)
+    assert boundaries[-1] == len(data)
+    sizes = [end - start for start, end in zip([0] + boundaries, boundaries)]
+    assert all(MIN_SIZE <= size <= MAX_SIZE for size in sizes[:-1])
+
+
+# Изменение начала файла меняет только первые фрагменты
+def test_fingerprint_survives_prefix_change():
+    data = os.urandom(512 * 1024)
+    changed = os.urandom(1000) + data[1000:]
+    original = set(chunk_fingerprints(data))
+    shared = original & set(chunk_fingerprints(changed))
+    assert len(shared) >= len(original) - 2
@@ -0,0 +1,36 @@
+import asyncio
+
+from collector import DocumentCollector
+
+
+# Документы, пришедшие во время обработки группы, образуют новую группу,
+# которая обрабатывается после завершения предыдущей
+def test_late_documents_start_new_group():
+    flushed = []
+    events = []
+
+    async def run():
+        release = asyncio.Event()
+
+        async def on_flush(key, items):
+            flushed.append(list(items))
+            events.append(("start", tuple(items)))
+            if len(flushed) == 1:
+                await release.wait()
+            events.append(("end", tuple(items)))
+
+        collector = DocumentCollector(delay=0.01, on_flush=on_flush)
+        collector.add("user", "a")
+        collector.add("user", "b")
+        await asyncio.sleep(0.05)
+        collector.add("user", "c")
+        late_task = collector.tasks["user"]
+        await asyncio.sleep(0.05)
+        assert flushed == [["a", "b"]]
+        release.set()
+        await late_task
+        assert collector.flushing == {}
+
+    asyncio.run(asyncio.wait_for(run(), 5))
+    assert flushed == [["a", "b"], ["c"]]
+    assert events == [("start", ("a", "b")), ("end", ("a", "b")), ("start", ("c",)), ("end", ("c",))]
@@ -0,0 +1,84 @@
+import asyncio
+import hashlib
+import os
+from pathlib import Path
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer, SimpleFilesPathWrapper
+
+from chunking import chunk_fingerprints
+from spool import SpoolManager
+from telegram_files import fetch_file, scan_file, read_text_file
+
+TOKEN = "123:stub"
+
+
+def create_bot(server, local_dir=None):
+    api = TelegramAPIServer.from_base(
+        server.url,
+        is_local=local_dir is not None,
+        wrap_local_file=SimpleFilesPathWrapper(Path(server.server_dir), Path(local_dir or server.server_dir))
+    )
+    return Bot(token=TOKEN, session=AiohttpSession(api=api))
+
+
+def create_spool(tmp_path):
+    return SpoolManager(directory=str(tmp_path / "spool"), memory_limit=1024, quota=64 * 1024 * 1024, default_ttl=60)
+
+
+def sample_data(size):
+    data = bytearray(os.urandom(size))
+    data[size // 2:size // 2 + 10] = b"\x00" * 10
+    return bytes(data)
+
+
+# Локальный сервер Bot API: файл читается с общего тома, HTTP-скачивания и временного файла нет
+def test_fetch_file_local(bot_api_server, tmp_path):
+    data = sample_data(3 * 1024 * 1024 + 17)
+    bot_api_server.local = True
+    bot_api_server.add_file("doc", data)
+    (tmp_path / "documents").mkdir()
+    (tmp_path / "documents" / "doc.bin").write_bytes(data)
+    spool = create_spool(tmp_path)
+
+    async def run():
+        bot = create_bot(bot_api_server, local_dir=tmp_path)
+        try:
+            return await fetch_file(bot, "doc", spool, "1:doc", size=len(data))
+        finally:
+            await bot.session.close()
+
+    local_path = asyncio.run(run())
+    assert local_path == str(tmp_path / "documents" / "doc.bin")
+    assert bot_api_server.downloads == 0
+    assert spool.get("1:doc") is None
+    assert scan_file(local_path) == (hashlib.md5(data).hexdigest(), len(data), chunk_fingerprints(data))
+
+
+# api.telegram.org или сервер без --local: файл скачивается во временное хранилище
+def test_fetch_file_download(bot_api_server, tmp_path):
+    data = sample_data(2 * 1024 * 1024 + 5)
+    bot_api_server.add_file("doc", data)
+    spool = create_spool(tmp_path)
+
+    async def run():
+        bot = create_bot(bot_api_server)
+        try:
+            return await fetch_file(bot, "doc", spool, "1:doc", size=len(data))
+        finally:
+            await bot.session.close()
+
+    assert asyncio.run(run()) is None
+    assert bot_api_server.downloads == 1
+    assert scan_file(spool.get("1:doc")) == (hashlib.md5(data).hexdigest(), len(data), chunk_fingerprints(data))
+    spool.release("1:doc")
+
+
+def test_read_text_file_skips_binary(tmp_path):
+    text_path = tmp_path / "essay.txt"
+    text_path.write_bytes("Текст эссе".encode("utf-8"))
+    binary_path = tmp_path / "essay.docx"
+    binary_path.write_bytes(b"PK\x03\x04\x14\x00\x00\x00")
+    assert read_text_file(str(text_path)) == "Текст эссе".encode("utf-8")
+    assert read_text_file(str(binary_path)) is None
@@ -0,0 +1,55 @@
+import asyncio
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from workers import UpdateOffsetMiddleware, confirm_updates, partition_for_user
+
+
+def message_update(update_id, user_id):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Test"},
+            "text": "hello",
+        },
+    }
+
+
+# После остановки long polling последняя пачка обновлений подтверждается и не приходит повторно
+def test_polling_updates_confirmed_on_shutdown(bot_api_server):
+    bot_api_server.updates = [message_update(10, 1), message_update(11, 2)]
+    handled = []
+
+    async def run():
+        bot = Bot(token="123:stub", session=AiohttpSession(api=TelegramAPIServer.from_base(bot_api_server.url)))
+        dp = Dispatcher()
+        offsets = UpdateOffsetMiddleware()
+        dp.update.outer_middleware(offsets)
+
+        @dp.message()
+        async def handle(message):
+            handled.append(message.message_id)
+            if len(handled) == 2:
+                await dp.stop_polling()
+
+        try:
+            await dp.start_polling(bot, polling_timeout=1, close_bot_session=False, handle_signals=False)
+        finally:
+            await confirm_updates(bot, offsets.offset)
+            await bot.session.close()
+
+    asyncio.run(asyncio.wait_for(run(), 10))
+    assert sorted(handled) == [10, 11]
+    # Последний запрос — подтверждение, а не очередной запрос long polling
+    assert bot_api_server.update_requests[-1] == {"offset": "12", "limit": "1", "timeout": "0"}
+    assert bot_api_server.updates == []
+
+
+def test_partition_for_user():
+    assert {partition_for_user(user_id, 4) for user_id in range(100)} == {0, 1, 2, 3}
+    assert partition_for_user(42, 4) == partition_for_user(42, 4)
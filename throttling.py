@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message
+
+
+# Корзина токенов: rate токенов в секунду, не более capacity одновременно
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    # Попытка взять токен без ожидания
+    def consume(self, tokens=1):
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    # Через сколько секунд появится нужное число токенов
+    def time_until(self, tokens=1):
+        self._refill()
+        if self.tokens >= tokens:
+            return 0.0
+        return (tokens - self.tokens) / self.rate
+
+    # Ожидание токена
+    async def wait(self, tokens=1):
+        while not self.consume(tokens):
+            await asyncio.sleep(self.time_until(tokens))
+
+    def is_full(self):
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+# Middleware, ограничивающее частоту отправки файлов одним пользователем
+class UploadThrottlingMiddleware(BaseMiddleware):
+    def __init__(self, rate_per_minute, burst):
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.buckets = {}
+        # Альбом расходует один токен на всю группу, а не на каждый файл: решение по первому файлу
+        # (пропустить или отклонить) применяется ко всем файлам группы
+        self.media_groups = {}
+
+    async def __call__(self, handler, event, data):
+        if not isinstance(event, Message) or not event.document:
+            return await handler(event, data)
+
+        user_id = event.from_user.id
+        now = time.monotonic()
+        if event.media_group_id:
+            group = self.media_groups.get(event.media_group_id)
+            if group and group[0] > now:
+                # Об отклонении альбома пользователь уже получил сообщение
+                return await handler(event, data) if group[1] else None
+
+        bucket = self.buckets.get(user_id)
+        if bucket is None:
+            # Полные корзины ничего не ограничивают — удаляем их, чтобы словарь не рос бесконечно
+            if len(self.buckets) > 10000:
+                self.buckets = {key: value for key, value in self.buckets.items() if not value.is_full()}
+            bucket = self.buckets[user_id] = TokenBucket(self.rate, self.burst)
+
+        allowed = bucket.consume()
+        if event.media_group_id:
+            if len(self.media_groups) > 10000:
+                self.media_groups = {key: group for key, group in self.media_groups.items() if group[0] > now}
+            self.media_groups[event.media_group_id] = (now + 60, allowed)
+
+        if not allowed:
+            wait_seconds = int(bucket.time_until()) + 1
+            logging.info("Пользователь %s превысил лимит загрузок, файл отклонен", user_id)
+            await event.answer(f"Вы отправляете файлы слишком часто. Попробуйте снова через {wait_seconds} сек.")
+            return None
+
+        return await handler(event, data)
+
+
+# Глобальный планировщик передачи файлов (Telegram и Яндекс.Диск)
+# Ограничивает число одновременных передач и их частоту, очередь обслуживается
+# по кругу между пользователями, чтобы один пользователь не занимал все слоты
+class FairScheduler:
+    def __init__(self, max_concurrent, rate, burst):
+        self.max_concurrent = max_concurrent
+        self.bucket = TokenBucket(rate, burst)
+        self.active = 0
+        self.queues = {}
+        self.order = deque()
+
+    # Позиция ожидающего в очереди с учетом обслуживания по кругу
+    def _position(self, user_id, future):
+        queue = self.queues.get(user_id)
+        if not queue or future not in queue:
+            return 0
+        index = queue.index(future)
+        position = index
+        before = True
+        for other_id in self.order:
+            if other_id == user_id:
+                before = False
+                continue
+            position += min(len(self.queues[other_id]), index + (1 if before else 0))
+        return position + 1
+
+    def _wake_next(self):
+        while self.active < self.max_concurrent and self.order:
+            user_id = self.order.popleft()
+            queue = self.queues[user_id]
+            future = queue.popleft()
+            if queue:
+                self.order.append(user_id)
+            else:
+                del self.queues[user_id]
+            if future.done():
+                continue
+            self.active += 1
+            future.set_result(None)
+
+    async def acquire(self, user_id, on_queued=None):
+        if self.active < self.max_concurrent and not self.order:
+            self.active += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            if user_id not in self.queues:
+                self.queues[user_id] = deque()
+                self.order.append(user_id)
+            self.queues[user_id].append(future)
+
+            if on_queued:
+                try:
+                    await on_queued(self._position(user_id, future))
+                except Exception as e:
+                    logging.warning("Не удалось сообщить пользователю %s позицию в очереди: %s", user_id, e)
+
+            try:
+                await future
+            except asyncio.CancelledError:
+                # Если слот уже был выдан, возвращаем его следующему в очереди
+                if future.done() and not future.cancelled():
+                    self.release()
+                raise
+
+        try:
+            await self.bucket.wait()
+        except asyncio.CancelledError:
+            self.release()
+            raise
+
+    def release(self):
+        self.active -= 1
+        self._wake_next()
+
+    @asynccontextmanager
+    async def slot(self, user_id, on_queued=None):
+        await self.acquire(user_id, on_queued)
+        try:
+            yield
+        finally:
+            self.release()
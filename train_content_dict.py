@@ -0,0 +1,65 @@
+import os
+import sys
+import time
+
+import zstandard
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import content_codec
+from database import SessionLocal, UploadedFile, CompressionDictionary, load_compression_dictionaries
+
+# Обучение словаря zstd на сохраненных эссе и перекодирование содержимого всех файлов с этим словарем.
+# Словарь сохраняется в БД, поэтому доступен всем копиям бота; прежние словари остаются,
+# чтобы значения, сжатые ими, можно было прочитать.
+# Запуск: python train_content_dict.py [размер словаря в байтах]
+
+DICT_SIZE = int(sys.argv[1]) if len(sys.argv) > 1 else 112 * 1024
+# Сколько эссе используется для обучения и сколько записей перекодируется за один шаг
+MAX_SAMPLES = 5000
+BATCH_SIZE = 500
+
+
+def main():
+    db = SessionLocal()
+    try:
+        load_compression_dictionaries(db)
+        texts = db.query(UploadedFile.file_content).filter(
+            UploadedFile.file_type == "essay",
+            UploadedFile.file_content.isnot(None)
+        ).order_by(UploadedFile.id.desc()).limit(MAX_SAMPLES).all()
+        samples = [row.file_content.encode("utf-8") for row in texts if len(row.file_content) >= content_codec.MIN_COMPRESS_SIZE]
+        if len(samples) < 10:
+            print(f"Недостаточно эссе для обучения словаря: {len(samples)}")
+            sys.exit(1)
+
+        start_time = time.monotonic()
+        dictionary = zstandard.train_dictionary(DICT_SIZE, samples, level=content_codec.ZSTD_LEVEL)
+        print(f"Словарь {dictionary.dict_id()} обучен на {len(samples)} эссе за {time.monotonic() - start_time:.1f} с")
+
+        db.add(CompressionDictionary(id=dictionary.dict_id(), data=dictionary.as_bytes()))
+        db.commit()
+        content_codec.register_dictionary(dictionary.as_bytes(), current=True)
+
+        # Перекодирование: значения читаются прежними словарями и сжимаются новым
+        last_id = 0
+        count = 0
+        while True:
+            files = db.query(UploadedFile.id, UploadedFile.file_content).filter(
+                UploadedFile.id > last_id,
+                UploadedFile.file_content.isnot(None)
+            ).order_by(UploadedFile.id).limit(BATCH_SIZE).all()
+            if not files:
+                break
+            db.bulk_update_mappings(UploadedFile, [{"id": file.id, "file_content": file.file_content} for file in files])
+            db.commit()
+            last_id = files[-1].id
+            count += len(files)
+        print(f"Перекодировано записей: {count}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import multiprocessing
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+from aiogram.types.update import UpdateTypeLookupError
+
+
+# Номер процесса-обработчика для пользователя
+def partition_for_user(user_id, workers):
+    return user_id % workers
+
+
+# Номер процесса-обработчика для обновления: все обновления одного пользователя попадают в один процесс,
+# поэтому шаги диалога (файл → тип работы → замена) обрабатываются по порядку, а состояние FSM,
+# блокировки и ограничения частоты в памяти процесса остаются согласованными
+def partition_for(update, workers):
+    try:
+        event = update.event
+    except UpdateTypeLookupError:
+        return 0
+    user = getattr(event, "from_user", None)
+    if user:
+        return partition_for_user(user.id, workers)
+    chat = getattr(event, "chat", None)
+    if chat:
+        return partition_for_user(chat.id, workers)
+    return 0
+
+
+# Процессы-обработчики обновлений: у каждого своя очередь, в которую супервизор передает обновления
+# в виде словарей; target(index, workers, queue) — точка входа процесса
+class WorkerPool:
+    def __init__(self, workers, target):
+        self.context = multiprocessing.get_context("spawn")
+        self.workers = workers
+        self.target = target
+        self.queues = [self.context.Queue() for _ in range(workers)]
+        self.processes = [None] * workers
+        self.stopping = False
+
+    def _spawn(self, index):
+        process = self.context.Process(
+            target=self.target,
+            args=(index, self.workers, self.queues[index]),
+            name=f"bot-worker-{index}"
+        )
+        process.start()
+        self.processes[index] = process
+        logging.info("Запущен процесс-обработчик %s (pid %s)", index, process.pid)
+
+    def start(self):
+        for index in range(self.workers):
+            self._spawn(index)
+
+    def alive(self):
+        return all(process is not None and process.is_alive() for process in self.processes)
+
+    def dispatch(self, update, data=None):
+        index = partition_for(update, self.workers)
+        self.queues[index].put(data if data is not None else update.model_dump(mode="json", exclude_unset=True))
+
+    # Перезапуск завершившихся процессов: обновления, оставшиеся в очереди процесса, не теряются
+    async def run_monitor(self, interval=1.0):
+        while not self.stopping:
+            await asyncio.sleep(interval)
+            for index, process in enumerate(self.processes):
+                if not self.stopping and not process.is_alive():
+                    logging.error("Процесс-обработчик %s завершился с кодом %s, перезапуск", index, process.exitcode)
+                    self._spawn(index)
+
+    # Остановка: каждый процесс обрабатывает оставшиеся в очереди обновления, дожидается загрузок и выходит;
+    # процессы, не завершившиеся за timeout секунд, останавливаются принудительно
+    async def stop(self, timeout):
+        self.stopping = True
+        for queue in self.queues:
+            queue.put(None)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        for index, process in enumerate(self.processes):
+            await asyncio.to_thread(process.join, max(deadline - loop.time(), 0))
+            if process.is_alive():
+                logging.warning("Процесс-обработчик %s не завершился вовремя и будет остановлен", index)
+                process.terminate()
+                await asyncio.to_thread(process.join, 5)
+        for queue in self.queues:
+            queue.close()
+
+
+# Получение обновлений long polling одним процессом и распределение их по обработчикам
+class PollingIntake:
+    def __init__(self, bot, pool, allowed_updates, timeout=10):
+        self.bot = bot
+        self.pool = pool
+        self.allowed_updates = allowed_updates
+        self.timeout = timeout
+        self.offset = None
+
+    async def run(self):
+        while True:
+            try:
+                updates = await self.bot.get_updates(
+                    offset=self.offset, timeout=self.timeout, allowed_updates=self.allowed_updates
+                )
+            except Exception as e:
+                logging.error("Ошибка при получении обновлений: %s", e)
+                await asyncio.sleep(5)
+                continue
+            for update in updates:
+                self.pool.dispatch(update)
+                self.offset = update.update_id + 1
+
+    async def confirm(self):
+        await confirm_updates(self.bot, self.offset)
+
+
+# Подтверждение полученных обновлений при остановке, чтобы Telegram не прислал их повторно после перезапуска:
+# обновления с номером меньше offset отмечаются полученными. Обновления, полученные этим запросом,
+# не подтверждаются и придут снова
+async def confirm_updates(bot, offset):
+    if offset is None:
+        return
+    try:
+        await bot.get_updates(offset=offset, limit=1, timeout=0)
+    except Exception as e:
+        logging.warning("Не удалось подтвердить полученные обновления: %s", e)
+
+
+# Номер, с которого начинаются еще не полученные обновления, при long polling в одном процессе:
+# aiogram подтверждает обновления только следующим запросом getUpdates, и последняя пачка перед остановкой
+# осталась бы неподтвержденной
+class UpdateOffsetMiddleware(BaseMiddleware):
+    def __init__(self):
+        self.offset = None
+
+    async def __call__(self, handler, event, data):
+        self.offset = max(self.offset or 0, event.update_id + 1)
+        return await handler(event, data)
+
+
+# Функция для запуска HTTP-сервера, принимающего обновления от Telegram (webhook)
+async def start_webhook_server(bot, pool, host, port, path, secret=None):
+    async def handle(request):
+        if secret and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret:
+            return web.Response(status=401)
+        data = await request.json()
+        pool.dispatch(Update.model_validate(data, context={"bot": bot}), data)
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(path, handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logging.info("Сервер обновлений (webhook) запущен на %s:%s%s", host, port, path)
+    return runner
+
+
+# Обработка обновлений из очереди супервизора в процессе-обработчике; каждое обновление
+# обрабатывается в отдельной задаче, как при long polling. Завершается при получении None
+async def feed_updates(dp, bot, queue):
+    tasks = set()
+
+    async def handle(data):
+        try:
+            await dp.feed_raw_update(bot, data)
+        except Exception as e:
+            logging.exception("Ошибка при обработке обновления %s: %s", data.get("update_id"), e)
+
+    while True:
+        data = await asyncio.to_thread(queue.get)
+        if data is None:
+            break
+        task = asyncio.create_task(handle(data))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    # Уже созданные задачи успевают зарегистрироваться в lifecycle до начала остановки
+    await asyncio.sleep(0)